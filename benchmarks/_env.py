@@ -0,0 +1,7 @@
+"""Environment defaults for the benchmarks; import before anything from src."""
+import os
+
+# src.config needs these to import; the benchmark never talks to Gemini or signs tokens
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-only-secret-key-0123456789")
+os.environ.setdefault("LLM_API_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
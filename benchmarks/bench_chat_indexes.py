@@ -0,0 +1,147 @@
+"""
+Query-time benchmark for the chat_sessions / chat_messages access paths.
+
+Fills a database with --messages chat messages (1M by default) spread over --sessions sessions
+and --users users, then times the two hot queries with and without the composite indexes:
+
+  * chat history: messages of one session ordered by (created_at, id)
+  * GET /sessions: a user's sessions with message counts, newest first
+
+Usage:
+    python -m benchmarks.bench_chat_indexes
+    python -m benchmarks.bench_chat_indexes --messages 2000000 --database-url postgresql://...
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks import _env  # noqa: F401  (environment defaults, before src is imported)
+from sqlalchemy import create_engine, func, select, text
+from src.models.migrations import run_migrations
+from src.models.users import User, ChatSession, ChatMessage
+
+
+BATCH = 50_000
+
+
+def populate(engine, users: int, sessions: int, messages: int) -> tuple[list, list]:
+    start = datetime(2025, 1, 1)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": uid, "email": f"{uid}@bench", "username": "bench", "hashed_password": "x", "is_verified": True}
+            for uid in user_ids
+        ])
+        conn.execute(ChatSession.__table__.insert(), [
+            {"id": sid, "user_id": user_ids[i % users], "title": "bench", "summarized_count": 0,
+             "created_at": start, "updated_at": start + timedelta(seconds=i)}
+            for i, sid in enumerate(session_ids)
+        ])
+    for offset in range(0, messages, BATCH):
+        rows = [
+            {"id": str(uuid.uuid4()), "session_id": session_ids[i % sessions],
+             "role": "user" if i % 2 == 0 else "assistant", "content": "weather in Berlin?",
+             "created_at": start + timedelta(seconds=i)}
+            for i in range(offset, min(offset + BATCH, messages))
+        ]
+        with engine.begin() as conn:
+            conn.execute(ChatMessage.__table__.insert(), rows)
+        print(f"  inserted {offset + len(rows):,} messages", end="\r", flush=True)
+    print()
+    return user_ids, session_ids
+
+
+def history_query(session_id: str):
+    return (select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.created_at, ChatMessage.id)
+            .limit(100))
+
+
+def sessions_query(user_id: str):
+    return (select(ChatSession.id, ChatSession.updated_at, func.count(ChatMessage.id))
+            .outerjoin(ChatMessage, ChatMessage.session_id == ChatSession.id)
+            .where(ChatSession.user_id == user_id)
+            .group_by(ChatSession.id)
+            .order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+            .limit(50))
+
+
+def time_query(engine, build, keys: list) -> dict:
+    timings = []
+    with engine.connect() as conn:
+        for key in keys:
+            started = time.perf_counter()
+            conn.execute(build(key)).all()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+    }
+
+
+def set_indexes(engine, enabled: bool) -> None:
+    with engine.begin() as conn:
+        for model in (ChatSession, ChatMessage):
+            for index in model.__table__.indexes:
+                if enabled:
+                    index.create(bind=conn, checkfirst=True)
+                else:
+                    index.drop(bind=conn, checkfirst=True)
+        if engine.dialect.name == "sqlite":
+            conn.execute(text("ANALYZE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--samples", type=int, default=20, help="queries timed per scenario")
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    path = None
+    url = args.database_url
+    if url is None:
+        handle, path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    try:
+        run_migrations(engine)
+        set_indexes(engine, False)  # bulk load first, index afterwards
+        print(f"Populating {args.messages:,} messages / {args.sessions:,} sessions / {args.users:,} users")
+        user_ids, session_ids = populate(engine, args.users, args.sessions, args.messages)
+
+        sample_sessions = random.sample(session_ids, min(args.samples, len(session_ids)))
+        sample_users = random.sample(user_ids, min(args.samples, len(user_ids)))
+        results = {}
+        for label, enabled in (("without indexes", False), ("with indexes", True)):
+            set_indexes(engine, enabled)
+            results[label] = {
+                "chat history": time_query(engine, history_query, sample_sessions),
+                "GET /sessions": time_query(engine, sessions_query, sample_users),
+            }
+
+        print(f"\n{'query':<16}{'indexes':<18}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for query in ("chat history", "GET /sessions"):
+            for label, stats in results.items():
+                row = stats[query]
+                print(f"{query:<16}{label:<18}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}")
+    finally:
+        engine.dispose()
+        if path:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark for the forecast aggregation in build_forecast.
+
+Compares the single-pass daily aggregation (local days, mean/low/high, dominant condition,
+precipitation, wind) with the simpler loop it replaced, on synthetic OWM forecast payloads of
+--entries 3-hourly entries. 40 is what the 5-day endpoint returns; larger sizes only show how the
+two scale. A NumPy version was tried and dropped: at 40 entries it was no faster than the previous
+loop (and slower in some runs), so it bought nothing at the size the API returns.
+
+Usage:
+    python -m benchmarks.bench_forecast
+    python -m benchmarks.bench_forecast --entries 40 400 4000 --repeat 2000
+"""
+import argparse
+import random
+import timeit
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks import _env  # noqa: F401  (environment defaults, before src is imported)
+from src.services.weather_service import build_forecast
+
+
+CONDITIONS = ["clear sky", "few clouds", "scattered clouds", "light rain", "moderate rain", "snow"]
+
+
+def build_forecast_loop(raw: dict, units: str) -> list[str]:
+    """The previous implementation: server-local days, mean temperature and the middle description"""
+    daily = defaultdict(list)
+    for entry in raw["list"]:
+        dt = datetime.fromtimestamp(entry["dt"])
+        date_key = dt.strftime("%Y-%m-%d")
+        temp = entry["main"]["temp"]
+        desc = entry["weather"][0]["description"]
+        daily[date_key].append((temp, desc, dt))
+    weather_forecast = []
+    for i, (date_key, items) in enumerate(sorted(daily.items())):
+        if i >= 5:
+            break
+        avg_temp = round(sum(t for t, _, _ in items) / len(items))
+        _, main_desc, dt = items[len(items) // 2]  # midday description
+        day_label = dt.strftime("%A %Y-%m-%d")
+        weather_forecast.append(f"{day_label}: {main_desc}, {avg_temp}°{units}\n")
+    return weather_forecast
+
+
+def payload(entries: int) -> dict:
+    start = 1762689600
+    return {"city": {"timezone": 3600}, "list": [
+        {"dt": start + i * 10800, "main": {"temp": random.uniform(-5, 30)}, "pop": random.random(),
+         "wind": {"speed": random.uniform(0, 15)}, "weather": [{"description": random.choice(CONDITIONS)}]}
+        for i in range(entries)
+    ]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[40, 400, 4000])
+    parser.add_argument("--repeat", type=int, default=1000, help="calls timed per implementation")
+    args = parser.parse_args()
+
+    print(f"{'entries':>8}{'previous us':>14}{'current us':>13}{'ratio':>8}")
+    for entries in args.entries:
+        raw = payload(entries)
+        loop = timeit.timeit(lambda: build_forecast_loop(raw, "C"), number=args.repeat) / args.repeat * 1e6
+        current = timeit.timeit(lambda: build_forecast(raw, "C"), number=args.repeat) / args.repeat * 1e6
+        print(f"{entries:>8}{loop:>14.1f}{current:>13.1f}{loop / current:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
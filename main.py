@@ -3,7 +3,7 @@ from src.app import app  # import app from app.py
 import logging
 
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:[trace=%(trace_id)s span=%(span_id)s] %(message)s")
 logger = logging.getLogger(__name__)
 
 
@@ -1,14 +1,51 @@
-
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from .config import config
+from .config import config, async_engine, engine
 from fastapi import FastAPI, status
+from .services.http_client import open_http_client, close_http_client
+from .services.persistence import message_writer
+from .services.hashing import hashing_pool
+from .services.email_services import email_delivery
+from .services.tile_cache import set_tile_store
+from .services.metrics import MetricsMiddleware, instrument_engine
+from .services.tracing import TracingMiddleware, configure_tracing, install_log_trace_ids, tracer
+from .models.migrations import run_migrations
 
 from .routers.auth import router as auth_router
 from .routers.chat import router as chat_router
 from .routers.root import router as root_router
+from .routers.weather import router as weather_router
+from .routers.tiles import router as tiles_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.DB_AUTO_MIGRATE:
+        run_migrations()
+    configure_tracing()
+    await open_http_client()
+    email_delivery.start()
+    if config.CHAT_WRITE_BEHIND:
+        await message_writer.start()
+    yield
+    await message_writer.stop()
+    await close_http_client()
+    hashing_pool.shutdown()
+    await asyncio.to_thread(email_delivery.stop)
+    set_tile_store(None)
+    await async_engine.dispose()
+    await asyncio.to_thread(tracer.shutdown)
+
 
+app = FastAPI(title="Weather Chatbot", version="1.0.0", lifespan=lifespan)
 
-app = FastAPI(title="Weather Chatbot", version="1.0.0")
+install_log_trace_ids()
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+app.add_middleware(MetricsMiddleware)
+# Added last so it runs first: the request span covers the metrics middleware and the route
+app.add_middleware(TracingMiddleware)
 
 
 app.add_middleware(
@@ -22,4 +59,6 @@ app.add_middleware(
 
 app.include_router(root_router, tags=["Root"])
 app.include_router(auth_router, tags=["authentication"])
-app.include_router(chat_router, tags=["chat"])
\ No newline at end of file
+app.include_router(chat_router, tags=["chat"])
+app.include_router(weather_router, tags=["weather"])
+app.include_router(tiles_router, tags=["tiles"])
\ No newline at end of file
@@ -4,6 +4,7 @@ from sqlalchemy.orm import sessionmaker
 from passlib.context import CryptContext
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from fastapi.security import HTTPBearer
 from google import genai
 
@@ -23,13 +24,84 @@ class Config:
         self.TERRAIN = os.getenv("TERRAIN")
         self.ALLOW_ORIGINS = os.getenv("ALLOW_ORIGINS")
         self.JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+        # Bearer token for /metrics and /cache/stats; unset, both answer 404
+        self.OPS_TOKEN = os.getenv("OPS_TOKEN", "")
         self.DATABASE_URL = os.getenv("DATABASE_URL")
+        self.DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() == "true"
+        self.DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+        self.DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+        self.DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+        self.DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+        self.CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+        self.CHAT_WRITE_BEHIND_BATCH = int(os.getenv("CHAT_WRITE_BEHIND_BATCH", "500"))
+        self.CHAT_WRITE_BEHIND_INTERVAL = float(os.getenv("CHAT_WRITE_BEHIND_INTERVAL", "0.05"))
+        self.CHAT_WRITE_BEHIND_MAX_PENDING = int(os.getenv("CHAT_WRITE_BEHIND_MAX_PENDING", "10000"))
+        self.CHAT_WRITE_BEHIND_MAX_RETRIES = int(os.getenv("CHAT_WRITE_BEHIND_MAX_RETRIES", "8"))
         self.SMTP_SERVER = os.getenv("SMTP_SERVER")
         self.SMTP_PORT = os.getenv("SMTP_PORT")
         self.SMTP_USERNAME = os.getenv("SMTP_USERNAME")
         self.SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
         self.MAILEROO_API_KEY = os.getenv("MAILEROO_API_KEY")
         self.MAILEROO_FROM_EMAIL = os.getenv("MAILEROO_FROM_EMAIL")
+        self.SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+        self.SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))
+        self.EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", "10"))
+        self.EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+        self.EMAIL_BATCH_WAIT = float(os.getenv("EMAIL_BATCH_WAIT", "0.2"))
+        self.EMAIL_MAX_RETRIES = int(os.getenv("EMAIL_MAX_RETRIES", "5"))
+        self.EMAIL_RETRY_BACKOFF = float(os.getenv("EMAIL_RETRY_BACKOFF", "2"))
+        self.CHAT_FAST_PATH = os.getenv("CHAT_FAST_PATH", "true").lower() == "true"
+        # Tools whose results are turned into the answer locally instead of by a second Gemini call
+        self.LLM_LOCAL_RENDER_TOOLS = [name.strip() for name in os.getenv(
+            "LLM_LOCAL_RENDER_TOOLS", "get_forcast,geocode,get_map_tile_url"
+        ).split(",") if name.strip()]
+        self.LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() == "true"
+        self.LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+        self.LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+        self.LLM_MAX_TOOL_ITERATIONS = int(os.getenv("LLM_MAX_TOOL_ITERATIONS", "3"))
+        self.CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "6"))
+        self.CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.CONTEXT_SUMMARY_BATCH = int(os.getenv("CONTEXT_SUMMARY_BATCH", "4"))  # messages folded at once
+        self.CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "400"))
+        self.MESSAGE_STREAM_BATCH = int(os.getenv("MESSAGE_STREAM_BATCH", "500"))
+        self.HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "20"))
+        self.HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+        self.HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        self.AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+        self.AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "60"))
+        self.GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "4096"))
+        self.GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(60 * 60 * 24 * 7)))
+        self.GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", str(60 * 60)))
+        self.GEOCODE_CACHE_PERSIST = os.getenv("GEOCODE_CACHE_PERSIST", "false").lower() == "true"
+        self.OBSERVATION_CACHE_SIZE = int(os.getenv("OBSERVATION_CACHE_SIZE", "2048"))
+        self.OBSERVATION_PRECISION = int(os.getenv("OBSERVATION_PRECISION", "2"))  # decimals of lat/lon in the key
+        self.OWM_CURRENT_TTL = int(os.getenv("OWM_CURRENT_TTL", "600"))
+        self.OWM_FORECAST_TTL = int(os.getenv("OWM_FORECAST_TTL", "1800"))
+        self.OWM_AIR_TTL = int(os.getenv("OWM_AIR_TTL", "1800"))
+        self.TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(".cache", "tiles"))
+        self.TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+        self.TILE_CACHE_TTL = int(os.getenv("TILE_CACHE_TTL", str(60 * 60 * 24 * 7)))
+        self.TILE_BROWSER_MAX_AGE = int(os.getenv("TILE_BROWSER_MAX_AGE", str(60 * 60 * 24)))
+        self.TILE_MMAP_HOT = int(os.getenv("TILE_MMAP_HOT", "256"))  # tiles kept memory-mapped
+        self.TILE_USER_AGENT = os.getenv("TILE_USER_AGENT", "weather-chatbot-backend tile proxy")
+        self.TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+        self.TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "1.0"))
+        self.TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+        self.TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "weather-chatbot")
+        self.OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318")
+        # Upstream hosts trusted with our trace ids; everyone else gets a client span but no traceparent
+        self.TRACING_PROPAGATE_HOSTS = [host.strip().lower() for host in os.getenv(
+            "TRACING_PROPAGATE_HOSTS", ""
+        ).split(",") if host.strip()]
+        self.WEATHER_BATCH_MAX_LOCATIONS = int(os.getenv("WEATHER_BATCH_MAX_LOCATIONS", "1000"))
+        self.WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "20"))
+        self.ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+        self.ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+        self.ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+        self.PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+        self.PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))  # waiting jobs before 503
 
 config = Config()
 
@@ -44,17 +116,49 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Hashes made with other argon2 parameters still verify and are upgraded on the next login
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=config.ARGON2_TIME_COST,
+    argon2__memory_cost=config.ARGON2_MEMORY_COST,
+    argon2__parallelism=config.ARGON2_PARALLELISM,
+)
 security = HTTPBearer()
 
 
 # Database Setup
 DATABASE_URL = config.DATABASE_URL
+
+
+def pool_options(url: str) -> dict:
+    options = {"pool_pre_ping": config.DB_POOL_PRE_PING, "pool_recycle": config.DB_POOL_RECYCLE}
+    if not url.startswith("sqlite"):
+        options.update(pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW,
+                       pool_timeout=config.DB_POOL_TIMEOUT)
+    return options
+
+
+def async_database_url(url: str) -> str:
+    """Map DATABASE_URL onto its async driver: aiosqlite for SQLite, asyncpg for PostgreSQL"""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+")[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, **pool_options(DATABASE_URL))
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine used by the routes, so DB latency does not block the event loop
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **pool_options(DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Email Configuration
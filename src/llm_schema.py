@@ -1,8 +1,16 @@
-from typing import List, Any, cast
+from typing import List, Any, AsyncIterator, cast
 from google.genai import types
-from .config import client
+from .config import client, config
+import asyncio
 import logging
-from .services import weather_service as service
+import time
+from contextlib import contextmanager
+from .services import weather_service_async as async_service
+from .services.response_cache import response_cache
+from .services.metrics import GEMINI_ERRORS, GEMINI_REQUEST, TOOL_CALLS
+from .services.tracing import span
+from .services.tool_results import for_llm
+from .services.renderers import render_tool_results
 
 
 # Function declarations for Gemini
@@ -100,6 +108,15 @@ get_map_tile_url_function = {
                 "type": "string",
                 "description": "The location name (city or country)",
             },
+            "zoom": {
+                "type": "integer",
+                "description": "Map zoom level from 0 (world) to 19 (street), 10 by default",
+            },
+            "map_type": {
+                "type": "string",
+                "description": "Map style",
+                "enum": ["standard", "satellite", "terrain"],
+            },
         },
         "required": ["location"],
     },
@@ -116,116 +133,319 @@ tools = types.Tool(function_declarations=cast(List[Any], [
     ]))
 
 
-def llm_extract(history: list) -> dict:
+SYSTEM_INSTRUCTION = (
+    "You are a friendly weather assistant. "
+    "Critical formatting rules (must follow exactly):"
+    "1. When providing current weather, write it in a natural paragraph."
+    "3. Always put the follow-up question on a NEW LINE with a blank line before it (use \\n\\n)."
+    "4. When you give the map tile uel make sure do not put any thing in the end of the url like (.)"
+    "5. When providing 5-day forecast:"
+    "   - Start with an intro line"
+    "   - Put EACH day on its OWN LINE starting with a bullet point (•)"
+    "   - Format: • [Day/Date]: [temperature], [condition]"
+    "   - Example:"
+    "     • Monday, Oct 28: 18°C, Sunny"
+    "     • Tuesday, Oct 29: 16°C, Rainy"
+    "When you provide the air quality, include the AQI index and a brief explanation of what it means."
+    "CONVERSATION FLOW:"
+    "- After current weather → ask about forecast"
+    "- After forecast → ask about air quality"
+    "- After air quality → ask about location coordinates"
+    "- After location coordinates → ask about map tile"
+    "- If user declines → politely end"
+    "Be conversational and helpful."
+)
+
+MODEL = "gemini-2.5-flash"
+
+
+def build_contents(history: list) -> list:
+    """Convert the stored chat history into Gemini contents"""
+    contents = []
+    for msg in history:
+        role = "user" if msg["role"] == "user" else "model"
+        contents.append(types.Content(
+            role=role,
+            parts=[types.Part(text=msg["content"])]
+        ))
+    return contents
+
+
+def generation_config() -> types.GenerateContentConfig:
+    # Configure the generation with tools
+    return types.GenerateContentConfig(
+        tools=[tools],
+        system_instruction=SYSTEM_INSTRUCTION,
+        temperature=0.7,
+    )
+
+
+def function_response_part(function_name: str, result) -> types.Part:
+    return types.Part(
+        function_response=types.FunctionResponse(
+            name=function_name,
+            response={"result": result}
+        )
+    )
+
+
+def _reply(text: str) -> dict:
+    return {
+        "response": text,
+        "history_update": [
+            {"role": "assistant", "content": text}
+        ],
+    }
+
+
+async def llm_extract_async(history: list) -> dict:
     """
-    Extract information and call appropriate weather function using Gemini
+    Extract information and call the appropriate weather functions using Gemini. Uses the genai
+    async client and the async weather service, so the event loop keeps serving other
+    conversations while waiting on Gemini and OWM.
+    Every function call in a response is executed (concurrently), and the model may ask for
+    follow-up calls up to config.LLM_MAX_TOOL_ITERATIONS times per turn. When every call of the
+    first round is in LLM_LOCAL_RENDER_TOOLS the answer is rendered locally instead of by a
+    second Gemini call.
     """
 
     try:
-        system_instruction = (
-            "You are a friendly weather assistant. "
-            "Critical formatting rules (must follow exactly):"
-            "1. When providing current weather, write it in a natural paragraph."
-            "3. Always put the follow-up question on a NEW LINE with a blank line before it (use \\n\\n)."
-            "4. When you give the map tile uel make sure do not put any thing in the end of the url like (.)"
-            "5. When providing 5-day forecast:"
-            "   - Start with an intro line"
-            "   - Put EACH day on its OWN LINE starting with a bullet point (•)"
-            "   - Format: • [Day/Date]: [temperature], [condition]"
-            "   - Example:"
-            "     • Monday, Oct 28: 18°C, Sunny"
-            "     • Tuesday, Oct 29: 16°C, Rainy"
-            "When you provide the air quality, include the AQI index and a brief explanation of what it means."
-            "CONVERSATION FLOW:"
-            "- After current weather → ask about forecast"
-            "- After forecast → ask about air quality"
-            "- After air quality → ask about location coordinates"
-            "- After location coordinates → ask about map tile"
-            "- If user declines → politely end"
-            "Be conversational and helpful."
-        )
+        contents = build_contents(history)
+        config_gen = generation_config()
+        rounds = []  # (name, args, result) of every tool call so far, part of the cache key
 
-        contents = []
-        for msg in history:
-            role = "user" if msg["role"] == "user" else "model"
-            contents.append(types.Content(
-                role=role,
-                parts=[types.Part(text=msg["content"])]
-            ))
-
-        # Configure the generation with tools
-        config_gen = types.GenerateContentConfig(
-            tools=[tools],
-            system_instruction=system_instruction,
-            temperature=0.7,
-        )
+        response = await generate(contents, config_gen, history, rounds)
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
+        iteration = 0
+        while function_calls(response):
+            iteration += 1
+            calls = function_calls(response)
+            results = await run_tools(calls)
+            rendered = render_locally(calls, results) if iteration == 1 else None
+            if rendered is not None:
+                return _reply(rendered)
+            contents.append(response.candidates[0].content)
+            contents.append(tool_response(calls, results))
+            rounds += [(call.name, dict(call.args or {}), result) for call, result in zip(calls, results)]
+
+            response = await generate(
+                contents,
+                config_gen if iteration < config.LLM_MAX_TOOL_ITERATIONS else answer_only_config(),
+                history,
+                rounds,
+            )
+
+        if iteration == 0:
+            logging.info(f"No function call detected ")
+        return _reply(response_text(response))
+
+    except Exception as e:
+        logging.info(f"Error in llm_extract_async: {str(e)}")
+        logging.info(f"Error type: {type(e)}")
+        return _reply(f"An error occurred: {e}")
+
+
+@contextmanager
+def gemini_call(call: str, rounds: list | int = 0):
+    """Record the latency (and failure) of one Gemini call, as a metric and a trace span"""
+    started = time.perf_counter()
+    round_label = "after_tools" if rounds else "first"
+    try:
+        with span(f"gemini.{call}", kind="client", **{"gemini.model": MODEL, "gemini.round": round_label}):
+            yield
+    except Exception:
+        GEMINI_ERRORS.labels(call).inc()
+        raise
+    finally:
+        GEMINI_REQUEST.labels(call, round_label).observe(time.perf_counter() - started)
+
+
+async def generate(contents: list, config_gen: types.GenerateContentConfig, history: list, rounds: list):
+    """
+    generate_content through the shared response cache. The key covers the context window and the
+    tool calls and results so far, so a cached answer is only reused for the same weather data.
+    """
+    key = response_cache.key(history, rounds)
+    response = response_cache.get(key)
+    if response is not None:
+        logging.info(f"Gemini response served from cache after {len(rounds)} tool calls")
+        return response
+
+    started = time.perf_counter()
+    with gemini_call("extract", rounds):
+        response = await client.aio.models.generate_content(
+            model=MODEL,
             contents=contents,
             config=config_gen,
         )
+    if _parts(response):
+        response_cache.set(key, response, time.perf_counter() - started, response_cache.ttl_for(rounds))
+    return response
 
-        if response.candidates[0].content.parts[0].function_call:
-            function_call = response.candidates[0].content.parts[0].function_call
-            function_name = function_call.name
-
-            required_args = dict(function_call.args)
-
-            # Call the actual function from services
-            func = getattr(service, function_name)
-            result = func(**required_args)
-            logging.info(f"Function {function_name} called with args {required_args}")
-
-            # Send function response back to get natural language answer
-            function_response_content = types.Content(
-                role="model",
-                parts=[types.Part(
-                    function_response=types.FunctionResponse(
-                        name=function_name,
-                        response={"result": result}
-                    )
-                )]
-            )
 
-            # Add function response to contents
-            contents.append(response.candidates[0].content)
-            contents.append(function_response_content)
+def answer_only_config() -> types.GenerateContentConfig:
+    """Generation config for the last round of a turn: tools stay declared but may not be called"""
+    return types.GenerateContentConfig(
+        tools=[tools],
+        system_instruction=SYSTEM_INSTRUCTION,
+        temperature=0.7,
+        tool_config=types.ToolConfig(
+            function_calling_config=types.FunctionCallingConfig(mode="NONE")
+        ),
+    )
 
-            final_response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=contents,
-                config=config_gen,
-            )
 
-            final_text = final_response.text
+def _parts(response) -> list:
+    if not response.candidates or not response.candidates[0].content:
+        return []
+    return response.candidates[0].content.parts or []
 
-            return {
-                "response": final_text,
-                "history_update": [
-                    {"role": "assistant", "content": final_text}
-                ],
-            }
-        else:
-            logging.info(f"No function call detected ")
-            response_text = response.text if response.text else "Could you please rephrase your question?"
-            return {
-                "response": response_text,
-                "history_update": [
-                    {"role": "assistant", "content": response_text}
-                ],
-            }
 
+def function_calls(response) -> list:
+    """All function-call parts of a response, in the order the model asked for them"""
+    return [part.function_call for part in _parts(response) if part.function_call]
+
+
+def response_text(response) -> str:
+    text = "".join(part.text for part in _parts(response) if part.text)
+    return text or "Could you please rephrase your question?"
+
+
+async def execute_tool(function_call):
+    """Run one tool from the async weather service; failures become an {"error": ...} result"""
+    function_name = function_call.name
+    required_args = dict(function_call.args or {})
+    try:
+        with span(f"tool.{function_name}", **{f"tool.args.{key}": value for key, value in required_args.items()}):
+            func = getattr(async_service, function_name)
+            result = await func(**required_args)
+        TOOL_CALLS.labels(function_name, "ok").inc()
+        logging.info(f"Function {function_name} called with args {required_args}")
     except Exception as e:
-        logging.info(f"Error in llm_extract: {str(e)}")
-        logging.info(f"Error type: {type(e)}")
-        error_msg = f"An error occurred: {e}"
-        return {
-            "response": error_msg,
-            "history_update": [
-                {"role": "assistant", "content": error_msg}
-            ],
-        }
+        TOOL_CALLS.labels(function_name, "error").inc()
+        logging.warning(f"Function {function_name} failed with args {required_args}: {str(e)}")
+        result = {"error": getattr(e, "detail", None) or str(e)}
+    return result
+
+
+async def run_tools(calls: list) -> list:
+    """Execute independent tool calls concurrently; results are in call order"""
+    return list(await asyncio.gather(*(execute_tool(call) for call in calls)))
+
+
+def tool_response(calls: list, results: list) -> types.Content:
+    """Wrap tool results (or errors) for Gemini, in their compact form where a tool declares one"""
+    return types.Content(role="user", parts=[
+        function_response_part(call.name, for_llm(call.name, result)) for call, result in zip(calls, results)
+    ])
+
+
+def render_locally(calls: list, results: list) -> str | None:
+    """The answer for a round of tool results without the second Gemini call, when every tool allows it"""
+    rendered = render_tool_results(calls, results)
+    if rendered is not None:
+        logging.info(f"Rendered {', '.join(call.name for call in calls)} locally, skipping the second Gemini call")
+    return rendered
+
 
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and a weather assistant. "
+    "Merge the new messages into the existing summary. Keep locations, preferred units, "
+    "answers already given and anything the user asked to remember. Be brief and factual."
+)
+
+
+async def summarize_async(summary: str | None, messages: list) -> str:
+    """Fold messages into an existing rolling summary (incremental, never from scratch)"""
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    prompt = (
+        f"Existing summary:\n{summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Updated summary:"
+    )
+    with gemini_call("summary"):
+        response = await client.aio.models.generate_content(
+            model=MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                system_instruction=SUMMARY_INSTRUCTION,
+                temperature=0.2,
+                max_output_tokens=config.CONTEXT_SUMMARY_MAX_TOKENS,
+            ),
+        )
+    return (response.text or "").strip()
+
+
+TOOL_PROGRESS = {
+    "get_weather": "Looking up the current weather for {location}…",
+    "get_forcast": "Looking up the 5-day forecast for {location}…",
+    "get_air_quality": "Checking the air quality in {location}…",
+    "geocode": "Looking up {location}…",
+    "get_map_tile_url": "Finding a map of {location}…",
+}
+
+
+def tool_progress_message(function_name: str, args: dict) -> str:
+    template = TOOL_PROGRESS.get(function_name, "Looking up {location}…")
+    return template.format(location=args.get("location", "your location"))
+
+
+PARAGRAPH_BREAK = "\n\n"
+
+
+async def llm_stream(history: list) -> AsyncIterator[dict]:
+    """
+    Streaming variant of llm_extract_async. Yields events as they happen:
+    {"event": "tool", "data": {...}} before each tool call, {"event": "token", "data": {"text": ...}}
+    for every chunk of the answer, and a final {"event": "done", "data": {"response": full_text}}.
+    """
+    contents = build_contents(history)
+    config_gen = generation_config()
+    chunks = []
+
+    iteration = 0
+    while True:
+        call_parts = []
+        round_start = len(chunks)
+        with gemini_call("stream", iteration):
+            stream = await client.aio.models.generate_content_stream(
+                model=MODEL,
+                contents=contents,
+                config=config_gen if iteration < config.LLM_MAX_TOOL_ITERATIONS else answer_only_config(),
+            )
+            async for chunk in stream:
+                for part in _parts(chunk):
+                    if part.function_call:
+                        call_parts.append(part)
+                    elif part.text:
+                        if chunks and len(chunks) == round_start:
+                            # Text of an earlier tool round ("Let me check…") ends its own paragraph
+                            chunks.append(PARAGRAPH_BREAK)
+                            yield {"event": "token", "data": {"text": PARAGRAPH_BREAK}}
+                        chunks.append(part.text)
+                        yield {"event": "token", "data": {"text": part.text}}
 
+        if not call_parts:
+            break
+        iteration += 1
+        for part in call_parts:
+            required_args = dict(part.function_call.args or {})
+            yield {"event": "tool", "data": {
+                "name": part.function_call.name,
+                "args": required_args,
+                "message": tool_progress_message(part.function_call.name, required_args),
+            }}
+        calls = [part.function_call for part in call_parts]
+        results = await run_tools(calls)
+        rendered = render_locally(calls, results) if iteration == 1 else None
+        if rendered is not None:
+            if chunks:
+                rendered = PARAGRAPH_BREAK + rendered
+            chunks.append(rendered)
+            yield {"event": "token", "data": {"text": rendered}}
+            break
+        contents.append(types.Content(role="model", parts=call_parts))
+        contents.append(tool_response(calls, results))
 
+    final_text = "".join(chunks) or "Could you please rephrase your question?"
+    yield {"event": "done", "data": {"response": final_text}}
@@ -0,0 +1,177 @@
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, inspect,
+                        select, text)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from ..config import engine as default_engine
+from .users import ChatMessage, ChatSession
+
+
+# Versioned schema migrations. Each migration runs once per database, in order, inside a
+# transaction, and records its version in schema_migrations. They are written to be safe on
+# databases created before versioning existed (the previous import-time create_all), so they
+# check what already exists instead of assuming an empty schema.
+
+_version_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _indexes(conn: Connection, table: str) -> set:
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+# The schema as it stood when versioning was introduced, frozen here: later model changes must come
+# with a new migration, never show up in migration 1
+_v1_metadata = MetaData()
+Table(
+    "users", _v1_metadata,
+    Column("id", String, primary_key=True),
+    Column("email", String, unique=True, index=True, nullable=False),
+    Column("username", String, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("is_verified", Boolean, nullable=False),
+    Column("verification_token", String, nullable=True),
+    Column("verification_token_expires", DateTime, nullable=True),
+    Column("created_at", DateTime),
+    Column("last_login", DateTime, nullable=True),
+)
+Table(
+    "chat_sessions", _v1_metadata,
+    Column("id", String, primary_key=True),
+    Column("user_id", String, ForeignKey("users.id"), nullable=False),
+    Column("title", String),
+    Column("created_at", DateTime),
+    Column("updated_at", DateTime),
+)
+Table(
+    "chat_messages", _v1_metadata,
+    Column("id", String, primary_key=True),
+    Column("session_id", String, ForeignKey("chat_sessions.id"), nullable=False),
+    Column("role", String, nullable=False),
+    Column("content", Text, nullable=False),
+    Column("created_at", DateTime),
+)
+Table(
+    "geocode_cache", _v1_metadata,
+    Column("key", String, primary_key=True),
+    Column("payload", Text, nullable=True),
+    Column("expires_at", DateTime, nullable=False, index=True),
+)
+
+
+def _create_tables(conn: Connection) -> None:
+    _v1_metadata.create_all(bind=conn)
+
+
+def _add_session_summary(conn: Connection) -> None:
+    existing = _columns(conn, "chat_sessions")
+    if "summary" not in existing:
+        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN summary TEXT"))
+    if "summarized_count" not in existing:
+        conn.execute(text("ALTER TABLE chat_sessions ADD COLUMN summarized_count INTEGER NOT NULL DEFAULT 0"))
+
+
+def _add_chat_indexes(conn: Connection) -> None:
+    # On PostgreSQL the indexes are built CONCURRENTLY so existing tables stay writable.
+    # A copy of each table is used so the models' own Index objects keep their options.
+    concurrently = conn.dialect.name == "postgresql"
+    for model in (ChatSession, ChatMessage):
+        existing = _indexes(conn, model.__tablename__)
+        for index in model.__table__.to_metadata(MetaData()).indexes:
+            if index.name not in existing:
+                if concurrently:
+                    index.dialect_kwargs["postgresql_concurrently"] = True
+                index.create(bind=conn)
+
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "chat session rolling summary", _add_session_summary),
+    (3, "chat session and message access-path indexes", _add_chat_indexes),
+]
+
+# Migrations that run on an autocommit connection on PostgreSQL, where
+# CREATE INDEX CONCURRENTLY is not allowed inside a transaction block
+OUTSIDE_TRANSACTION = {3}
+
+
+# Key of the PostgreSQL advisory lock held while migrating
+MIGRATION_LOCK_KEY = 7_234_501
+
+
+def current_version(bind: Engine = default_engine) -> int:
+    try:
+        _version_metadata.create_all(bind=bind)
+    except (OperationalError, ProgrammingError):
+        # Another worker created the table between the existence check and CREATE TABLE
+        if not inspect(bind).has_table("schema_migrations"):
+            raise
+    with bind.connect() as conn:
+        versions = conn.execute(select(schema_migrations.c.version)).scalars().all()
+    return max(versions, default=0)
+
+
+def _record(conn: Connection, number: int, name: str) -> None:
+    conn.execute(schema_migrations.insert().values(version=number, name=name, applied_at=datetime.utcnow()))
+
+
+@contextmanager
+def _migration_lock(bind: Engine):
+    """
+    On PostgreSQL, hold an advisory lock so that of several workers starting at once only one
+    migrates and the others wait, then find nothing left to do. Other databases rely on the
+    version row: it is inserted before the migration runs, in the same transaction, so a second
+    worker blocks on it and then fails with a duplicate key (see run_migrations).
+    """
+    if bind.dialect.name != "postgresql":
+        yield
+        return
+    with bind.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def run_migrations(bind: Engine = default_engine) -> int:
+    """Apply every migration newer than the database's version; returns the resulting version"""
+    with _migration_lock(bind):
+        version = current_version(bind)
+        for number, name, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            if number in OUTSIDE_TRANSACTION and bind.dialect.name == "postgresql":
+                with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    migrate(conn)
+                with bind.begin() as conn:
+                    _record(conn, number, name)
+            else:
+                try:
+                    with bind.begin() as conn:
+                        _record(conn, number, name)
+                        migrate(conn)
+                except IntegrityError:
+                    logging.info(f"Migration {number} was applied by another process")
+                    version = number
+                    continue
+            logging.info(f"Applied migration {number}: {name}")
+            version = number
+    return version
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Database schema at version {run_migrations()}")
@@ -1,5 +1,6 @@
 from typing import Optional, Literal
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from ..config import config
 
 
 # Pydantic Models
@@ -22,6 +23,16 @@ class Token(BaseModel):
     is_verified: bool
 
 
+class CurrentUser(BaseModel):
+    """Lightweight snapshot of the authenticated user, safe to cache across requests"""
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    id: str
+    email: str
+    username: str
+    is_verified: bool
+
+
 class ChatResponse(BaseModel):
     session_id: str
     response: str
@@ -42,6 +53,32 @@ class HealthOut(BaseModel):
     uptime_seconds: float | None = None
 
 
+class BatchLocation(BaseModel):
+    """A place name, or a lat/lon pair that skips geocoding"""
+    location: str | None = Field(None, min_length=1, max_length=200)
+    lat: float | None = Field(None, ge=-90, le=90)
+    lon: float | None = Field(None, ge=-180, le=180)
+
+    @model_validator(mode="after")
+    def location_or_coordinates(self):
+        if self.location is None and (self.lat is None or self.lon is None):
+            raise ValueError("give either a location or both lat and lon")
+        return self
+
+
+class WeatherBatchIn(BaseModel):
+    locations: list[str | BatchLocation] = Field(..., min_length=1, max_length=config.WEATHER_BATCH_MAX_LOCATIONS)
+    units: Literal["C", "F"] = "C"
+
+
+class AirQualityDigest(BaseModel):
+    """What the model needs from an OWM air pollution payload, instead of the raw JSON"""
+    aqi: int | None = None
+    category: str = "Unknown"
+    dominant_pollutant: str | None = None
+    concentrations: dict[str, float] = {}  # μg/m³
+
+
 class Extracted(BaseModel):
     location: str
     when: str
@@ -1,8 +1,7 @@
 import uuid
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Boolean
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Boolean, Integer, Index
 from datetime import datetime
-from ..config import engine
 from ..config import Base
 
 
@@ -26,12 +25,18 @@ class User(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # GET /sessions: filter by user, newest first, keyset on (updated_at, id)
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     title = Column(String, default="New Conversation")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    summary = Column(Text, nullable=True)  # rolling summary of the messages folded out of the context
+    summarized_count = Column(Integer, default=0, nullable=False)  # how many of the oldest messages it covers
 
     user = relationship("User", back_populates="chat_sessions")
     messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan")
@@ -39,6 +44,10 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Chat history and GET /sessions/{id}: filter by session, ordered by (created_at, id)
+        Index("ix_chat_messages_session_created", "session_id", "created_at", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=False)
@@ -48,5 +57,10 @@ class ChatMessage(Base):
 
     session = relationship("ChatSession", back_populates="messages")
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+
+class GeocodeEntry(Base):
+    __tablename__ = "geocode_cache"
+
+    key = Column(String, primary_key=True)  # normalized location string
+    payload = Column(Text, nullable=True)  # JSON geocode item, NULL for "Location not found"
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -1,14 +1,15 @@
 from fastapi import APIRouter
 import uuid
 import logging
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Depends, BackgroundTasks
 from ..services.email_services import send_verification_email
-from ..services.helper import (get_db, create_verification_token, hash_password,\
-    create_access_token, decode_access_token, get_current_user)
-from ..models.schemas import Token, UserRegister, EmailVerificationRequest, UserLogin
+from ..services.helper import (get_async_db, create_verification_token, hash_password_async,\
+    verify_and_update_password_async, create_access_token, decode_access_token, get_current_user, invalidate_user)
+from ..models.schemas import Token, UserRegister, EmailVerificationRequest, UserLogin, CurrentUser
 from ..models.users import User
 
 
@@ -20,9 +21,9 @@ VERIFICATION_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 @router.post("/register", response_model=Token)
 async def register(user_data: UserRegister,
                    background_tasks: BackgroundTasks,
-                   db: Session = Depends(get_db)):
+                   db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
-    if db.query(User).filter(User.email == user_data.email).first():
+    if await db.scalar(select(User).where(User.email == user_data.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create verification token
@@ -34,15 +35,14 @@ async def register(user_data: UserRegister,
         id = temp_user_id,
         email=user_data.email,
         username=user_data.username,
-        hashed_password=hash_password(user_data.password),
+        hashed_password=await hash_password_async(user_data.password),
         is_verified=False,
         verification_token=verification_token,
         verification_token_expires=datetime.utcnow() + timedelta(minutes=VERIFICATION_TOKEN_EXPIRE_MINUTES)
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     logging.info(f"added {new_user.username}'s information to the database")
 
     background_tasks.add_task(
@@ -69,7 +69,7 @@ async def register(user_data: UserRegister,
 @router.post("/verify-email")
 async def verify_email(
         verification_data: EmailVerificationRequest,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Verify user's email address"""
     try:
@@ -81,7 +81,7 @@ async def verify_email(
             raise HTTPException(status_code=400, detail="Invalid token type")
 
         # Find user
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -92,7 +92,8 @@ async def verify_email(
         user.is_verified = True
         user.verification_token = None
         user.verification_token_expires = None
-        db.commit()
+        await db.commit()
+        invalidate_user(user.id)
 
         logging.info(f"Email verified for user: {user.username}")
 
@@ -108,19 +109,23 @@ async def verify_email(
 
 @router.post("/resend-verification")
 async def resend_verification(
-        current_user: User = Depends(get_current_user),
+        current_user: CurrentUser = Depends(get_current_user),
         background_tasks: BackgroundTasks = None,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Resend verification email"""
     if current_user.is_verified:
         raise HTTPException(status_code=400, detail="Email already verified")
 
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
     # Create new token
-    verification_token = create_verification_token(current_user.id)
-    current_user.verification_token = verification_token
-    current_user.verification_token_expires = datetime.utcnow() + timedelta(minutes=VERIFICATION_TOKEN_EXPIRE_MINUTES)
-    db.commit()
+    verification_token = create_verification_token(user.id)
+    user.verification_token = verification_token
+    user.verification_token_expires = datetime.utcnow() + timedelta(minutes=VERIFICATION_TOKEN_EXPIRE_MINUTES)
+    await db.commit()
 
     # Send email
     if background_tasks:
@@ -135,19 +140,27 @@ async def resend_verification(
 
 
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user"""
-    user = db.query(User).filter(User.email == user_data.email).first()
-    print(user)
+    user = await db.scalar(select(User).where(User.email == user_data.email))
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
 
-    if not User.is_verified:
+    valid, new_hash = await verify_and_update_password_async(user_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Incorrect username or password")
+    if new_hash:
+        # argon2 parameters changed since this hash was made
+        user.hashed_password = new_hash
+        logging.info(f"Rehashed password for user: {user.username}")
+
+    if not user.is_verified:
         raise HTTPException(status_code=401, detail="Please verify your account to login")
 
     # Update last login
     user.last_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    invalidate_user(user.id)
 
     # Create token
     access_token = create_access_token(data={"sub": user.id})
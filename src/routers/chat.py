@@ -1,12 +1,24 @@
 from fastapi import APIRouter
+import json
 import logging
-from ..services.helper import get_current_user, get_db
-from ..llm_schema import llm_extract
-from sqlalchemy.orm import Session
+import uuid
+from contextlib import contextmanager
+from fastapi.responses import StreamingResponse
+from typing import Literal
+from ..config import AsyncSessionLocal, config
+from ..services.helper import get_current_user, get_async_db, encode_cursor, decode_cursor
+from ..llm_schema import llm_extract_async, llm_stream
+from ..services.context import build_context
+from ..services.fast_path import answer as fast_path_answer
+from ..services.persistence import message_writer
+from ..services.metrics import CHAT_STAGE, CHAT_TURNS
+from ..services.tracing import span
+from sqlalchemy import func, or_, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from fastapi import HTTPException, Depends
-from ..models.schemas import ChatResponse, ChatIn
-from ..models.users import User, ChatSession, ChatMessage
+from fastapi import HTTPException, Depends, Query
+from ..models.schemas import ChatResponse, ChatIn, CurrentUser
+from ..models.users import ChatSession, ChatMessage
 
 
 router = APIRouter(tags=["chat"])
@@ -14,73 +26,142 @@ router = APIRouter(tags=["chat"])
 
 SESSIONS = {}
 
+# Page size of GET /sessions/{id} when a cursor is given without a limit
+DEFAULT_MESSAGE_PAGE = 100
+
+
+@contextmanager
+def _stage(name: str):
+    """Time one stage of a chat turn, as a chat_stage_seconds sample and a trace span"""
+    with span(f"chat.{name}"), CHAT_STAGE.labels(name).time():
+        yield
+
+
+async def _load_turn(input: ChatIn, current_user: CurrentUser, db: AsyncSession) -> tuple[ChatSession, bool, list]:
+    """
+    Read phase of a chat turn: find (or prepare) the session and load its history.
+    Nothing is written here; the new session, the user message and the answer are all
+    persisted together by _persist_turn once the turn is complete.
+    Returns the session, whether it is new, and the history including the new user message.
+    """
+    user_message = {"role": "user", "content": input.message}
+    if input.session_id is None:
+        now = datetime.utcnow()
+        session = ChatSession(id=str(uuid.uuid4()), user_id=current_user.id, title="New Conversation",
+                              summarized_count=0, created_at=now, updated_at=now)
+        user_session_key = f"{current_user.id}_{session.id}"
+        SESSIONS[user_session_key] = {"collections": {}, "history": []}
+        logging.info(f"Created new session: {session.id} for user: {current_user.username}")
+        return session, True, [user_message]
+
+    session = await db.scalar(select(ChatSession).where(
+        ChatSession.id == input.session_id,
+        ChatSession.user_id == current_user.id
+    ))
+    if not session and config.CHAT_WRITE_BEHIND:
+        pending = message_writer.pending_session(input.session_id)
+        if pending and pending["user_id"] == current_user.id:
+            session = ChatSession(**pending)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    logging.info(f"Using existing session: {session.id} for user: {current_user.username}")
+
+    # Get conversation history from database
+    rows = (await db.execute(select(ChatMessage.id, ChatMessage.role, ChatMessage.content).where(
+        ChatMessage.session_id == session.id
+    ).order_by(ChatMessage.created_at, ChatMessage.id))).all()
+    history = [{"role": row.role, "content": row.content} for row in rows]
+    if config.CHAT_WRITE_BEHIND:
+        # A flush may commit between our SELECT and this merge; skip rows we already read
+        seen = {row.id for row in rows}
+        history += [{"role": row["role"], "content": row["content"]}
+                    for row in message_writer.pending_messages(session.id) if row["id"] not in seen]
+    # End the read transaction so no pooled connection is held while waiting on Gemini
+    await db.commit()
+    return session, False, history + [user_message]
+
+
+async def _build_context(session: ChatSession, history: list) -> list:
+    """Bound the prompt to recent turns plus the session's rolling summary"""
+    context = await build_context(history, session.summary, session.summarized_count)
+    session.summary = context["summary"]
+    session.summarized_count = context["summarized_count"]
+    logging.info(f"Session {session.id}: {context['tokens_saved']} context tokens saved this turn")
+    return context["history"]
+
+
+def _update_session(session: ChatSession, input: ChatIn, history: list) -> None:
+    # Update session timestamp
+    session.updated_at = datetime.utcnow()
+
+    # Update title based on first message
+    if session.title == "New Conversation" and len(history) == 1:
+        session.title = input.message[:50] + ("..." if len(input.message) > 50 else "")
+
+
+async def _persist_turn(db: AsyncSession, session: ChatSession, is_new: bool, messages: list) -> None:
+    """
+    Write phase of a chat turn: the new session (if any), the turn's messages and the session
+    updates go out in one transaction, or to the write-behind buffer when CHAT_WRITE_BEHIND is on.
+    """
+    if config.CHAT_WRITE_BEHIND:
+        columns = {"id": session.id, "updated_at": session.updated_at, "title": session.title,
+                   "summary": session.summary, "summarized_count": session.summarized_count}
+        await message_writer.add_turn(
+            new_session={**columns, "user_id": session.user_id, "created_at": session.created_at} if is_new else None,
+            session_update=columns,
+            messages=[{"id": str(uuid.uuid4()), "session_id": session.id, **msg} for msg in messages],
+        )
+        return
+
+    if is_new:
+        db.add(session)
+    else:
+        await db.merge(session)
+    db.add_all([ChatMessage(session_id=session.id, **msg) for msg in messages])
+    await db.commit()
+
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
         input: ChatIn,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Chat with the weather bot (requires authentication)
     - **message**: User's message to the bot
     - **session_id**: session ID to continue conversation
     """
-    if input.session_id is None:
-        session = ChatSession(user_id=current_user.id)
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        session_id = session.id
-        user_session_key = f"{current_user.id}_{session_id}"
-        SESSIONS[user_session_key] = {"collections": {}, "history": []}
-        logging.info(f"Created new session: {session_id} for user: {current_user.username}")
-    else:
-        session = db.query(ChatSession).filter(
-            ChatSession.id == input.session_id,
-            ChatSession.user_id == current_user.id
-        ).first()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        session_id = session.id
-        logging.info(f"Using existing session: {session_id} for user: {current_user.username}")
-
-    # Save user message to database
-    user_message = ChatMessage(
-        session_id=session_id,
-        role="user",
-        content=input.message
-    )
-    db.add(user_message)
-    db.commit()
-
-    # Get conversation history from database
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at).all()
-    history = [{"role": msg.role, "content": msg.content} for msg in messages]
+    received_at = datetime.utcnow()
+    with _stage("load"):
+        session, is_new, history = await _load_turn(input, current_user, db)
+    session_id = session.id
     logging.info(f"User {current_user.username} sent message in session {session_id}")
 
     try:
-        # Call LLM
-        result = llm_extract(history)
-        # Save assistant responses to database
+        # Simple weather/forecast requests are answered without Gemini
+        with _stage("fast_path"):
+            result = await fast_path_answer(history) if config.CHAT_FAST_PATH else None
+        if result is None:
+            with _stage("context"):
+                context = await _build_context(session, history)
+            # Call LLM
+            with _stage("llm"):
+                result = await llm_extract_async(context)
+            CHAT_TURNS.labels("llm").inc()
+        else:
+            CHAT_TURNS.labels("fast_path").inc()
+
+        turn = [{"role": "user", "content": input.message, "created_at": received_at}]
+        answered_at = datetime.utcnow()
         for update in result.get("history_update", []):
             if update["role"] == "assistant":
-                assistant_message = ChatMessage(
-                    session_id=session_id,
-                    role="assistant",
-                    content=update["content"]
-                )
-                db.add(assistant_message)
-
-        # Update session timestamp
-        session.updated_at = datetime.utcnow()
-
-        # Update title based on first message
-        if session.title == "New Conversation" and len(history) == 1:
-            session.title = input.message[:50] + ("..." if len(input.message) > 50 else "")
-        db.commit()
+                turn.append({"role": "assistant", "content": update["content"], "created_at": answered_at})
+
+        _update_session(session, input, history)
+        with _stage("persist"):
+            await _persist_turn(db, session, is_new, turn)
         logging.info(f"Bot responded in session {session_id}")
 
         return ChatResponse(
@@ -89,86 +170,276 @@ async def chat(
             history=history + result.get("history_update", [])
         )
     except Exception as e:
+        CHAT_TURNS.labels("error").inc()
         logging.error(f"Error processing message: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(
+        input: ChatIn,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streaming variant of /chat using server-sent events
+    - **session**: sent first, carries the session_id
+    - **tool**: progress while a weather tool runs, e.g. "Looking up Berlin…"
+    - **token**: a chunk of the assistant answer
+    - **done**: the complete answer, sent once it has been saved
+    - **error**: the turn failed
+    """
+    received_at = datetime.utcnow()
+    with _stage("load"):
+        session, is_new, history = await _load_turn(input, current_user, db)
+    session_id = session.id
+    logging.info(f"User {current_user.username} started a stream in session {session_id}")
+
+    async def events():
+        yield _sse("session", {"session_id": session_id})
+        try:
+            with _stage("fast_path"):
+                fast = await fast_path_answer(history) if config.CHAT_FAST_PATH else None
+            if fast is not None:
+                CHAT_TURNS.labels("fast_path").inc()
+                response_text = fast["response"]
+                yield _sse("token", {"text": response_text})
+            else:
+                # Summarising old turns may call Gemini, so it happens after the first byte is out
+                with _stage("context"):
+                    context = await _build_context(session, history)
+                response_text = None
+                with _stage("llm"):
+                    async for event in llm_stream(context):
+                        if event["event"] == "done":
+                            response_text = event["data"]["response"]
+                        else:
+                            yield _sse(event["event"], event["data"])
+                CHAT_TURNS.labels("llm").inc()
+
+            turn = [
+                {"role": "user", "content": input.message, "created_at": received_at},
+                {"role": "assistant", "content": response_text, "created_at": datetime.utcnow()},
+            ]
+            _update_session(session, input, history)
+            # The request-scoped session may already be closed once streaming starts
+            with _stage("persist"):
+                async with AsyncSessionLocal() as stream_db:
+                    await _persist_turn(stream_db, session, is_new, turn)
+            logging.info(f"Bot streamed a response in session {session_id}")
+            yield _sse("done", {"session_id": session_id, "response": response_text})
+        except Exception as e:
+            CHAT_TURNS.labels("error").inc()
+            logging.error(f"Error streaming message: {str(e)}")
+            yield _sse("error", {"detail": f"Error processing message: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _flush_pending(session_id: str | None = None) -> None:
+    """Write buffered turns (of this session, if given) before a read that would otherwise miss them"""
+    if not (config.CHAT_WRITE_BEHIND and message_writer.has_pending(session_id)):
+        return
+    try:
+        await message_writer.flush()
+    except Exception:
+        raise HTTPException(status_code=503, detail="Server busy, please retry shortly", headers={"Retry-After": "1"})
+
+
 @router.get("/sessions")
 async def get_user_sessions(
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        limit: int = Query(50, ge=1, le=200),
+        cursor: str | None = None,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all chat sessions for current user"""
-    sessions = db.query(ChatSession).filter(
+    """
+    Get the chat sessions of the current user, most recently updated first
+    - **limit**: page size
+    - **cursor**: `next_cursor` from the previous page
+    """
+    await _flush_pending()
+    query = select(
+        ChatSession.id,
+        ChatSession.title,
+        ChatSession.created_at,
+        ChatSession.updated_at,
+        func.count(ChatMessage.id).label("message_count"),
+    ).outerjoin(
+        ChatMessage, ChatMessage.session_id == ChatSession.id
+    ).where(
         ChatSession.user_id == current_user.id
-    ).order_by(ChatSession.updated_at.desc()).all()
-    logging.info(f"Found {len(sessions)} chat sessions for user {current_user.username}")
+    )
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor)
+        query = query.where(or_(
+            ChatSession.updated_at < updated_at,
+            and_(ChatSession.updated_at == updated_at, ChatSession.id < session_id),
+        ))
+    rows = (await db.execute(query.group_by(ChatSession.id).order_by(
+        ChatSession.updated_at.desc(), ChatSession.id.desc()
+    ).limit(limit + 1))).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    total = await db.scalar(select(func.count(ChatSession.id)).where(ChatSession.user_id == current_user.id))
+    logging.info(f"Found {len(rows)} of {total} chat sessions for user {current_user.username}")
     return {
         "sessions": [
             {
-                "id": session.id,
-                "title": session.title,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "message_count": len(session.messages)
+                "id": row.id,
+                "title": row.title,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at,
+                "message_count": row.message_count
             }
-            for session in sessions
+            for row in rows
         ],
-        "total": len(sessions)
+        "total": total,
+        "next_cursor": encode_cursor(rows[-1].updated_at, rows[-1].id) if has_more else None
     }
 
 
+def _message_out(msg) -> dict:
+    return {
+        "id": msg.id,
+        "role": msg.role,
+        "content": msg.content,
+        "created_at": msg.created_at
+    }
+
+
+async def _stream_messages(session: ChatSession):
+    """
+    NDJSON lines for a session: one header line, then every message in order. Rows are read
+    through a server-side cursor in MESSAGE_STREAM_BATCH sized batches on a session of its own,
+    so memory stays flat however long the conversation is.
+    """
+    yield json.dumps({
+        "id": session.id,
+        "title": session.title,
+        "created_at": session.created_at,
+        "updated_at": session.updated_at,
+    }, default=str) + "\n"
+
+    async with AsyncSessionLocal() as stream_db:
+        result = await stream_db.stream(
+            select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at)
+            .where(ChatMessage.session_id == session.id)
+            .order_by(ChatMessage.created_at, ChatMessage.id)
+            .execution_options(yield_per=config.MESSAGE_STREAM_BATCH)
+        )
+        async for batch in result.partitions():
+            yield "".join(json.dumps(_message_out(msg), default=str) + "\n" for msg in batch)
+
+
 @router.get("/sessions/{session_id}")
 async def get_session(
         session_id: str,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        limit: int | None = Query(None, ge=1, le=1000),
+        before: str | None = None,
+        after: str | None = None,
+        format: Literal["json", "ndjson"] = "json",
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
 ):
-    """Get specific chat session with messages"""
-    session = db.query(ChatSession).filter(
+    """
+    Get specific chat session with messages, oldest first. Without limit or cursor every message
+    is returned, as before pagination existed.
+    - **limit**: page size (100 when paging with a cursor)
+    - **after** / **before**: `next_cursor` / `prev_cursor` of another page
+    - **format**: `ndjson` streams the whole session instead, one message per line
+    """
+    await _flush_pending(session_id)
+    session = await db.scalar(select(ChatSession).where(
         ChatSession.id == session_id,
         ChatSession.user_id == current_user.id
-    ).first()
+    ))
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.created_at).all()
+    if format == "ndjson":
+        logging.info(f"Streaming session {session_id} for user {current_user.username}")
+        return StreamingResponse(_stream_messages(session), media_type="application/x-ndjson")
+
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+    query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    if before:
+        created_at, message_id = decode_cursor(before)
+        query = query.where(or_(
+            ChatMessage.created_at < created_at,
+            and_(ChatMessage.created_at == created_at, ChatMessage.id < message_id),
+        )).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+    else:
+        if after:
+            created_at, message_id = decode_cursor(after)
+            query = query.where(or_(
+                ChatMessage.created_at > created_at,
+                and_(ChatMessage.created_at == created_at, ChatMessage.id > message_id),
+            ))
+        query = query.order_by(ChatMessage.created_at, ChatMessage.id)
+
+    if limit is None and (before or after):
+        limit = DEFAULT_MESSAGE_PAGE
+    if limit is None:
+        messages, has_more = list(await db.scalars(query)), False
+    else:
+        messages = list(await db.scalars(query.limit(limit + 1)))
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+    if before:
+        messages.reverse()
+
+    # Whether older/newer pages exist is known from the overfetch in the direction we paged,
+    # and from the cursor we came from in the other one
+    has_older = has_more if before else after is not None
+    has_newer = has_more if not before else True
     logging.info(f"Retrieved session {session_id} for user {current_user.username}")
     return {
         "id": session.id,
         "title": session.title,
         "created_at": session.created_at,
         "updated_at": session.updated_at,
-        "messages": [
-            {
-                "id": msg.id,
-                "role": msg.role,
-                "content": msg.content,
-                "created_at": msg.created_at
-            }
-            for msg in messages
-        ]
+        "messages": [_message_out(msg) for msg in messages],
+        "next_cursor": encode_cursor(messages[-1].created_at, messages[-1].id) if messages and has_newer else None,
+        "prev_cursor": encode_cursor(messages[0].created_at, messages[0].id) if messages and has_older else None,
     }
 
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(
         session_id: str,
-        current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a chat session and all its messages"""
-    session = db.query(ChatSession).filter(
+    session = await db.scalar(select(ChatSession).where(
         ChatSession.id == session_id,
         ChatSession.user_id == current_user.id
-    ).first()
+    ))
+
+    if config.CHAT_WRITE_BEHIND:
+        pending = message_writer.pending_session(session_id)
+        if not session and pending and pending["user_id"] == current_user.id:
+            message_writer.discard(session_id)
+            logging.info(f"Deleted unwritten session {session_id} for user {current_user.username}")
+            return {"message": "Session deleted successfully"}
+        message_writer.discard(session_id)
 
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-    db.delete(session)
-    db.commit()
+    await db.delete(session)
+    await db.commit()
     logging.info(f"Deleted session {session_id} for user {current_user.username}")
     return {"message": "Session deleted successfully"}
\ No newline at end of file
@@ -1,7 +1,19 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from ..models.schemas import HealthOut
+from ..services.weather_service import geocode_cache, observation_cache
+from ..services.weather_service_async import inflight
+from ..services.helper import token_cache, principal_cache, require_ops_token
+from ..services.persistence import message_writer
+from ..services.hashing import hashing_pool
+from ..services.email_services import email_delivery
+from ..services.tile_cache import tile_store_stats
+from ..services.tool_results import tool_result_stats
+from ..services.fast_path import fast_path_stats
+from ..services.response_cache import response_cache
+from ..services.metrics import CONTENT_TYPE, registry, render_samples
+from ..services.tracing import tracer
 from time import time
-from fastapi import status
+from fastapi import status, Response
 
 
 router = APIRouter(tags=["Root"])
@@ -13,6 +25,65 @@ async def health():
     return HealthOut(status="ok", uptime_seconds=time() - START_TIME)
 
 
+@router.get("/cache/stats", dependencies=[Depends(require_ops_token)])
+async def cache_stats():
+    """Hit/miss counters for the in-memory caches (OPS_TOKEN bearer token required)"""
+    return {
+        "geocode": geocode_cache.stats(),
+        "observations": observation_cache.stats(),
+        "single_flight": inflight.stats(),
+        "auth_tokens": token_cache.stats(),
+        "auth_users": principal_cache.stats(),
+        "write_behind": message_writer.stats(),
+        "password_hashing": hashing_pool.stats(),
+        "email": email_delivery.stats(),
+        "tiles": tile_store_stats(),
+        "tool_results": tool_result_stats.stats(),
+        "chat_fast_path": fast_path_stats.stats(),
+        "llm_responses": response_cache.stats(),
+        "tracing": tracer.stats(),
+    }
+
+
+def _cache_metrics() -> str:
+    """Cache and queue figures the components already keep, read at scrape time"""
+    caches = {
+        "geocode": geocode_cache.stats(),
+        "observations": observation_cache.stats(),
+        "auth_tokens": token_cache.stats(),
+        "auth_users": principal_cache.stats(),
+        "llm_responses": response_cache.stats(),
+        "tiles": tile_store_stats(),
+    }
+    hashing, email, writer = hashing_pool.stats(), email_delivery.stats(), message_writer.stats()
+    return "".join([
+        render_samples("cache_hits_total", "counter", "Cache hits",
+                       [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        render_samples("cache_misses_total", "counter", "Cache misses",
+                       [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        render_samples("cache_evictions_total", "counter", "Entries evicted to stay within the size limit",
+                       [({"cache": name}, stats["evictions"]) for name, stats in caches.items()]),
+        render_samples("cache_entries", "gauge", "Entries currently cached",
+                       [({"cache": name}, stats.get("size", stats.get("objects", 0))) for name, stats in caches.items()]),
+        render_samples("single_flight_in_flight", "gauge", "Upstream fetches shared by concurrent callers",
+                       [({}, inflight.stats()["in_flight"])]),
+        render_samples("password_hash_jobs", "gauge", "Password hashing jobs on the pool",
+                       [({"state": "queued"}, hashing["queued"]), ({"state": "running"}, hashing["running"])]),
+        render_samples("password_hash_rejected_total", "counter", "Hashing jobs rejected with 503",
+                       [({}, hashing["rejected"])]),
+        render_samples("email_queue_pending", "gauge", "Emails waiting to be sent or retried",
+                       [({}, email["pending"] + email["awaiting_retry"])]),
+        render_samples("write_behind_pending", "gauge", "Chat messages buffered by write-behind",
+                       [({}, writer["pending"])]),
+    ])
+
+
+@router.get("/metrics", dependencies=[Depends(require_ops_token)])
+async def metrics():
+    """Prometheus metrics (OPS_TOKEN bearer token required)"""
+    return Response(registry.render() + _cache_metrics(), media_type=CONTENT_TYPE)
+
+
 @router.get("/")
 async def root():
     """API documentation"""
@@ -35,9 +106,17 @@ async def root():
             },
             "chat": {
                 "POST /chat": "Chat with bot (saves to database)",
+                "POST /chat/stream": "Chat with bot, streamed as server-sent events",
                 "GET /sessions": "Get all user sessions",
                 "GET /sessions/{id}": "Get specific session with messages",
                 "DELETE /sessions/{id}": "Delete session"
+            },
+            "weather": {
+                "POST /weather/batch": "Current weather for many locations, streamed as NDJSON"
+            },
+            "tiles": {
+                "GET /tiles/{provider}/{z}/{x}/{y}": "Cached map tile (standard, satellite, terrain)",
+                "GET /tiles/{provider}/around": "A location's tile and its neighbours"
             }
         },
         "docs": "/docs"
@@ -0,0 +1,88 @@
+from fastapi import APIRouter
+import asyncio
+import base64
+from typing import Optional
+from fastapi import HTTPException, Depends, Query, Request, Response
+from ..config import config
+from ..models.schemas import CurrentUser
+from ..services.helper import get_current_user
+from ..services.tile_cache import get_tile, read_tile, tile_media_type, MAX_ZOOM
+from ..services.weather_service import deg2num
+from ..services.weather_service_async import geocode
+
+
+router = APIRouter(tags=["tiles"])
+
+
+def _etag(digest: str) -> str:
+    return f'"{digest}"'
+
+
+def _not_modified(request: Request, digest: str) -> bool:
+    tags = request.headers.get("if-none-match", "")
+    return tags.strip() == "*" or _etag(digest) in [tag.strip() for tag in tags.split(",")]
+
+
+@router.get("/tiles/{provider}/around")
+async def tiles_around(
+        provider: str,
+        location: Optional[str] = None,
+        lat: Optional[float] = Query(None, ge=-85.0511, le=85.0511),
+        lon: Optional[float] = Query(None, ge=-180, le=180),
+        zoom: int = Query(10, ge=0, le=MAX_ZOOM),
+        radius: int = Query(1, ge=0, le=2),
+        embed: bool = False,
+        current_user: CurrentUser = Depends(get_current_user)
+):
+    """
+    The tile containing a location and its neighbours, fetched concurrently into the tile cache
+    - **location** or **lat**/**lon**: where to center
+    - **radius**: neighbours on each side (1 gives a 3x3 grid)
+    - **embed**: include each tile base64-encoded instead of only its /tiles URL
+    """
+    if location is not None:
+        coordinates = await geocode(location)
+        lat, lon = float(coordinates["lat"]), float(coordinates["lon"])
+    elif lat is None or lon is None:
+        raise HTTPException(422, "give either a location or both lat and lon")
+
+    x, y = deg2num(lat, lon, zoom)
+    n = 2 ** zoom
+    grid = [((x + dx) % n, y + dy, dx, dy)
+            for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)
+            if 0 <= y + dy < n]
+    results = await asyncio.gather(*(get_tile(provider, zoom, tx, ty) for tx, ty, _, _ in grid),
+                                   return_exceptions=True)
+
+    tiles = []
+    for (tx, ty, dx, dy), result in zip(grid, results):
+        tile = {"x": tx, "y": ty, "dx": dx, "dy": dy, "url": f"/tiles/{provider}/{zoom}/{tx}/{ty}"}
+        if isinstance(result, HTTPException):
+            tile.update({"status": result.status_code, "error": result.detail})
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            digest, data = result
+            tile["etag"] = _etag(digest)
+            if embed:
+                data = data if data is not None else await read_tile(digest)
+                tile["media_type"] = tile_media_type(data)
+                tile["data"] = base64.b64encode(data).decode()
+        tiles.append(tile)
+    return {"provider": provider, "zoom": zoom, "latitude": lat, "longitude": lon,
+            "center": {"x": x, "y": y}, "tiles": tiles}
+
+
+@router.get("/tiles/{provider}/{z}/{x}/{y}")
+async def tile(provider: str, z: int, x: int, y: int, request: Request):
+    """
+    Map tile proxy for the configured providers (standard, satellite, terrain), served from the
+    on-disk tile cache. Supports If-None-Match with the ETag of a previous response.
+    """
+    digest, data = await get_tile(provider, z, x, y)
+    headers = {"ETag": _etag(digest), "Cache-Control": f"public, max-age={config.TILE_BROWSER_MAX_AGE}"}
+    if _not_modified(request, digest):
+        return Response(status_code=304, headers=headers)
+    if data is None:
+        data = await read_tile(digest)
+    return Response(content=data, media_type=tile_media_type(data), headers=headers)
@@ -0,0 +1,74 @@
+from fastapi import APIRouter
+import asyncio
+import json
+import logging
+from fastapi import HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from ..config import config
+from ..models.schemas import BatchLocation, CurrentUser, WeatherBatchIn
+from ..services.helper import get_current_user
+from ..services.weather_service import to_units
+from ..services.weather_service_async import geocode, fetch_observation
+
+
+router = APIRouter(tags=["weather"])
+
+
+async def _current_conditions(index: int, item: BatchLocation, units: str, limit: asyncio.Semaphore) -> dict:
+    """Resolve one batch entry and fetch its current weather; failures become an error line"""
+    query = item.location if item.location is not None else f"{item.lat},{item.lon}"
+    async with limit:
+        try:
+            if item.location is not None:
+                coordinates = await geocode(item.location)
+            else:
+                coordinates = {"lat": item.lat, "lon": item.lon}
+            weather = to_units(await fetch_observation("current", config.OWM_CURRENT, coordinates), "current", units)
+        except HTTPException as e:
+            return {"index": index, "query": query, "status": e.status_code, "error": e.detail}
+        except Exception as e:
+            logging.warning(f"Batch weather lookup failed for {query}: {str(e)}")
+            return {"index": index, "query": query, "status": 502, "error": "Weather provider error"}
+
+    main = weather.get("main", {})
+    return {
+        "index": index,
+        "query": query,
+        "name": coordinates.get("name", weather.get("name")),
+        "lat": float(coordinates["lat"]),
+        "lon": float(coordinates["lon"]),
+        "units": units,
+        "description": weather["weather"][0]["description"],
+        "temp": main.get("temp"),
+        "feels_like": main.get("feels_like"),
+        "humidity": main.get("humidity"),
+        "wind_speed": weather.get("wind", {}).get("speed"),
+    }
+
+
+@router.post("/weather/batch")
+async def weather_batch(input: WeatherBatchIn, current_user: CurrentUser = Depends(get_current_user)):
+    """
+    Current weather for many locations at once (requires authentication)
+    - **locations**: place names and/or {"lat": .., "lon": ..} objects
+    - **units**: "C" or "F"
+
+    Lookups run concurrently (WEATHER_BATCH_CONCURRENCY at a time) through the shared geocode and
+    observation caches. The response is NDJSON, one line per location in completion order; each
+    line carries the index of its location in the request, and failed lookups carry status and error.
+    """
+    items = [BatchLocation(location=item) if isinstance(item, str) else item for item in input.locations]
+    limit = asyncio.Semaphore(config.WEATHER_BATCH_CONCURRENCY)
+    logging.info(f"User {current_user.username} requested weather for {len(items)} locations")
+
+    async def lines():
+        tasks = [asyncio.create_task(_current_conditions(i, item, input.units, limit)) for i, item in enumerate(items)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # The client went away: don't keep fetching for it
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
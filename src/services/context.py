@@ -0,0 +1,55 @@
+import logging
+from ..config import config
+from ..llm_schema import summarize_async
+from .tokens import estimate_tokens
+
+
+def history_tokens(history: list) -> int:
+    return sum(estimate_tokens(msg["content"]) for msg in history)
+
+
+def summary_message(summary: str) -> dict:
+    return {"role": "user", "content": f"(Summary of our earlier conversation: {summary})"}
+
+
+def _window_start(history: list, summary_tokens: int) -> int:
+    """Index of the first message kept verbatim: the last N turns, shrunk further to fit the token budget"""
+    start = max(0, len(history) - config.CONTEXT_RECENT_TURNS * 2)
+    budget = config.CONTEXT_TOKEN_BUDGET - summary_tokens
+    while start < len(history) - 1 and history_tokens(history[start:]) > budget:
+        start += 1
+    return start
+
+
+async def build_context(history: list, summary: str | None = None, summarized_count: int = 0) -> dict:
+    """
+    Build the prompt history for one chat turn.
+
+    The last CONTEXT_RECENT_TURNS turns are sent verbatim. Older messages are folded into the
+    session's rolling summary, CONTEXT_SUMMARY_BATCH messages at a time, so the summary is only
+    ever extended with new messages. Returns the history to send, the (possibly updated) summary
+    and summarized_count to store on the session, and how many tokens the window saved.
+    """
+    summarized_count = min(summarized_count or 0, len(history))
+    start = _window_start(history, estimate_tokens(summary or ""))
+
+    pending = history[summarized_count:start]
+    over_budget = history_tokens(history[summarized_count:]) > config.CONTEXT_TOKEN_BUDGET
+    if pending and (len(pending) >= config.CONTEXT_SUMMARY_BATCH or over_budget):
+        try:
+            summary = await summarize_async(summary, pending)
+            summarized_count = start
+        except Exception as e:
+            logging.warning(f"Could not update the conversation summary: {str(e)}")
+
+    window = history[summarized_count:]
+    context = ([summary_message(summary)] if summary else []) + window
+
+    full_tokens = history_tokens(history)
+    context_tokens = history_tokens(context)
+    return {
+        "history": context,
+        "summary": summary,
+        "summarized_count": summarized_count,
+        "tokens_saved": max(0, full_tokens - context_tokens),
+    }
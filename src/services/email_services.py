@@ -1,77 +1,324 @@
+import heapq
+import html
 import logging
-from ..config import config, SMTP_USERNAME, SMTP_PASSWORD, SMTP_SERVER, SMTP_PORT
+import os
+import queue
+import re
 import smtplib
-from email.mime.text import MIMEText
+import threading
+import time
 from email.mime.multipart import MIMEMultipart
-import os
+from email.mime.text import MIMEText
+from functools import lru_cache
+from typing import Optional
 import requests
+from ..config import config, SMTP_USERNAME, SMTP_PASSWORD, SMTP_SERVER, SMTP_PORT
+from .metrics import EMAIL_ERRORS, EMAIL_SEND
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+MAILEROO_URL = "https://smtp.maileroo.com/api/v2/emails"
+VERIFICATION_SUBJECT = "Verify Your Weather Bot Account"
+
+
+class EmailTemplate:
+    """An HTML template split once into literal text and {{placeholder}} slots"""
+
+    _placeholder = re.compile(r"{{\s*(\w+)\s*}}")
+
+    def __init__(self, source: str):
+        self._parts = self._placeholder.split(source)  # even items are text, odd items are names
+
+    def render(self, **values) -> str:
+        return "".join(
+            part if i % 2 == 0 else html.escape(str(values.get(part, "")))
+            for i, part in enumerate(self._parts)
+        )
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> EmailTemplate:
+    """Read and compile a template from src/templates; each file is read from disk once"""
+    with open(os.path.join(TEMPLATE_DIR, name), "r", encoding="utf-8") as file:
+        return EmailTemplate(file.read())
+
+
+class PermanentEmailError(Exception):
+    """A delivery failure that retrying will not fix (bad recipient, rejected credentials, 4xx API answer)"""
+
+
+class SmtpTransport:
+    """
+    Keeps one SMTP connection open across messages and batches. It is re-opened when the
+    server drops it or after SMTP_IDLE_TIMEOUT seconds without traffic.
+    """
+
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, timeout: float = 10, idle_timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.sender = username or "weather-bot@localhost"
+        self._conn: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.connections = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if self.starttls and conn.has_extn("starttls"):
+            conn.starttls()
+            conn.ehlo()
+        if self.username and self.password:
+            conn.login(self.username, self.password)
+        self.connections += 1
+        return conn
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._conn is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def send(self, message: dict) -> None:
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = message["subject"]
+        msg['From'] = self.sender
+        msg['To'] = message["to"]
+        msg.attach(MIMEText(message["html"], 'html'))
+        try:
+            try:
+                self._connection().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._conn = None
+                self._connection().send_message(msg)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPAuthenticationError) as e:
+            raise PermanentEmailError(str(e)) from e
+        except smtplib.SMTPResponseException as e:
+            if 500 <= e.smtp_code < 600:
+                raise PermanentEmailError(str(e)) from e
+            raise
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except smtplib.SMTPException:
+                pass
+            self._conn = None
+
+
+class MailerooTransport:
+    """Maileroo HTTP API over one requests.Session, so TLS connections are reused between sends"""
+
+    name = "maileroo"
+
+    def __init__(self, api_key: str, from_email: str, timeout: float = 10):
+        self.from_email = from_email
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+    def send(self, message: dict) -> None:
+        payload = {
+            "from": {
+                "address": self.from_email,
+                "name": "Weather Bot"
+            },
+            "to": [
+                {
+                    "address": message["to"]
+                }
+            ],
+            "subject": message["subject"],
+            "html": message["html"]
+        }
+        response = self.session.post(MAILEROO_URL, json=payload, timeout=self.timeout)
+        if response.status_code == 200:
+            return
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentEmailError(f"Maileroo error {response.status_code}: {response.text}")
+        raise RuntimeError(f"Maileroo error {response.status_code}: {response.text}")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class LogTransport:
+    """Used when no mail provider is configured: the message is only logged"""
+
+    name = "log"
+
+    def send(self, message: dict) -> None:
+        logging.warning(f"Email not configured. Message for {message['to']}: {message.get('link', message['subject'])}")
+
+    def close(self) -> None:
+        pass
+
+
+def default_transport():
+    if config.MAILEROO_API_KEY:
+        return MailerooTransport(config.MAILEROO_API_KEY, config.MAILEROO_FROM_EMAIL, timeout=config.EMAIL_TIMEOUT)
+    if SMTP_SERVER:
+        return SmtpTransport(SMTP_SERVER, int(SMTP_PORT or 587), SMTP_USERNAME, SMTP_PASSWORD,
+                             starttls=config.SMTP_STARTTLS, timeout=config.EMAIL_TIMEOUT,
+                             idle_timeout=config.SMTP_IDLE_TIMEOUT)
+    return LogTransport()
+
+
+class EmailDelivery:
+    """
+    Background sender for outgoing mail. enqueue() returns at once; a worker thread sends queued
+    messages in batches of up to EMAIL_BATCH_SIZE over the transport's persistent connection,
+    waiting up to EMAIL_BATCH_WAIT seconds for a batch to fill. Failed sends are retried with
+    exponential backoff (EMAIL_RETRY_BACKOFF * 2^attempt) up to EMAIL_MAX_RETRIES times;
+    permanent failures are dropped straight away.
+    """
+
+    def __init__(self, transport=None, batch_size: Optional[int] = None, batch_wait: Optional[float] = None,
+                 max_retries: Optional[int] = None, backoff: Optional[float] = None):
+        self.transport = transport
+        self.batch_size = batch_size or config.EMAIL_BATCH_SIZE
+        self.batch_wait = config.EMAIL_BATCH_WAIT if batch_wait is None else batch_wait
+        self.max_retries = config.EMAIL_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = config.EMAIL_RETRY_BACKOFF if backoff is None else backoff
+        self._queue: queue.Queue = queue.Queue()
+        self._retries: list = []  # heap of (due time, sequence, message)
+        self._sequence = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+        self.send_seconds = 0.0
+        # Error class -> count; the messages carry recipient addresses, so they are only logged
+        self.errors: dict[str, int] = {}
+        self.last_error: Optional[str] = None
+
+    def enqueue(self, to: str, subject: str, html_body: str, **extra) -> None:
+        with self._lock:
+            if self._thread is None:
+                self.start()
+            self.queued += 1
+        self._queue.put({"to": to, "subject": subject, "html": html_body, "attempt": 0, **extra})
+
+    def start(self) -> None:
+        if self._thread is None:
+            if self.transport is None:
+                self.transport = default_transport()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="email-delivery", daemon=True)
+            self._thread.start()
+            logging.info(f"Email delivery started ({self.transport.name}, batch={self.batch_size})")
+
+    def stop(self, timeout: float = 10) -> None:
+        """Send what is queued (retries that are not yet due are dropped), then close the connection"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # Still sending: closing the connection under it would break the message in flight
+                logging.error(f"Email delivery did not finish within {timeout}s; leaving the connection open")
+                return
+            self._thread = None
+        if self.transport is not None:
+            self.transport.close()
+        if self._retries:
+            logging.error(f"Email delivery stopped with {len(self._retries)} messages awaiting retry")
+
+    def _next_batch(self) -> list:
+        batch = []
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._retries)[2])
+
+        if not batch:
+            # Sleep until a message arrives or the next retry is due
+            wait = self.batch_wait if not self._retries else self._retries[0][0] - now
+            try:
+                batch.append(self._queue.get(timeout=max(0.01, min(wait, 1.0))))
+            except queue.Empty:
+                return batch
+
+        # Give the batch a moment to fill up so it shares one connection round
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = 0 if self._stopping.is_set() else deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._deliver(batch)
+
+    def _deliver(self, batch: list) -> None:
+        started = time.perf_counter()
+        send_seconds = EMAIL_SEND.labels(self.transport.name)
+        for message in batch:
+            try:
+                with send_seconds.time():
+                    self.transport.send(message)
+                self.sent += 1
+                logging.info(f"Email '{message['subject']}' sent to {message['to']}")
+            except Exception as e:
+                EMAIL_ERRORS.labels(self.transport.name, "permanent" if isinstance(e, PermanentEmailError)
+                                    else "transient").inc()
+                self.last_error = type(e).__name__
+                self.errors[self.last_error] = self.errors.get(self.last_error, 0) + 1
+                message["attempt"] += 1
+                if isinstance(e, PermanentEmailError) or message["attempt"] > self.max_retries:
+                    self.failed += 1
+                    logging.error(f"Failed to send email to {message['to']}: {str(e)}")
+                else:
+                    self.retried += 1
+                    delay = self.backoff * 2 ** (message["attempt"] - 1)
+                    logging.warning(f"Email to {message['to']} failed, retrying in {delay:.1f}s: {str(e)}")
+                    self._sequence += 1
+                    heapq.heappush(self._retries, (time.monotonic() + delay, self._sequence, message))
+        self.batches += 1
+        self.send_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        return {
+            "transport": self.transport.name if self.transport else None,
+            "queued": self.queued,
+            "pending": self._queue.qsize(),
+            "awaiting_retry": len(self._retries),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "avg_batch_ms": round(self.send_seconds / self.batches * 1000, 2) if self.batches else 0.0,
+            "errors": dict(self.errors),
+            "last_error": self.last_error,
+        }
+
+
+email_delivery = EmailDelivery()
 
 
 def send_verification_email(email: str, username: str, token: str):
-    """Send verification email to user"""
-    try:
-        # Create verification URL
-        verification_url = f"{config.ALLOW_ORIGINS}/verify-email?token={token}"
-
-        # Read HTML template
-        template_path = os.path.join("src", "templates", "verification_email.html")
-        with open(template_path, "r", encoding="utf-8") as file:
-            body = file.read()
-        body = body.replace("{{username}}", username)
-        body = body.replace("{{verification_url}}", verification_url)
-        if config.MAILEROO_API_KEY:
-            payload = {
-                "from": {
-                    "address": config.MAILEROO_FROM_EMAIL,
-                    "name": "Weather Bot"
-                },
-                "to": [
-                    {
-                        "address": email
-                    }
-                ],
-                "subject": "Verify Your Weather Bot Account",
-                "html": body
-            }
-
-            headers = {
-                "Authorization": f"Bearer {config.MAILEROO_API_KEY}",
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(
-                "https://smtp.maileroo.com/api/v2/emails",
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                logging.info(f"Verification email sent to {email}")
-            else:
-                logging.error(
-                    f"Maileroo error {response.status_code}: {response.text}"
-                )
-        else:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = "Verify Your Weather Bot Account"
-            msg['From'] = SMTP_USERNAME
-            msg['To'] = email
-
-            # Attach HTML content
-            html_part = MIMEText(body, 'html')
-            msg.attach(html_part)
-
-            # Send email
-            if SMTP_USERNAME and SMTP_PASSWORD:
-                with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-                    server.starttls()
-                    server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                    server.send_message(msg)
-
-                logging.info(f"Verification email sent to {email}")
-            else:
-                logging.warning(f"Email not configured. Verification link: {verification_url}")
-
-    except Exception as e:
-        logging.error(f"Failed to send email: {str(e)}")
\ No newline at end of file
+    """Queue the verification email for a user"""
+    # Create verification URL
+    verification_url = f"{config.ALLOW_ORIGINS}/verify-email?token={token}"
+    body = load_template("verification_email.html").render(username=username, verification_url=verification_url)
+    email_delivery.enqueue(email, VERIFICATION_SUBJECT, body, link=verification_url)
@@ -0,0 +1,142 @@
+import logging
+import re
+import time
+from typing import Optional
+from ..models.schemas import Extracted
+from . import weather_service_async as async_service
+from .renderers import render_forecast, render_weather
+
+
+# Rule-based extraction for the plain "weather in Paris" / "forecast for Suhl in F" messages,
+# answered straight from the weather service. Anything the rules are not sure about goes to Gemini.
+
+_LEAD = r"(?:(?:what(?:'s| is)|how(?:'s| is)|show me|tell me|give me|get|check)\s+)?(?:the\s+)?"
+_KIND = r"(?P<kind>current weather|weather forecast|weather|(?:5|five)[- ]day forecast|forecast)"
+_UNITS = r"(?:\s+(?:in\s+)?(?P<units>celsius|fahrenheit|°?c|°?f))?"
+_WHEN = r"(?:\s+(?P<when>right now|now|today|currently|this week|for the week|for the next (?:5|five) days))?"
+_LOCATION = r"(?P<location>[^\W\d_][\w .'\-]*?)"
+
+PATTERNS = [
+    # weather in Paris / what's the forecast for Suhl in F / current weather at Berlin today
+    re.compile(rf"^{_LEAD}{_KIND}(?:\s+like)?\s+(?:in|for|at)\s+{_LOCATION}{_UNITS}{_WHEN}$", re.IGNORECASE),
+    # Paris weather / Suhl forecast in fahrenheit
+    re.compile(rf"^{_LEAD}{_LOCATION}\s+{_KIND}{_UNITS}{_WHEN}$", re.IGNORECASE),
+]
+
+UNITS_MENTION = re.compile(r"\b(celsius|fahrenheit|°\s?[cf]|in [cf])\b", re.IGNORECASE)
+
+# Words that make a location ambiguous (a time, a comparison, a second place) or the message a
+# question the templates cannot answer
+AMBIGUOUS = {"and", "or", "vs", "versus", "compared", "than", "tomorrow", "yesterday", "tonight", "weekend",
+             "week", "next", "last", "morning", "afternoon", "evening", "hour", "hours", "day", "days",
+             "air", "quality", "map", "coordinates", "rain", "snow", "wind", "not", "my", "here", "there",
+             "it", "this", "that", "weather", "forecast", "how", "what", "what's", "is", "will", "should",
+             "do", "does", "i", "me", "you", "your", "like"}
+FILLER = {"the", "a", "an", "in", "for", "at"}
+MAX_LOCATION_WORDS = 4
+
+
+def _units(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    text = text.lower().replace("°", "").replace(" ", "")
+    return "F" if text.endswith("f") or text.startswith("fahrenheit") else "C"
+
+
+def _history_units(history: list) -> Optional[str]:
+    """Units the user asked for earlier in the conversation, most recent first"""
+    for msg in reversed(history):
+        if msg["role"] == "user":
+            mention = UNITS_MENTION.findall(msg["content"])
+            if mention:
+                return _units(mention[-1])
+    return None
+
+
+def extract(message: str, history: Optional[list] = None) -> Optional[Extracted]:
+    """Fill Extracted for a simple current-weather or forecast request, or None when unsure"""
+    text = " ".join(message.strip().rstrip("?!. ").split())
+    for pattern in PATTERNS:
+        match = pattern.match(text)
+        if match is not None:
+            break
+    else:
+        return None
+
+    location = match["location"].strip(" .'-")
+    words = location.lower().split()
+    if FILLER.issuperset(words) or len(words) > MAX_LOCATION_WORDS or AMBIGUOUS.intersection(words):
+        return None
+    if location.islower():
+        location = location.title()
+
+    kind = match["kind"].lower()
+    when = (match["when"] or "").lower()
+    if "forecast" in kind:
+        if when in ("right now", "now", "currently"):
+            return None
+        when = "forecast"
+    elif when in ("this week", "for the week") or when.startswith("for the next"):
+        when = "forecast"
+    else:
+        when = "now"
+
+    units = _units(match["units"]) or _history_units(history or []) or "C"
+    return Extracted(location=location, when=when, units=units)
+
+
+class FastPathStats:
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.hit_seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(self.hits / self.attempts, 4) if self.attempts else 0.0,
+            "avg_hit_ms": round(self.hit_seconds / self.hits * 1000, 2) if self.hits else 0.0,
+        }
+
+
+fast_path_stats = FastPathStats()
+
+
+async def answer(history: list) -> Optional[dict]:
+    """
+    Answer the last user message of history without Gemini when it is a simple weather or
+    forecast request. Returns the reply in the shape of llm_extract_async, or None to fall back.
+    """
+    fast_path_stats.attempts += 1
+    started = time.perf_counter()
+    extracted = extract(history[-1]["content"], history[:-1])
+    if extracted is None:
+        return None
+
+    try:
+        if extracted.when == "forecast":
+            result = await async_service.get_forcast(extracted.location, extracted.units)
+            text = render_forecast(result, extracted.location)
+        else:
+            result = await async_service.get_weather(extracted.location, extracted.units)
+            text = render_weather(result)
+    except Exception as e:
+        # Unknown place, provider error or an unexpected result: let Gemini handle the message
+        fast_path_stats.fallbacks += 1
+        logging.info(f"Fast path fell back for {extracted.location}: {getattr(e, 'detail', None) or str(e)}")
+        return None
+
+    elapsed = time.perf_counter() - started
+    fast_path_stats.hits += 1
+    fast_path_stats.hit_seconds += elapsed
+    logging.info(f"Fast path answered {extracted.when} weather for {extracted.location} in {elapsed * 1000:.1f}ms")
+    return {
+        "response": text,
+        "history_update": [
+            {"role": "assistant", "content": text}
+        ],
+        "extracted": extracted,
+    }
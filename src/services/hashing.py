@@ -0,0 +1,82 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+from ..config import config
+from .metrics import PASSWORD_HASH
+
+
+class HashingPool:
+    """
+    Bounded thread pool for CPU-heavy password hashing, so argon2 never runs on the event loop.
+    At most `workers` jobs run at once and at most `max_queue` wait behind them; anything beyond
+    that is rejected with a 503 instead of piling up. argon2-cffi releases the GIL while hashing.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.workers = workers or config.PASSWORD_HASH_WORKERS
+        self.max_queue = config.PASSWORD_HASH_QUEUE if max_queue is None else max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()  # counters are updated from the worker threads too
+        self.running = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _job(self, fn: Callable, args: tuple, submitted: float) -> Any:
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += started - submitted
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            PASSWORD_HASH.labels(getattr(fn, "__name__", "other")).observe(elapsed)
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.run_seconds += elapsed
+
+    async def run(self, fn: Callable, *args) -> Any:
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Server busy, please retry shortly",
+                                    headers={"Retry-After": "1"})
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self._job, fn, args, time.perf_counter())
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "running": self.running,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_run_ms": round(self.run_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+
+hashing_pool = HashingPool()
@@ -1,13 +1,21 @@
+import base64
 import hashlib
-from ..config import SessionLocal, pwd_context, SECRET_KEY, \
-    ALGORITHM, security
-from sqlalchemy.orm import Session
+import hmac
+import json
+import time
+from ..config import SessionLocal, AsyncSessionLocal, pwd_context, SECRET_KEY, \
+    ALGORITHM, security, config
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
-from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import HTTPException, Depends
 from ..models.users import User
+from ..models.schemas import CurrentUser
+from .cache import TTLCache
+from .hashing import hashing_pool
 
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
@@ -23,16 +31,40 @@ def get_db():
         db.close()
 
 
+# Async database dependency, used by the routes
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 # Password functions
+def _prehash(password: str) -> str:
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
 def hash_password(password: str) -> str:
     """Hash a plain password"""
-    password = hashlib.sha256(password.encode('utf-8')).hexdigest()
-    return pwd_context.hash(password)
+    return pwd_context.hash(_prehash(password))
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context.verify(_prehash(plain_password), hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """Verify a password; the second item is a new hash when the stored one uses outdated argon2 parameters"""
+    return pwd_context.verify_and_update(_prehash(plain_password), hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the bounded hashing pool"""
+    return await hashing_pool.run(hash_password, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """verify_and_update_password on the bounded hashing pool"""
+    return await hashing_pool.run(verify_and_update_password, plain_password, hashed_password)
 
 
 def create_verification_token(user_id: str) -> str:
@@ -68,20 +100,72 @@ def decode_access_token(token: str):
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
 
+# Keyset pagination cursors
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    """Opaque cursor for the (timestamp, id) position of the last row of a page"""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(timestamp), str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Authentication caches: decoded token -> user id, and user id -> CurrentUser snapshot
+token_cache = TTLCache(maxsize=config.AUTH_CACHE_SIZE, ttl=config.AUTH_CACHE_TTL, name="auth_tokens")
+principal_cache = TTLCache(maxsize=config.AUTH_CACHE_SIZE, ttl=config.AUTH_CACHE_TTL, name="auth_users")
+
+
+def invalidate_user(user_id: str) -> None:
+    """Drop the cached snapshot of a user so the next request re-reads it from the database"""
+    principal_cache.pop(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    # Covers verification, login (last_login) and deletion, wherever the change is made
+    invalidate_user(target.id)
+
+
 # Get current user
 async def get_current_user(
         credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
-):
+        db: AsyncSession = Depends(get_async_db)
+) -> CurrentUser:
     token = credentials.credentials
-    payload = decode_access_token(token)
-    user_id: str = payload.get("sub")
-
+    user_id = token_cache.get(token)
     if user_id is None:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
+        payload = decode_access_token(token)
+        user_id = payload.get("sub")
+
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+        # Never cache a token past its own expiry
+        ttl = min(config.AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+        token_cache.set(token, user_id, ttl=ttl)
+
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        user = await db.get(User, user_id)
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal = CurrentUser.model_validate(user)
+        principal_cache.set(user_id, principal)
+
+    return principal
+
+
+ops_security = HTTPBearer(auto_error=False)
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail="User not found")
 
-    return user
\ No newline at end of file
+def require_ops_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(ops_security)) -> None:
+    """Guard for the operational endpoints: the OPS_TOKEN bearer token, or 404 when none is configured"""
+    if not config.OPS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), config.OPS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid ops token", headers={"WWW-Authenticate": "Bearer"})
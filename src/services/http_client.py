@@ -0,0 +1,55 @@
+import logging
+from typing import Optional
+import httpx
+from ..config import config
+from .tracing import TracingTransport
+
+
+# Shared keep-alive connection pool for all upstream HTTP calls (OpenWeatherMap, ...)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+    # Pool limits belong to the transport once a custom one is given
+    transport = TracingTransport(httpx.AsyncHTTPTransport(limits=limits))
+    return httpx.AsyncClient(transport=transport, timeout=config.HTTP_TIMEOUT)
+
+
+async def open_http_client() -> httpx.AsyncClient:
+    """Create the shared client; called once at app startup"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logging.info(f"Opened HTTP pool (max_connections={config.HTTP_MAX_CONNECTIONS}, "
+                     f"max_keepalive={config.HTTP_MAX_KEEPALIVE})")
+    return _client
+
+
+async def close_http_client() -> None:
+    """Close the shared client and its pooled connections; called at app shutdown"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logging.info("Closed HTTP pool")
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared client. Outside the app lifespan (scripts, tests) it is created lazily.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def set_http_client(client: Optional[httpx.AsyncClient]) -> None:
+    """Swap the shared client, e.g. for one built on httpx.MockTransport in tests"""
+    global _client
+    _client = client
@@ -0,0 +1,258 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterable
+from sqlalchemy import event
+
+
+# In-process metrics in the Prometheus text format, served at GET /metrics.
+# Recording is a dict lookup plus a locked add, so it is cheap enough for every request, query
+# and upstream call. Values that other components already count (cache hits, queue sizes) are not
+# recorded twice: /metrics reads them from their stats() when it is scraped.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Value:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class _Histogram:
+    __slots__ = ("_lock", "bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self._lock = Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict = {}
+        self._lock = Lock()
+        registry.register(self)
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values):
+        """The child for these label values (positional, in labelnames order)"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, values)} {_number(child.value)}"
+                for values, child in list(self._children.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self) -> list[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                labels = _labels(self.labelnames, values, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict = {}
+
+    def register(self, metric: Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+
+def render_samples(name: str, kind: str, documentation: str, samples: list[tuple[dict, float]]) -> str:
+    """Text for a metric whose values are read at scrape time, e.g. from a component's stats()"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+# HTTP
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests served", ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency, including streamed bodies",
+                          ("route",))
+
+# Chat turns
+CHAT_STAGE = Histogram("chat_stage_seconds", "Time spent in each stage of a chat turn", ("stage",))
+CHAT_TURNS = Counter("chat_turns_total", "Chat turns by how they were answered", ("path",))
+
+# Upstream services
+OWM_REQUEST = Histogram("owm_request_seconds", "OpenWeatherMap request latency", ("endpoint",))
+OWM_ERRORS = Counter("owm_errors_total", "Failed OpenWeatherMap requests", ("endpoint",))
+GEMINI_REQUEST = Histogram("gemini_request_seconds", "Gemini call latency; round is first or after_tools",
+                           ("call", "round"))
+GEMINI_ERRORS = Counter("gemini_errors_total", "Failed Gemini calls", ("call",))
+TOOL_CALLS = Counter("llm_tool_calls_total", "Tool calls requested by the model", ("tool", "outcome"))
+
+# Storage, hashing and mail
+DB_QUERY = Histogram("db_query_seconds", "Database statement latency", ("operation",))
+PASSWORD_HASH = Histogram("password_hash_seconds", "argon2 hash/verify time on the hashing pool", ("operation",),
+                          buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+EMAIL_SEND = Histogram("email_send_seconds", "Time to hand one email to the mail provider", ("transport",))
+EMAIL_ERRORS = Counter("email_send_errors_total", "Failed email sends", ("transport", "kind"))
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement run on a (sync) SQLAlchemy engine; pass async_engine.sync_engine for async"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def failed(context):
+        stack = context.connection.info.get("query_started") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests in flight, by route template and status, and their latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        gauge = HTTP_IN_FLIGHT.labels()
+        gauge.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            gauge.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.labels(scope["method"], route, status).inc()
+            HTTP_DURATION.labels(route).observe(time.perf_counter() - started)
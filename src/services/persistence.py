@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import insert, update
+from ..config import AsyncSessionLocal, config
+from ..models.users import ChatSession, ChatMessage
+
+
+class MessageWriter:
+    """
+    Write-behind persistence for chat turns (CHAT_WRITE_BEHIND=true).
+
+    Turns are buffered in memory and written by a background task in bulk: one transaction per
+    flush with a multi-row INSERT for new sessions, one for messages, and the session updates.
+    A flush happens every CHAT_WRITE_BEHIND_INTERVAL seconds, or as soon as
+    CHAT_WRITE_BEHIND_BATCH messages are waiting. Until then pending_session/pending_messages
+    let the chat routes see their own writes; a batch stops being pending in the same step
+    its transaction commits, so readers never see a row both buffered and in the database.
+
+    A failed flush is retried with backoff. After CHAT_WRITE_BEHIND_MAX_RETRIES failures the batch
+    is written one session at a time and the sessions that still fail are dead-lettered, so one bad
+    row cannot block every later write. At most CHAT_WRITE_BEHIND_MAX_PENDING messages are buffered.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, batch_size: Optional[int] = None,
+                 interval: Optional[float] = None, max_pending: Optional[int] = None,
+                 max_retries: Optional[int] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or config.CHAT_WRITE_BEHIND_BATCH
+        self.interval = interval or config.CHAT_WRITE_BEHIND_INTERVAL
+        self.max_pending = max_pending or config.CHAT_WRITE_BEHIND_MAX_PENDING
+        self.max_retries = config.CHAT_WRITE_BEHIND_MAX_RETRIES if max_retries is None else max_retries
+        self._sessions: dict = {}  # session id -> row of a session not yet inserted
+        self._updates: dict = {}  # session id -> column values for an existing session
+        self._messages: list = []
+        self._flushing = ({}, {}, [])  # buffers being written right now, still visible to readers
+        self._lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._attempts = 0  # consecutive failed flushes of the current batch
+        self.dead_letters: deque = deque(maxlen=100)
+        self.flushes = 0
+        self.messages_written = 0
+        self.messages_dead_lettered = 0
+
+    async def add_turn(self, new_session: Optional[dict], session_update: dict, messages: list) -> None:
+        if self.pending_count() + len(messages) > self.max_pending:
+            # Backpressure: write through instead of letting the buffer grow without bound
+            try:
+                await self.flush()
+            except Exception:
+                pass
+            if self.pending_count() + len(messages) > self.max_pending:
+                raise HTTPException(status_code=503, detail="Server busy, please retry shortly",
+                                    headers={"Retry-After": "1"})
+
+        if new_session is not None:
+            self._sessions[new_session["id"]] = dict(new_session)
+        elif session_update:
+            session_id = session_update["id"]
+            if session_id in self._sessions:
+                self._sessions[session_id].update(session_update)
+            else:
+                self._updates.setdefault(session_id, {}).update(session_update)
+        self._messages.extend(messages)
+        if len(self._messages) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def discard(self, session_id: str) -> None:
+        """Drop buffered rows of a deleted session"""
+        self._sessions.pop(session_id, None)
+        self._updates.pop(session_id, None)
+        self._messages = [row for row in self._messages if row["session_id"] != session_id]
+
+    def pending_session(self, session_id: str) -> Optional[dict]:
+        return self._sessions.get(session_id) or self._flushing[0].get(session_id)
+
+    def pending_messages(self, session_id: str) -> list:
+        return [row for row in self._flushing[2] + self._messages if row["session_id"] == session_id]
+
+    def pending_count(self) -> int:
+        return len(self._messages) + len(self._flushing[2])
+
+    def has_pending(self, session_id: Optional[str] = None) -> bool:
+        """Whether anything (for this session, if given) is not in the database yet"""
+        sessions, updates, _ = self._flushing
+        if session_id is None:
+            return bool(self.pending_count() or self._sessions or self._updates or sessions or updates)
+        return bool(session_id in self._sessions or session_id in self._updates or session_id in sessions
+                    or session_id in updates or self.pending_messages(session_id))
+
+    def _committed(self, session_ids: Optional[set] = None) -> None:
+        """Stop serving in-flight rows that are now in the database (all of them by default)"""
+        if session_ids is None:
+            self._flushing = ({}, {}, [])
+            return
+        sessions, updates, messages = self._flushing
+        self._flushing = ({key: row for key, row in sessions.items() if key not in session_ids},
+                          {key: values for key, values in updates.items() if key not in session_ids},
+                          [row for row in messages if row["session_id"] not in session_ids])
+
+    async def _write(self, sessions: dict, updates: dict, messages: list, committed=None) -> None:
+        async with self.session_factory() as db:
+            if sessions:
+                await db.execute(insert(ChatSession), list(sessions.values()))
+            if messages:
+                await db.execute(insert(ChatMessage), messages)
+            for session_id, values in updates.items():
+                values = {key: value for key, value in values.items() if key != "id"}
+                await db.execute(update(ChatSession).where(ChatSession.id == session_id).values(**values))
+            await db.commit()
+            # Drop them from the pending view before yielding to the event loop again
+            if committed is not None:
+                committed()
+
+    async def _write_each(self, sessions: dict, updates: dict, messages: list) -> int:
+        """Write a batch one session at a time, dead-lettering the sessions that fail; returns messages written"""
+        by_session: dict = {}
+        for row in messages:
+            by_session.setdefault(row["session_id"], []).append(row)
+        written = 0
+        for session_id in {*sessions, *updates, *by_session}:
+            rows = by_session.get(session_id, [])
+            try:
+                await self._write({session_id: sessions[session_id]} if session_id in sessions else {},
+                                  {session_id: updates[session_id]} if session_id in updates else {}, rows,
+                                  committed=lambda: self._committed({session_id}))
+                written += len(rows)
+            except Exception as e:
+                logging.error(f"Dropping {len(rows)} buffered messages of session {session_id}: {str(e)}")
+                self.dead_letters.append({"session_id": session_id, "session": sessions.get(session_id),
+                                          "update": updates.get(session_id), "messages": rows,
+                                          "error": str(e)})
+                self.messages_dead_lettered += len(rows)
+        return written
+
+    async def flush(self) -> int:
+        """Write everything buffered so far in a single transaction; returns the messages written"""
+        async with self._lock:
+            sessions, updates, messages = self._sessions, self._updates, self._messages
+            if not (sessions or updates or messages):
+                return 0
+            self._sessions, self._updates, self._messages = {}, {}, []
+            self._flushing = (dict(sessions), dict(updates), list(messages))
+            try:
+                await self._write(sessions, updates, messages, committed=self._committed)
+                written = len(messages)
+            except Exception as e:
+                self._attempts += 1
+                if self._attempts <= self.max_retries:
+                    logging.error(f"Write-behind flush of {len(messages)} messages failed "
+                                  f"(attempt {self._attempts}), will retry: {str(e)}")
+                    self._restore(sessions, updates, messages)
+                    raise
+                logging.error(f"Write-behind flush failed {self._attempts} times, writing per session: {str(e)}")
+                written = await self._write_each(sessions, updates, messages)
+            except BaseException:
+                # Cancelled mid-flush: keep the batch so the next flush writes it
+                self._restore(sessions, updates, messages)
+                raise
+            finally:
+                self._committed()
+            self._attempts = 0
+            self.flushes += 1
+            self.messages_written += written
+            return written
+
+    def _restore(self, sessions: dict, updates: dict, messages: list) -> None:
+        # Put the batch back in front of anything that arrived meanwhile. Updates made to
+        # the in-flight sessions went to self._updates and are applied after the insert.
+        self._sessions = {**sessions, **self._sessions}
+        for session_id, values in updates.items():
+            self._updates[session_id] = {**values, **self._updates.get(session_id, {})}
+        self._messages = messages + self._messages
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            timeout = min(self.interval * 2 ** self._attempts, 5.0) if self._attempts else self.interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass  # logged by flush, retried with backoff
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logging.info(f"Write-behind persistence started (batch={self.batch_size}, interval={self.interval}s)")
+
+    async def stop(self) -> None:
+        """
+        Let the background task finish its current flush, then write whatever is left. Retries
+        follow the usual backoff until the batch is written or dead-lettered.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._sessions or self._updates or self._messages:
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(min(self.interval * 2 ** self._attempts, 5.0))
+
+    def stats(self) -> dict:
+        return {"pending": self.pending_count(), "flushes": self.flushes, "messages_written": self.messages_written,
+                "failed_attempts": self._attempts, "messages_dead_lettered": self.messages_dead_lettered}
+
+
+message_writer = MessageWriter()
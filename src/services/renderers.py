@@ -0,0 +1,126 @@
+import re
+from datetime import datetime
+from typing import Callable, Optional
+from ..config import config
+from .weather_service import air_quality_digest
+
+
+# Replies built from tool results without a Gemini call. They follow the formatting rules of
+# SYSTEM_INSTRUCTION: current weather as a paragraph, the forecast as one bullet per day, a bare
+# map tile URL, and the follow-up question on its own line after a blank line. Each renderer
+# returns the answer and its follow-up question separately so several results can share one.
+
+WEATHER_LINE = re.compile(r"^(?P<location>.+): (?P<description>.+), (?P<temp>-?\d+)(?P<units>[CF])$")
+FORECAST_LINE = re.compile(
+    r"^(?P<day>\w+) (?P<date>\d{4}-\d{2}-\d{2}): (?P<condition>.+?), "
+    r"(?P<temps>-?\d+°[CF](?: \(low -?\d+°[CF], high -?\d+°[CF]\))?)(?P<details>.*)$"
+)
+
+AQI_MEANING = {
+    "Good": "air quality is satisfactory and poses little or no risk",
+    "Fair": "air quality is acceptable for most people",
+    "Moderate": "sensitive groups may start to feel the effects",
+    "Poor": "everyone may begin to experience health effects, especially outdoors",
+    "Very Poor": "health warnings apply and outdoor activity is best avoided",
+}
+POLLUTANT_NAMES = {"pm2_5": "fine particles (PM2.5)", "pm10": "coarse particles (PM10)", "o3": "ozone (O₃)",
+                   "no2": "nitrogen dioxide (NO₂)", "so2": "sulphur dioxide (SO₂)", "co": "carbon monoxide (CO)"}
+
+
+def follow_up(question: str) -> str:
+    question = question.strip().rstrip("?.")
+    return f"\n\n{question[:1].upper()}{question[1:]}?"
+
+
+def weather_text(result: list[dict]) -> tuple[str, str]:
+    """get_weather: "Berlin: Clear sky, 20C" becomes "Right now in Berlin: clear sky, 20°C." """
+    item = result[0]
+    match = WEATHER_LINE.match(item["weather"])
+    if match is None:
+        raise ValueError(f"Unexpected weather line: {item['weather']}")
+    text = f"Right now in {match['location']}: {match['description'].lower()}, {match['temp']}°{match['units']}."
+    return text, item.get("followups", "Would you like to know the 5 days forecast")
+
+
+def forecast_text(result: list[str], location: str) -> tuple[str, str]:
+    """get_forcast: an intro line and one "• Monday, Oct 28: 18°C, Sunny" bullet per day"""
+    if not result:
+        raise ValueError("Empty forecast")
+    lines = [f"Here's the {len(result)}-day forecast for {location}:"]
+    for line in result:
+        match = FORECAST_LINE.match(line.strip())
+        if match is None:
+            raise ValueError(f"Unexpected forecast line: {line.strip()}")
+        date = datetime.strptime(match["date"], "%Y-%m-%d").strftime("%b %d")
+        lines.append(f"• {match['day']}, {date}: {match['temps']}, {match['condition'].capitalize()}{match['details']}")
+    return "\n".join(lines), f"Would you like to know the air quality in {location}"
+
+
+def air_quality_text(result: list[dict], location: str) -> tuple[str, str]:
+    """get_air_quality: the AQI, what it means and the pollutant driving it"""
+    digest = air_quality_digest(result[0]["air-quality"])
+    if digest.aqi is None:
+        raise ValueError("No air quality data")
+    text = (f"The air quality in {location} is {digest.category} (AQI {digest.aqi} of 5), "
+            f"which means {AQI_MEANING[digest.category]}.")
+    if digest.dominant_pollutant:
+        text += (f" The main pollutant is {POLLUTANT_NAMES[digest.dominant_pollutant]} at "
+                 f"{digest.concentrations[digest.dominant_pollutant]} μg/m³.")
+    return text, result[0].get("followups", f"Would you like the coordinates of {location}")
+
+
+def coordinates_text(result: dict, location: str) -> tuple[str, str]:
+    """geocode: the resolved place and its latitude/longitude"""
+    place = ", ".join(str(result[key]) for key in ("name", "state", "country") if result.get(key))
+    text = f"{place or location} is at latitude {float(result['lat']):.4f}, longitude {float(result['lon']):.4f}."
+    return text, f"Would you like a map tile of {location}"
+
+
+def map_tile_text(result: dict, location: str) -> tuple[str, str]:
+    """get_map_tile_url: the tile URL on a line of its own, with nothing after it"""
+    text = f"Here is a {result['map_type']} map tile of {location} at zoom {result['zoom']}:\n\n{result['tile_url']}"
+    return text, "Is there anything else you would like to know"
+
+
+# Tool name -> renderer(result, call args) returning (answer, follow-up question)
+TOOL_RENDERERS: dict[str, Callable] = {
+    "get_weather": lambda result, args: weather_text(result),
+    "get_forcast": lambda result, args: forecast_text(result, args["location"]),
+    "get_air_quality": lambda result, args: air_quality_text(result, args["location"]),
+    "geocode": lambda result, args: coordinates_text(result, args["location"]),
+    "get_map_tile_url": lambda result, args: map_tile_text(result, args["location"]),
+}
+
+
+def render_reply(parts: list[tuple[str, str]]) -> str:
+    """Join rendered answers, ending with the follow-up question of the last one"""
+    return "\n\n".join(text for text, _ in parts) + follow_up(parts[-1][1])
+
+
+def render_weather(result: list[dict]) -> str:
+    return render_reply([weather_text(result)])
+
+
+def render_forecast(result: list[str], location: str) -> str:
+    return render_reply([forecast_text(result, location)])
+
+
+def render_tool_results(calls: list, results: list) -> Optional[str]:
+    """
+    Render the results of one round of tool calls without Gemini, or None when a call is not in
+    LLM_LOCAL_RENDER_TOOLS, failed, or returned something its renderer does not understand.
+    """
+    if not calls:
+        return None
+    parts = []
+    for call, result in zip(calls, results):
+        renderer = TOOL_RENDERERS.get(call.name)
+        if renderer is None or call.name not in config.LLM_LOCAL_RENDER_TOOLS:
+            return None
+        if isinstance(result, dict) and "error" in result:
+            return None
+        try:
+            parts.append(renderer(result, dict(call.args or {})))
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+    return render_reply(parts)
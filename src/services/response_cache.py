@@ -0,0 +1,87 @@
+import hashlib
+import json
+import re
+from threading import Lock
+from typing import Any, Optional
+from ..config import config
+from .cache import TTLCache
+
+
+# Turns that mention the user themselves (or carry a conversation summary) may get an answer that
+# only fits this user, so they are never answered from or stored in the shared cache
+PERSONAL = re.compile(r"\b(i|i'm|i've|i'd|me|my|mine|myself|we|our|us|remember|name)\b", re.IGNORECASE)
+SUMMARY_PREFIX = "(Summary of our earlier conversation"
+
+# How long an answer built on a tool's result stays valid, in line with the observation caches
+TOOL_TTLS = {
+    "get_weather": config.OWM_CURRENT_TTL,
+    "get_forcast": config.OWM_FORECAST_TTL,
+    "get_air_quality": config.OWM_AIR_TTL,
+}
+
+
+def normalize_message(text: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the answer: "Hi!" == "hi" """
+    return " ".join(text.casefold().split()).rstrip("?!. ")
+
+
+def is_personalized(history: list) -> bool:
+    return any(msg["content"].startswith(SUMMARY_PREFIX) or (msg["role"] == "user" and PERSONAL.search(msg["content"]))
+               for msg in history)
+
+
+class ResponseCache:
+    """
+    Gemini responses shared across users, keyed on a hash of the normalized context window and of
+    the tool calls and results of the turn so far. Answers that used weather data expire with that
+    data (see TOOL_TTLS); everything else after LLM_CACHE_TTL. LRU-evicted beyond LLM_CACHE_SIZE.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name="llm_responses")
+        self._lock = Lock()
+        self.bypassed = 0
+        self.seconds_saved = 0.0
+
+    def key(self, history: list, rounds: list) -> Optional[str]:
+        """Cache key for the next call of a turn, or None when the turn must not be cached"""
+        if not config.LLM_CACHE or is_personalized(history):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        payload = {
+            "context": [[msg["role"], normalize_message(msg["content"])] for msg in history],
+            "rounds": rounds,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def ttl_for(self, rounds: list) -> float:
+        return min([self.ttl] + [TOOL_TTLS.get(name, self.ttl) for name, _, _ in rounds])
+
+    def get(self, key: Optional[str]) -> Any:
+        if key is None:
+            return None
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        response, seconds = entry
+        with self._lock:
+            self.seconds_saved += seconds
+        return response
+
+    def set(self, key: Optional[str], response: Any, seconds: float, ttl: float) -> None:
+        """Store a response with the time it took to generate, which a later hit saves"""
+        if key is not None:
+            self._cache.set(key, (response, seconds), ttl=ttl)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self.bypassed = 0
+        self.seconds_saved = 0.0
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "bypassed": self.bypassed, "seconds_saved": round(self.seconds_saved, 3)}
+
+
+response_cache = ResponseCache(maxsize=config.LLM_CACHE_SIZE, ttl=config.LLM_CACHE_TTL)
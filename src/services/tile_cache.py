@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import time
+from collections import OrderedDict
+from threading import Lock, get_ident
+from typing import Optional
+from fastapi import HTTPException
+from ..config import config, CommonTileProviders
+from .cache import SingleFlight
+from .http_client import get_http_client
+
+
+MAX_ZOOM = 19
+
+
+def tile_providers() -> dict:
+    """map_type name -> URL template with {z}/{x}/{y} placeholders, for the configured providers"""
+    providers = {
+        "standard": CommonTileProviders.STANDARD,
+        "satellite": CommonTileProviders.SATELLITE,
+        "terrain": CommonTileProviders.TERRAIN,
+    }
+    return {name: url for name, url in providers.items() if url}
+
+
+def tile_url(provider: str, z: int, x: int, y: int) -> str:
+    template = tile_providers().get(provider)
+    if template is None:
+        raise HTTPException(404, f"Unknown map type: {provider}")
+    return template.replace("{z}", str(z)).replace("{x}", str(x)).replace("{y}", str(y))
+
+
+def validate_tile(z: int, x: int, y: int) -> None:
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(404, "Tile out of range")
+
+
+def tile_media_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class TileStore:
+    """
+    Content-addressed on-disk tile cache.
+
+    Tile bodies are stored once per SHA-256 digest under objects/, so identical tiles (open sea,
+    empty land) share one file, and the digest doubles as the ETag. refs/{provider}/{z}/{x}/{y}
+    holds the digest of a tile; its mtime is when the tile was fetched, which decides freshness.
+    Objects are evicted least recently used first once they exceed max_bytes in total, and the
+    most recently read objects are kept memory-mapped.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float, hot_size: int = 256):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hot_size = hot_size
+        self._objects: OrderedDict = OrderedDict()  # digest -> size, least recently used first
+        self._hot: OrderedDict = OrderedDict()  # digest -> (mmap, file)
+        self._lock = Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.hot_hits = 0
+        self.evictions = 0
+        self._load()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest[2:])
+
+    def _ref_path(self, provider: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self.directory, "refs", provider, str(z), str(x), str(y))
+
+    def _load(self) -> None:
+        """Index the objects already on disk, oldest first"""
+        found = []
+        root = os.path.join(self.directory, "objects")
+        for prefix in os.listdir(root) if os.path.isdir(root) else []:
+            for name in os.listdir(os.path.join(root, prefix)):
+                stat = os.stat(os.path.join(root, prefix, name))
+                found.append((stat.st_mtime, prefix + name, stat.st_size))
+        for _, digest, size in sorted(found):
+            self._objects[digest] = size
+            self.bytes += size
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(temp, "wb") as file:
+            file.write(data)
+        os.replace(temp, path)
+
+    def lookup(self, provider: str, z: int, x: int, y: int) -> Optional[str]:
+        """Digest of the cached tile, or None if it is missing, stale or its object was evicted"""
+        path = self._ref_path(provider, z, x, y)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                self.misses += 1
+                return None
+            with open(path, "r") as file:
+                digest = file.read().strip()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        with self._lock:
+            if digest not in self._objects:
+                self.misses += 1
+                return None
+            self._objects.move_to_end(digest)
+            self.hits += 1
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        with self._lock:
+            entry = self._hot.get(digest)
+            if entry is not None:
+                self._hot.move_to_end(digest)
+                self.hot_hits += 1
+                return entry[0][:]
+        file = open(self._object_path(digest), "rb")
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            file.close()
+            return b""
+        data = mapped[:]
+        with self._lock:
+            if self.hot_size > 0 and digest not in self._hot:
+                self._hot[digest] = (mapped, file)
+                while len(self._hot) > self.hot_size:
+                    self._unmap(self._hot.popitem(last=False)[1])
+                return data
+        self._unmap((mapped, file))
+        return data
+
+    @staticmethod
+    def _unmap(entry: tuple) -> None:
+        mapped, file = entry
+        mapped.close()
+        file.close()
+
+    def put(self, provider: str, z: int, x: int, y: int, data: bytes) -> str:
+        """Store a tile body and point the tile's ref at it; returns its digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            known = digest in self._objects
+        if not known:
+            self._write(self._object_path(digest), data)
+        self._write(self._ref_path(provider, z, x, y), digest.encode())
+        with self._lock:
+            if digest not in self._objects:
+                self._objects[digest] = len(data)
+                self.bytes += len(data)
+            self._objects.move_to_end(digest)
+            self._evict(keep=digest)
+        return digest
+
+    def _evict(self, keep: str) -> None:
+        while self.bytes > self.max_bytes and len(self._objects) > 1:
+            digest, size = next(iter(self._objects.items()))
+            if digest == keep:
+                break
+            del self._objects[digest]
+            self.bytes -= size
+            self.evictions += 1
+            entry = self._hot.pop(digest, None)
+            if entry is not None:
+                self._unmap(entry)
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            while self._hot:
+                self._unmap(self._hot.popitem()[1])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "objects": len(self._objects),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hot": len(self._hot),
+            "hits": self.hits,
+            "hot_hits": self.hot_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_store: Optional[TileStore] = None
+tile_flight = SingleFlight()
+
+
+def get_tile_store() -> TileStore:
+    """The process-wide tile store, created on first use"""
+    global _store
+    if _store is None:
+        _store = TileStore(config.TILE_CACHE_DIR, config.TILE_CACHE_MAX_BYTES, config.TILE_CACHE_TTL,
+                           config.TILE_MMAP_HOT)
+    return _store
+
+
+def tile_store_stats() -> dict:
+    """Stats of the tile store without creating it (and its directories) just to report zeros"""
+    if _store is not None:
+        return _store.stats()
+    return {"objects": 0, "bytes": 0, "max_bytes": config.TILE_CACHE_MAX_BYTES, "hot": 0, "hits": 0,
+            "hot_hits": 0, "misses": 0, "evictions": 0, "hit_rate": 0.0}
+
+
+def set_tile_store(store: Optional[TileStore]) -> None:
+    global _store
+    if _store is not None and _store is not store:
+        _store.close()
+    _store = store
+
+
+async def _fetch_upstream(provider: str, z: int, x: int, y: int) -> bytes:
+    url = tile_url(provider, z, x, y)
+    try:
+        r = await get_http_client().get(url, headers={"User-Agent": config.TILE_USER_AGENT})
+    except Exception as e:
+        logging.warning(f"Tile fetch failed for {url}: {str(e)}")
+        raise HTTPException(502, "Tile provider unavailable")
+    if r.status_code == 404:
+        raise HTTPException(404, "Tile not found")
+    if r.status_code != 200:
+        logging.warning(f"Tile provider answered {r.status_code} for {url}")
+        raise HTTPException(502, "Tile provider error")
+    return r.content
+
+
+async def get_tile(provider: str, z: int, x: int, y: int) -> tuple[str, Optional[bytes]]:
+    """
+    Return (digest, body) for a tile, fetching and storing it on a miss. body is None when the
+    tile was already cached, so a conditional request can be answered without reading it.
+    """
+    tile_url(provider, z, x, y)  # unknown provider -> 404
+    validate_tile(z, x, y)
+    store = get_tile_store()
+    digest = await asyncio.to_thread(store.lookup, provider, z, x, y)
+    if digest is not None:
+        return digest, None
+
+    async def fetch():
+        data = await _fetch_upstream(provider, z, x, y)
+        return await asyncio.to_thread(store.put, provider, z, x, y, data), data
+
+    return await tile_flight.do((provider, z, x, y), fetch)
+
+
+async def read_tile(digest: str) -> bytes:
+    return await asyncio.to_thread(get_tile_store().read, digest)
@@ -0,0 +1,12 @@
+import json
+import math
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting prompts"""
+    return math.ceil(len(text) / 4)
+
+
+def payload_tokens(payload) -> int:
+    """Estimated tokens of a JSON-serializable value as it is sent to the model"""
+    return estimate_tokens(json.dumps(payload, ensure_ascii=False, default=str))
@@ -0,0 +1,60 @@
+import logging
+from threading import Lock
+from typing import Callable
+from .tokens import payload_tokens
+
+
+# Tool name -> function turning the tool's return value into the smaller payload sent to Gemini.
+# Tools without a view are sent as they are. Callers of the tools still get the full result.
+LLM_VIEWS: dict[str, Callable] = {}
+
+
+def llm_view(function_name: str):
+    """Declare the compact representation of a tool's result for the LLM"""
+    def register(view: Callable) -> Callable:
+        LLM_VIEWS[function_name] = view
+        return view
+    return register
+
+
+class ToolResultStats:
+    """Per-tool counts of estimated tokens returned by the tools and actually sent to the model"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._tools: dict = {}
+
+    def record(self, function_name: str, raw_tokens: int, sent_tokens: int) -> None:
+        with self._lock:
+            entry = self._tools.setdefault(function_name, {"calls": 0, "raw_tokens": 0, "sent_tokens": 0})
+            entry["calls"] += 1
+            entry["raw_tokens"] += raw_tokens
+            entry["sent_tokens"] += sent_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {**entry,
+                       "tokens_saved": entry["raw_tokens"] - entry["sent_tokens"],
+                       "avg_tokens_saved": round((entry["raw_tokens"] - entry["sent_tokens"]) / entry["calls"], 1)}
+                for name, entry in self._tools.items()
+            }
+
+
+tool_result_stats = ToolResultStats()
+
+
+def for_llm(function_name: str, result):
+    """The payload to send to the model for a tool result, recording how many tokens the view saved"""
+    view = LLM_VIEWS.get(function_name)
+    if view is None:
+        return result
+    try:
+        compact = view(result)
+    except Exception as e:
+        logging.warning(f"Compact view of {function_name} failed, sending the full result: {str(e)}")
+        return result
+    raw_tokens, sent_tokens = payload_tokens(result), payload_tokens(compact)
+    tool_result_stats.record(function_name, raw_tokens, sent_tokens)
+    logging.info(f"{function_name} result compacted from ~{raw_tokens} to ~{sent_tokens} tokens")
+    return compact
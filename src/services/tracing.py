@@ -0,0 +1,391 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import httpx
+import requests
+from ..config import config
+
+
+# Request tracing. span() opens a child of the current span (held in a ContextVar, so it follows
+# the request through awaits and into tasks it creates) and hands the finished span to the
+# configured exporter. TRACING_EXPORTER picks it: none (default), memory, file or otlp.
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes", "start_ns", "end_ns",
+                 "status", "error", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: str = "internal",
+                 attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.sampled = sampled
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class InMemoryExporter:
+    """Keeps the most recent finished spans; used by the tests and for ad-hoc debugging"""
+
+    def __init__(self, maxlen: int = 10000):
+        self.spans: deque = deque(maxlen=maxlen)
+
+    def export(self, spans: list) -> None:
+        self.spans.extend(spans)
+
+    def trace(self, trace_id: str) -> list:
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FileExporter:
+    """Appends spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: list) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans))
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """Sends spans to an OpenTelemetry collector with OTLP/HTTP JSON (POST {endpoint}/v1/traces)"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 10):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def payload(self, spans: list) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "weather-chatbot"}, "spans": [{
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                "name": span.name,
+                "kind": SPAN_KINDS[span.kind],
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1},
+            } for span in spans]}],
+        }]}
+
+    def export(self, spans: list) -> None:
+        response = self.session.post(self.url, json=self.payload(spans), timeout=self.timeout)
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        self.session.close()
+
+
+class BatchSpanProcessor:
+    """
+    Hands finished spans to a slow exporter (file, network) from a background thread, in batches,
+    so request handling never waits on it. When the queue is full new spans are dropped.
+    """
+
+    def __init__(self, exporter, batch_size: int = 256, interval: float = 2.0, max_queue: int = 10000):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> list:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: list) -> None:
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logging.warning(f"Exporting {len(batch)} spans failed: {str(e)}")
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._stopping.wait(self.interval)
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self._export(batch)
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        self._thread.join(timeout=10)
+        while batch := self._drain():
+            self._export(batch)
+        self.exporter.shutdown()
+
+    def stats(self) -> dict:
+        return {"exported": self.exported, "dropped": self.dropped, "failed": self.failed,
+                "queued": self._queue.qsize()}
+
+
+class SimpleSpanProcessor:
+    """Exports every span as soon as it ends (in-memory exporter)"""
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def on_end(self, span: Span) -> None:
+        self.exporter.export([span])
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+    def stats(self) -> dict:
+        return {}
+
+
+class Tracer:
+    def __init__(self):
+        self.processor = None
+        self.sample_rate = 1.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    def configure(self, processor, sample_rate: float = 1.0) -> None:
+        if self.processor is not None and self.processor is not processor:
+            self.processor.shutdown()
+        self.processor = processor
+        self.sample_rate = sample_rate
+
+    def start(self, name: str, kind: str = "internal", parent: Optional[tuple] = None, **attributes) -> Span:
+        """
+        Start a span under the current one. A root span starts a new trace, or continues the one
+        given as parent (trace_id, span_id, sampled) from an incoming traceparent header.
+        """
+        current = _current.get()
+        if current is not None:
+            return Span(name, current.trace_id, current.span_id, current.sampled, kind, attributes)
+        if parent is not None:
+            return Span(name, parent[0], parent[1], parent[2], kind, attributes)
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        return Span(name, f"{random.getrandbits(128):032x}", None, sampled, kind, attributes)
+
+    def end(self, span: Span) -> None:
+        span.end_ns = time.time_ns()
+        if span.sampled and self.processor is not None:
+            self.processor.on_end(span)
+
+    def shutdown(self) -> None:
+        self.configure(None)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate,
+                **(self.processor.stats() if self.processor is not None else {})}
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", parent: Optional[tuple] = None, **attributes):
+    """Trace the block as a child span of the current one; yields None when tracing is off"""
+    if not tracer.enabled:
+        yield None
+        return
+    current = tracer.start(name, kind, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        tracer.end(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header"""
+    match = TRACEPARENT.match(header.strip().lower()) if header else None
+    if match is None or match[1] == "0" * 32:
+        return None
+    return match[1], match[2], bool(int(match[3], 16) & 1)
+
+
+def traceparent(current: Span) -> str:
+    return f"00-{current.trace_id}-{current.span_id}-{'01' if current.sampled else '00'}"
+
+
+def configure_tracing() -> None:
+    """Set up the exporter chosen by TRACING_EXPORTER"""
+    exporter = config.TRACING_EXPORTER
+    if exporter == "memory":
+        processor = SimpleSpanProcessor(InMemoryExporter())
+    elif exporter == "file":
+        processor = BatchSpanProcessor(FileExporter(config.TRACING_FILE))
+    elif exporter == "otlp":
+        processor = BatchSpanProcessor(OTLPExporter(config.OTLP_ENDPOINT, config.TRACING_SERVICE_NAME))
+    else:
+        processor = None
+    tracer.configure(processor, config.TRACING_SAMPLE_RATE)
+    if processor is not None:
+        logging.info(f"Tracing enabled ({exporter}, sample rate {config.TRACING_SAMPLE_RATE})")
+
+
+_base_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs) -> logging.LogRecord:
+    record = _base_record_factory(*args, **kwargs)
+    current = _current.get()
+    record.trace_id = current.trace_id if current is not None else "-"
+    record.span_id = current.span_id if current is not None else "-"
+    return record
+
+
+def install_log_trace_ids() -> None:
+    """Give every log record trace_id and span_id attributes, for %(trace_id)s in log formats"""
+    logging.setLogRecordFactory(_record_factory)
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport wrapper: a client span per upstream request. traceparent is only sent to
+    TRACING_PROPAGATE_HOSTS, so trace ids are not leaked to third-party APIs.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with span(f"HTTP {request.method} {request.url.host}", kind="client", **{
+            "http.method": request.method, "http.url": str(request.url.copy_with(query=None)),
+        }) as current:
+            if current is not None and request.url.host.lower() in config.TRACING_PROPAGATE_HOSTS:
+                request.headers["traceparent"] = traceparent(current)
+            response = await self.transport.handle_async_request(request)
+            if current is not None:
+                current.set_attribute("http.status_code", response.status_code)
+            return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request; the trace id is returned as X-Trace-Id"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        with span(f"{scope['method']} {scope['path']}", kind="server", parent=parent,
+                  **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    root.set_attribute("http.status_code", message["status"])
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", root.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                root.name = f"{scope['method']} {route}"
+                root.set_attribute("http.route", route)
@@ -1,126 +1,342 @@
-from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import copy
+import json
 import requests
 from fastapi import HTTPException
 import logging
 import math
-from ..config import config, CommonTileProviders
+from typing import Optional
+from ..config import config, SessionLocal
+from ..models.schemas import AirQualityDigest
+from ..models.users import GeocodeEntry
+from .cache import TTLCache
+from .tile_cache import tile_url
+from .tool_results import llm_view
+
+
+# Geocoding cache, keyed on the normalized location string.
+# A cached value of None records a "Location not found" answer.
+geocode_cache = TTLCache(maxsize=config.GEOCODE_CACHE_SIZE, ttl=config.GEOCODE_CACHE_TTL, name="geocode")
+NOT_CACHED = object()
+
+
+# Observation cache for current weather, forecast and air quality, keyed on
+# (kind, rounded lat, rounded lon). Payloads are always stored in metric units.
+observation_cache = TTLCache(maxsize=config.OBSERVATION_CACHE_SIZE, ttl=config.OWM_CURRENT_TTL,
+                             name="observations")
+OBSERVATION_TTLS = {
+    "current": config.OWM_CURRENT_TTL,
+    "forecast": config.OWM_FORECAST_TTL,
+    "air": config.OWM_AIR_TTL,
+}
+
+
+def normalize_location(location: str) -> str:
+    """Normalize a location string so 'Berlin', ' berlin ' and 'BERLIN' share one cache entry"""
+    return " ".join(location.strip().lower().split())
+
+
+def _entry_item(key: str, entry: Optional[GeocodeEntry]):
+    """Turn a stored geocode row into a cached item, or NOT_CACHED if absent or expired"""
+    if entry is None or entry.expires_at <= datetime.utcnow():
+        return NOT_CACHED
+    remaining = (entry.expires_at - datetime.utcnow()).total_seconds()
+    item = json.loads(entry.payload) if entry.payload is not None else None
+    geocode_cache.set(key, item, ttl=remaining)
+    return item
+
+
+def _new_entry(key: str, item, ttl: int) -> GeocodeEntry:
+    return GeocodeEntry(
+        key=key,
+        payload=json.dumps(item) if item is not None else None,
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+    )
+
+
+def _load_persisted_geocode(key: str):
+    """Read a geocode result from the on-disk store, or NOT_CACHED if absent or expired"""
+    db = SessionLocal()
+    try:
+        return _entry_item(key, db.get(GeocodeEntry, key))
+    except Exception as e:
+        logging.warning(f"Geocode store read failed for {key}: {str(e)}")
+        return NOT_CACHED
+    finally:
+        db.close()
+
+
+def _persist_geocode(key: str, item, ttl: int) -> None:
+    db = SessionLocal()
+    try:
+        db.merge(_new_entry(key, item, ttl))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.warning(f"Geocode store write failed for {key}: {str(e)}")
+    finally:
+        db.close()
+
+
+def geocode_ttl(item) -> int:
+    return config.GEOCODE_CACHE_TTL if item is not None else config.GEOCODE_NEGATIVE_TTL
+
+
+def cached_geocode(location: str):
+    """
+    Look up a location in the geocode cache (memory first, then the optional on-disk store).
+    Returns NOT_CACHED on a miss and raises 404 for a cached "Location not found".
+    """
+    key = normalize_location(location)
+    item = geocode_cache.get(key, NOT_CACHED)
+    if item is NOT_CACHED and config.GEOCODE_CACHE_PERSIST:
+        item = _load_persisted_geocode(key)
+    if item is None:
+        raise HTTPException(404, "Location not found")
+    return item
+
+
+def store_geocode(location: str, item) -> None:
+    """Cache a geocode result; item=None records a negative ("Location not found") answer"""
+    key = normalize_location(location)
+    geocode_cache.set(key, item, ttl=geocode_ttl(item))
+    if config.GEOCODE_CACHE_PERSIST:
+        _persist_geocode(key, item, geocode_ttl(item))
 
 
 def geocode(location: str) -> dict:
     """
     This function uses OpenWeatherMap geocoding API to convert a place name into latitude/longitude.
     """
+    item = cached_geocode(location)
+    if item is not NOT_CACHED:
+        return item
     params = {"q": location, "limit": 1, "appid": config.OWM_KEY}
-    r = requests.get(config.OWM_URL, params=params, timeout=20)
+    r = requests.get(config.OWM_URL, params=params, timeout=config.HTTP_TIMEOUT)
     r.raise_for_status()
     items = r.json()
     if not items:
+        store_geocode(location, None)
         raise HTTPException(404, "Location not found")
     item = items[0]
+    store_geocode(location, item)
     logging.info(f"get the latitude and longitude for {location}")
     return item
 
 
-def get_weather(location: str, units: str) -> list[dict]:
-    """
-    This function uses OWM_CURRENT to fetch current weather data.
-    """
-    coordinates = geocode(location)
-    latitude = float(coordinates["lat"])
-    longitude = float(coordinates["lon"])
-    u = "imperial" if units=="F" else "metric"
-    params = {"lat": latitude, "lon": longitude, "appid": config.OWM_KEY, "units": u}
-    r = requests.get(config.OWM_CURRENT, params=params, timeout=20)
-    r.raise_for_status()
-    weather = r.json()
+def observation_key(kind: str, coordinates: dict) -> tuple:
+    precision = config.OBSERVATION_PRECISION
+    return (kind, round(float(coordinates["lat"]), precision), round(float(coordinates["lon"]), precision))
+
+
+def observation_params(coordinates: dict, kind: str) -> dict:
+    params = {"lat": float(coordinates["lat"]), "lon": float(coordinates["lon"]), "appid": config.OWM_KEY}
+    if kind != "air":
+        params["units"] = "metric"
+    return params
+
+
+def _convert_main(entry: dict) -> None:
+    main = entry.get("main", {})
+    for field in ("temp", "feels_like", "temp_min", "temp_max"):
+        if field in main:
+            main[field] = main[field] * 9 / 5 + 32
+    wind = entry.get("wind", {})
+    for field in ("speed", "gust"):
+        if field in wind:
+            wind[field] = wind[field] * 2.23694  # m/s -> mph
+
+
+def to_units(payload: dict, kind: str, units: str) -> dict:
+    """Convert a cached metric payload to the requested units ("C" returns it as is)"""
+    if units != "F" or kind == "air":
+        return payload
+    payload = copy.deepcopy(payload)
+    if kind == "current":
+        _convert_main(payload)
+    else:
+        for entry in payload.get("list", []):
+            _convert_main(entry)
+    return payload
+
+
+def fetch_observation(kind: str, url: str, coordinates: dict) -> dict:
+    """Return the metric OWM payload for a location, from the observation cache when fresh"""
+    key = observation_key(kind, coordinates)
+    payload = observation_cache.get(key, NOT_CACHED)
+    if payload is NOT_CACHED:
+        r = requests.get(url, params=observation_params(coordinates, kind), timeout=config.HTTP_TIMEOUT)
+        r.raise_for_status()
+        payload = r.json()
+        observation_cache.set(key, payload, ttl=OBSERVATION_TTLS[kind])
+    return payload
+
+
+def build_weather_reply(location: str, weather: dict, units: str) -> list[dict]:
+    """Turn an OWM current-weather payload into the tool result"""
     main = weather["weather"][0]["description"].capitalize()
     temp = round(weather["main"]["temp"])
     reply = f"{location}: {main}, {temp}{units}"
     follow_up_message = "would you like to know the 5 days forecast"
-    logging.info(f"get the current weather for {location}")
     return [{
         "weather": reply,
         "followups": follow_up_message
     }]
 
-def get_forcast(location: str, units: str):
+
+def build_forecast(raw: dict, units: str) -> list[str]:
     """
-    This function uses OWM_FORECAST to fetch 5-day weather forecast data.
+    Aggregate the 3-hourly OWM forecast entries into at most five daily lines. Entries are bucketed
+    by the location's local day (city.timezone, seconds east of UTC) and each day reports the mean,
+    low and high temperature, its dominant condition, the highest precipitation probability and the
+    strongest wind.
     """
-    coordinates = geocode(location)
-    latitude = float(coordinates["lat"])
-    longitude = float(coordinates["lon"])
-    u = "metric" if units=="C" else "imperial"
-    params = {"lat": latitude, "lon": longitude, "appid": config.OWM_KEY, "units": u}
-    r = requests.get(config.OWM_FORECAST, params=params, timeout=20)
-    r.raise_for_status()
-    raw =r.json()
-    daily = defaultdict(list)
-    for entry in raw["list"]:
-        dt = datetime.fromtimestamp(entry["dt"])
-        date_key = dt.strftime("%Y-%m-%d")
+    offset = raw.get("city", {}).get("timezone", 0)
+    daily: dict[int, dict] = {}
+    for entry in raw.get("list", []):
+        local = entry["dt"] + offset
         temp = entry["main"]["temp"]
-        desc = entry["weather"][0]["description"]
-        daily[date_key].append((temp, desc, dt))
+        day = daily.setdefault(local // 86400, {"temps": [], "conditions": {}, "pop": None, "wind": None})
+        day["temps"].append(temp)
+        # Dominant condition: most frequent description of the day, ties go to the one nearest local noon
+        noon_closeness = 1 - abs((local % 86400) / 3600 - 12) / 12
+        votes = day["conditions"].setdefault(entry["weather"][0]["description"], [0, 0.0])
+        votes[0] += 1
+        votes[1] = max(votes[1], noon_closeness)
+        pop = entry.get("pop")
+        if pop is not None and (day["pop"] is None or pop > day["pop"]):
+            day["pop"] = pop
+        wind = entry.get("wind", {}).get("speed")
+        if wind is not None and (day["wind"] is None or wind > day["wind"]):
+            day["wind"] = wind
+
+    speed_unit = "mph" if units == "F" else "m/s"
     weather_forecast = []
-    for i, (date_key, items) in enumerate(sorted(daily.items())):
-        if i >= 5:
-            break
-        avg_temp = round(sum(t for t, _, _ in items) / len(items))
-        _, main_desc, dt = items[len(items) // 2]  # midday description
-        day_label = dt.strftime("%A %Y-%m-%d")
-        weather_forecast.append(f"{day_label}: {main_desc}, {avg_temp}°{units}\n")
-    logging.info(f"get the forecast for {location}")
+    for day_number in sorted(daily)[:5]:
+        day = daily[day_number]
+        temps = day["temps"]
+        dominant = max(day["conditions"].items(), key=lambda item: tuple(item[1]))[0]
+        day_label = datetime.fromtimestamp(day_number * 86400, tz=timezone.utc).strftime("%A %Y-%m-%d")
+        line = (f"{day_label}: {dominant}, {round(sum(temps) / len(temps))}°{units} "
+                f"(low {round(min(temps))}°{units}, high {round(max(temps))}°{units})")
+        if day["pop"] is not None:
+            line += f", {round(day['pop'] * 100)}% chance of precipitation"
+        if day["wind"] is not None:
+            line += f", wind up to {day['wind']:.1f} {speed_unit}"
+        weather_forecast.append(line + "\n")
     return weather_forecast
 
-def get_air_quality(location: str) -> list[dict]:
-    """
-    This function uses OWM_AIR to fetch air quality data.
-    """
-    coordinates = geocode(location)
-    latitude = float(coordinates["lat"])
-    longitude = float(coordinates["lon"])
-    params = {"lat": latitude, "lon": longitude, "appid": config.OWM_KEY}
-    r = requests.get(config.OWM_AIR, params=params, timeout=20)
 
-    r.raise_for_status()
-    data = r.json()
+def build_air_quality(data: dict) -> list[dict]:
     follow_up_message = "would you like to provide you with the coordinates for the location"
-    logging.info(f"get the air quality data for {location}")
     return [{
         "air-quality": data,
         "followups": follow_up_message
     }]
 
 
-def get_map_tile_url(location: str, zoom: int = 10,
-                     map_type: str = CommonTileProviders.STANDARD) -> dict:
+AQI_CATEGORIES = {1: "Good", 2: "Fair", 3: "Moderate", 4: "Poor", 5: "Very Poor"}
+
+# Upper bounds (μg/m³) of the Good, Fair, Moderate and Poor bands of the OWM air quality index
+POLLUTANT_BANDS = {
+    "pm2_5": (10, 25, 50, 75),
+    "pm10": (20, 50, 100, 200),
+    "o3": (60, 100, 140, 180),
+    "no2": (40, 70, 150, 200),
+    "so2": (20, 80, 250, 350),
+    "co": (4400, 9400, 12400, 15400),
+}
+
+
+def air_quality_digest(data: dict) -> AirQualityDigest:
     """
-    This function generates a map tile URL for a given location using common tile providers.
+    Reduce an OWM air pollution payload to the AQI, its category, the pollutant driving it (the one
+    in the worst band, then the furthest above its Good limit) and the indexed concentrations.
     """
-    coordinates = geocode(location)
-    latitude = float(coordinates["lat"])
-    longitude = float(coordinates["lon"])
+    entries = data.get("list") or []
+    if not entries:
+        return AirQualityDigest()
+    entry = entries[0]
+    aqi = entry.get("main", {}).get("aqi")
+    components = entry.get("components", {})
+    concentrations = {name: round(float(components[name]), 1) for name in POLLUTANT_BANDS if name in components}
 
-    def deg2num(lat_deg, lon_deg, zoom):
-        lat_rad = math.radians(lat_deg)
-        n = 2.0 ** zoom
-        xtile = int((lon_deg + 180.0) / 360.0 * n)
-        ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
-        return (xtile, ytile)
+    def severity(name: str) -> tuple:
+        bands = POLLUTANT_BANDS[name]
+        value = concentrations[name]
+        return sum(value >= bound for bound in bands), value / bands[0]
 
-    x, y = deg2num(latitude, longitude, zoom)
+    dominant = max(concentrations, key=severity) if concentrations else None
+    return AirQualityDigest(aqi=aqi, category=AQI_CATEGORIES.get(aqi, "Unknown"), dominant_pollutant=dominant,
+                            concentrations=concentrations)
 
-    base_url = CommonTileProviders.STANDARD
-    tile_url = base_url.replace("{z}", str(zoom)).replace("{x}", str(x)).replace("{y}", str(y))
-    logging.info(f"get the map tile URL for {location}")
+
+@llm_view("get_air_quality")
+def compact_air_quality(result: list[dict]) -> list[dict]:
+    """The model gets the digest rather than the raw payload returned by get_air_quality"""
+    return [{**item, "air-quality": air_quality_digest(item["air-quality"]).model_dump(exclude_none=True)}
+            for item in result]
+
+
+def deg2num(lat_deg: float, lon_deg: float, zoom: int) -> tuple[int, int]:
+    """Convert latitude/longitude to slippy-map tile numbers"""
+    lat_rad = math.radians(lat_deg)
+    n = 2.0 ** zoom
+    xtile = int((lon_deg + 180.0) / 360.0 * n)
+    ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return (xtile, ytile)
+
+
+def build_map_tile(latitude: float, longitude: float, zoom: int, map_type: str) -> dict:
+    map_type = (map_type or "standard").lower()
+    zoom = int(zoom)
+    x, y = deg2num(latitude, longitude, zoom)
     return {
-        "tile_url": tile_url,
+        "tile_url": tile_url(map_type, zoom, x, y),
+        "proxy_url": f"/tiles/{map_type}/{zoom}/{x}/{y}",
         "latitude": latitude,
         "longitude": longitude,
         "zoom": zoom,
         "tile_x": x,
         "tile_y": y,
         "map_type": map_type
-    }
\ No newline at end of file
+    }
+
+
+def get_weather(location: str, units: str) -> list[dict]:
+    """
+    This function uses OWM_CURRENT to fetch current weather data.
+    """
+    coordinates = geocode(location)
+    weather = to_units(fetch_observation("current", config.OWM_CURRENT, coordinates), "current", units)
+    logging.info(f"get the current weather for {location}")
+    return build_weather_reply(location, weather, units)
+
+def get_forcast(location: str, units: str):
+    """
+    This function uses OWM_FORECAST to fetch 5-day weather forecast data.
+    """
+    coordinates = geocode(location)
+    raw = to_units(fetch_observation("forecast", config.OWM_FORECAST, coordinates), "forecast", units)
+    logging.info(f"get the forecast for {location}")
+    return build_forecast(raw, units)
+
+def get_air_quality(location: str) -> list[dict]:
+    """
+    This function uses OWM_AIR to fetch air quality data.
+    """
+    coordinates = geocode(location)
+    data = fetch_observation("air", config.OWM_AIR, coordinates)
+    logging.info(f"get the air quality data for {location}")
+    return build_air_quality(data)
+
+
+def get_map_tile_url(location: str, zoom: int = 10, map_type: str = "standard") -> dict:
+    """
+    This function generates a map tile URL for a given location using common tile providers.
+    """
+    coordinates = geocode(location)
+    latitude = float(coordinates["lat"])
+    longitude = float(coordinates["lon"])
+    logging.info(f"get the map tile URL for {location}")
+    return build_map_tile(latitude, longitude, zoom, map_type)
@@ -0,0 +1,147 @@
+import logging
+import time
+from fastapi import HTTPException
+from ..config import config, AsyncSessionLocal
+from ..models.users import GeocodeEntry
+from .cache import SingleFlight
+from .http_client import get_http_client
+from .metrics import OWM_ERRORS, OWM_REQUEST
+from .weather_service import NOT_CACHED, OBSERVATION_TTLS, geocode_cache, geocode_ttl, normalize_location, \
+    _entry_item, _new_entry, observation_cache, observation_key, observation_params, to_units, build_weather_reply, build_forecast, \
+    build_air_quality, build_map_tile
+
+
+# Non-blocking counterparts of the functions in weather_service.py.
+# They share its caches and payload handling but go through the pooled httpx client.
+
+# Concurrent cache misses for the same key share a single upstream request
+inflight = SingleFlight()
+
+
+async def _get_json(url: str, params: dict, endpoint: str):
+    started = time.perf_counter()
+    try:
+        r = await get_http_client().get(url, params=params)
+        r.raise_for_status()
+        return r.json()
+    except Exception:
+        OWM_ERRORS.labels(endpoint).inc()
+        raise
+    finally:
+        OWM_REQUEST.labels(endpoint).observe(time.perf_counter() - started)
+
+
+async def _load_persisted_geocode(key: str):
+    """Read a geocode result from the on-disk store, or NOT_CACHED if absent or expired"""
+    try:
+        async with AsyncSessionLocal() as db:
+            return _entry_item(key, await db.get(GeocodeEntry, key))
+    except Exception as e:
+        logging.warning(f"Geocode store read failed for {key}: {str(e)}")
+        return NOT_CACHED
+
+
+async def _persist_geocode(key: str, item, ttl: int) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.merge(_new_entry(key, item, ttl))
+            await db.commit()
+    except Exception as e:
+        logging.warning(f"Geocode store write failed for {key}: {str(e)}")
+
+
+async def cached_geocode(location: str):
+    """
+    Look up a location in the geocode cache (memory first, then the optional on-disk store).
+    Returns NOT_CACHED on a miss and raises 404 for a cached "Location not found".
+    """
+    key = normalize_location(location)
+    item = geocode_cache.get(key, NOT_CACHED)
+    if item is NOT_CACHED and config.GEOCODE_CACHE_PERSIST:
+        item = await _load_persisted_geocode(key)
+    if item is None:
+        raise HTTPException(404, "Location not found")
+    return item
+
+
+async def store_geocode(location: str, item) -> None:
+    """Cache a geocode result; item=None records a negative ("Location not found") answer"""
+    key = normalize_location(location)
+    geocode_cache.set(key, item, ttl=geocode_ttl(item))
+    if config.GEOCODE_CACHE_PERSIST:
+        await _persist_geocode(key, item, geocode_ttl(item))
+
+
+async def geocode(location: str) -> dict:
+    """
+    This function uses OpenWeatherMap geocoding API to convert a place name into latitude/longitude.
+    """
+    item = await cached_geocode(location)
+    if item is not NOT_CACHED:
+        return item
+
+    async def fetch():
+        params = {"q": location, "limit": 1, "appid": config.OWM_KEY}
+        items = await _get_json(config.OWM_URL, params, "geocode")
+        await store_geocode(location, items[0] if items else None)
+        logging.info(f"get the latitude and longitude for {location}")
+        return items[0] if items else None
+
+    item = await inflight.do(("geocode", normalize_location(location)), fetch)
+    if item is None:
+        raise HTTPException(404, "Location not found")
+    return item
+
+
+async def fetch_observation(kind: str, url: str, coordinates: dict) -> dict:
+    """Return the metric OWM payload for a location, from the observation cache when fresh"""
+    key = observation_key(kind, coordinates)
+    payload = observation_cache.get(key, NOT_CACHED)
+    if payload is not NOT_CACHED:
+        return payload
+
+    async def fetch():
+        payload = await _get_json(url, observation_params(coordinates, kind), kind)
+        observation_cache.set(key, payload, ttl=OBSERVATION_TTLS[kind])
+        return payload
+
+    return await inflight.do(key, fetch)
+
+
+async def get_weather(location: str, units: str) -> list[dict]:
+    """
+    This function uses OWM_CURRENT to fetch current weather data.
+    """
+    coordinates = await geocode(location)
+    weather = to_units(await fetch_observation("current", config.OWM_CURRENT, coordinates), "current", units)
+    logging.info(f"get the current weather for {location}")
+    return build_weather_reply(location, weather, units)
+
+
+async def get_forcast(location: str, units: str):
+    """
+    This function uses OWM_FORECAST to fetch 5-day weather forecast data.
+    """
+    coordinates = await geocode(location)
+    raw = to_units(await fetch_observation("forecast", config.OWM_FORECAST, coordinates), "forecast", units)
+    logging.info(f"get the forecast for {location}")
+    return build_forecast(raw, units)
+
+
+async def get_air_quality(location: str) -> list[dict]:
+    """
+    This function uses OWM_AIR to fetch air quality data.
+    """
+    coordinates = await geocode(location)
+    data = await fetch_observation("air", config.OWM_AIR, coordinates)
+    logging.info(f"get the air quality data for {location}")
+    return build_air_quality(data)
+
+
+async def get_map_tile_url(location: str, zoom: int = 10, map_type: str = "standard") -> dict:
+    """
+    This function generates a map tile URL for a given location using common tile providers.
+    """
+    coordinates = await geocode(location)
+    logging.info(f"get the map tile URL for {location}")
+    return build_map_tile(float(coordinates["lat"]), float(coordinates["lon"]), zoom, map_type)
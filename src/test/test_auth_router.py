@@ -0,0 +1,45 @@
+import unittest
+import uuid
+from fastapi.testclient import TestClient
+from ..app import app
+from ..config import SessionLocal
+from ..models.users import User
+from ..services.helper import hash_password
+from ..models.migrations import run_migrations
+
+
+def setUpModule():
+    run_migrations()
+
+
+class TestLogin(unittest.TestCase):
+    def setUp(self):
+        self.db = SessionLocal()
+        self.user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", username="login",
+                         hashed_password=hash_password("correct horse"), is_verified=False)
+        self.db.add(self.user)
+        self.db.commit()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.db.delete(self.user)
+        self.db.commit()
+        self.db.close()
+
+    def login(self, password: str):
+        return self.client.post("/login", json={"email": self.user.email, "password": password})
+
+    def test_wrong_password_is_rejected(self):
+        self.assertEqual(self.login("wrong horse").status_code, 401)
+
+    def test_unverified_user_is_rejected(self):
+        response = self.login("correct horse")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["detail"], "Please verify your account to login")
+
+    def test_verified_user_gets_a_token(self):
+        self.user.is_verified = True
+        self.db.commit()
+        response = self.login("correct horse")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user_id"], self.user.id)
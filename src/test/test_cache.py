@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+from fastapi import HTTPException
+from ..services.cache import TTLCache, SingleFlight
+from ..config import config, SessionLocal
+from ..models.users import GeocodeEntry
+from ..services.weather_service import geocode, geocode_cache, observation_cache
+from ..models.migrations import run_migrations
+
+
+def setUpModule():
+    run_migrations()
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now least recently used
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expiry(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        with patch('src.services.cache.time.monotonic', return_value=1000.0):
+            cache.set("a", 1)
+        with patch('src.services.cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get("a"), 1)
+        with patch('src.services.cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_leader_hands_over_to_a_follower(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "sunny"
+
+        leader = asyncio.create_task(flight.do("berlin", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do("berlin", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        self.assertEqual(await asyncio.gather(*followers), ["sunny"] * 3)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(len(calls), 2)
+
+    async def test_cancelled_follower_leaves_the_leader_running(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            return "sunny"
+
+        leader = asyncio.create_task(flight.do("berlin", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("berlin", fetch))
+        await asyncio.sleep(0)
+        follower.cancel()
+
+        self.assertEqual(await leader, "sunny")
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+
+
+class TestGeocodeCache(unittest.TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        observation_cache.clear()
+
+    def test_geocode_is_cached_on_normalized_location(self):
+        with patch('src.services.weather_service.requests.get') as mock_get:
+            mock_response = Mock()
+            mock_response.json.return_value = [{"name": "Berlin", "lat": 52.52, "lon": 13.405, "country": "DE"}]
+            mock_response.raise_for_status = Mock()
+            mock_get.return_value = mock_response
+
+            geocode("Berlin")
+            result = geocode("  BERLIN ")
+            self.assertEqual(result["lat"], 52.52)
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertEqual(geocode_cache.stats()["hits"], 1)
+
+    def test_location_not_found_is_negatively_cached(self):
+        with patch('src.services.weather_service.requests.get') as mock_get:
+            mock_response = Mock()
+            mock_response.json.return_value = []
+            mock_response.raise_for_status = Mock()
+            mock_get.return_value = mock_response
+
+            for _ in range(2):
+                with self.assertRaises(HTTPException) as ctx:
+                    geocode("Atlantis")
+                self.assertEqual(ctx.exception.status_code, 404)
+            self.assertEqual(mock_get.call_count, 1)
+
+    def test_persistent_store_survives_memory_clear(self):
+        db = SessionLocal()
+        db.query(GeocodeEntry).delete()
+        db.commit()
+        db.close()
+        with patch.object(config, "GEOCODE_CACHE_PERSIST", True), \
+                patch('src.services.weather_service.requests.get') as mock_get:
+            mock_response = Mock()
+            mock_response.json.return_value = [{"name": "Suhl", "lat": 50.61, "lon": 10.69, "country": "DE"}]
+            mock_response.raise_for_status = Mock()
+            mock_get.return_value = mock_response
+
+            geocode("Suhl")
+            geocode_cache.clear()  # simulate a restart
+            result = geocode("Suhl")
+            self.assertEqual(result["lon"], 10.69)
+            self.assertEqual(mock_get.call_count, 1)
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from ..app import app
+from ..config import SessionLocal, config
+from ..models.schemas import CurrentUser
+from ..models.users import User, ChatSession, ChatMessage
+from ..services.helper import get_current_user
+from ..services.persistence import message_writer
+from ..models.migrations import run_migrations
+
+
+def setUpModule():
+    run_migrations()
+
+
+class TestSessionEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.db = SessionLocal()
+        self.user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", username="router",
+                         hashed_password="x")
+        self.db.add(self.user)
+        start = datetime(2025, 1, 1)
+        for i in range(5):
+            session = ChatSession(user_id=self.user.id, title=f"session {i}", updated_at=start + timedelta(hours=i))
+            session.messages = [ChatMessage(role="user", content=f"message {j}") for j in range(i)]
+            self.db.add(session)
+        self.db.commit()
+
+        principal = CurrentUser.model_validate(self.user)
+        app.dependency_overrides[get_current_user] = lambda: principal
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.db.delete(self.user)
+        self.db.commit()
+        self.db.close()
+
+    def test_sessions_are_paginated_with_message_counts(self):
+        first = self.client.get("/sessions", params={"limit": 2}).json()
+        self.assertEqual(first["total"], 5)
+        self.assertEqual([s["title"] for s in first["sessions"]], ["session 4", "session 3"])
+        self.assertEqual([s["message_count"] for s in first["sessions"]], [4, 3])
+
+        second = self.client.get("/sessions", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+        third = self.client.get("/sessions", params={"limit": 2, "cursor": second["next_cursor"]}).json()
+        self.assertEqual([s["title"] for s in second["sessions"]], ["session 2", "session 1"])
+        self.assertEqual([s["message_count"] for s in third["sessions"]], [0])
+        self.assertIsNone(third["next_cursor"])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get("/sessions", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestSessionMessages(unittest.TestCase):
+    def setUp(self):
+        self.db = SessionLocal()
+        self.user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", username="router",
+                         hashed_password="x")
+        start = datetime(2025, 1, 1)
+        self.session = ChatSession(user_id=self.user.id, title="long")
+        self.session.messages = [
+            ChatMessage(role="user", content=f"message {i}", created_at=start + timedelta(minutes=i))
+            for i in range(7)
+        ]
+        self.db.add_all([self.user, self.session])
+        self.db.commit()
+
+        principal = CurrentUser.model_validate(self.user)
+        app.dependency_overrides[get_current_user] = lambda: principal
+        self.client = TestClient(app)
+        self.url = f"/sessions/{self.session.id}"
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.db.delete(self.user)
+        self.db.commit()
+        self.db.close()
+
+    def contents(self, page: dict) -> list:
+        return [m["content"] for m in page["messages"]]
+
+    def test_after_and_before_cursors(self):
+        first = self.client.get(self.url, params={"limit": 3}).json()
+        self.assertEqual(self.contents(first), ["message 0", "message 1", "message 2"])
+        self.assertIsNone(first["prev_cursor"])
+
+        second = self.client.get(self.url, params={"limit": 3, "after": first["next_cursor"]}).json()
+        self.assertEqual(self.contents(second), ["message 3", "message 4", "message 5"])
+
+        back = self.client.get(self.url, params={"limit": 2, "before": second["prev_cursor"]}).json()
+        self.assertEqual(self.contents(back), ["message 1", "message 2"])
+
+        last = self.client.get(self.url, params={"limit": 3, "after": second["next_cursor"]}).json()
+        self.assertEqual(self.contents(last), ["message 6"])
+        self.assertIsNone(last["next_cursor"])
+
+    def test_full_history_without_limit_or_cursor(self):
+        body = self.client.get(self.url).json()
+        self.assertEqual(self.contents(body), [f"message {i}" for i in range(7)])
+        self.assertIsNone(body["next_cursor"])
+        self.assertIsNone(body["prev_cursor"])
+
+    def test_ndjson_stream(self):
+        with patch.object(config, "MESSAGE_STREAM_BATCH", 2):
+            response = self.client.get(self.url, params={"format": "ndjson"})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        self.assertEqual(lines[0]["title"], "long")
+        self.assertEqual([line["content"] for line in lines[1:]], [f"message {i}" for i in range(7)])
+
+
+class TestChatTurn(unittest.TestCase):
+    def setUp(self):
+        self.db = SessionLocal()
+        self.user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", username="router",
+                         hashed_password="x")
+        self.db.add(self.user)
+        self.db.commit()
+
+        principal = CurrentUser.model_validate(self.user)
+        app.dependency_overrides[get_current_user] = lambda: principal
+        self.client = TestClient(app)
+        fast_path = patch.object(config, "CHAT_FAST_PATH", False)
+        fast_path.start()
+        self.addCleanup(fast_path.stop)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        message_writer._sessions, message_writer._updates, message_writer._messages = {}, {}, []
+        self.db.delete(self.user)
+        self.db.commit()
+        self.db.close()
+
+    def reply(self, text: str):
+        async def fake_llm(history):
+            return {"response": text, "history_update": [{"role": "assistant", "content": text}]}
+        return patch("src.routers.chat.llm_extract_async", fake_llm)
+
+    def stored(self, session_id: str) -> list:
+        self.db.expire_all()
+        return [(m.role, m.content) for m in self.db.query(ChatMessage).filter_by(session_id=session_id)
+                .order_by(ChatMessage.created_at, ChatMessage.id)]
+
+    def test_turn_is_written_with_the_new_session(self):
+        with self.reply("It is sunny"):
+            body = self.client.post("/chat", json={"message": "weather in Berlin?"}).json()
+        session = self.db.get(ChatSession, body["session_id"])
+        self.assertEqual(session.title, "weather in Berlin?")
+        self.assertEqual(self.stored(session.id), [("user", "weather in Berlin?"), ("assistant", "It is sunny")])
+
+        with self.reply("Still sunny"):
+            body = self.client.post("/chat", json={"message": "and now?", "session_id": session.id}).json()
+        self.assertEqual([m["content"] for m in body["history"]],
+                         ["weather in Berlin?", "It is sunny", "and now?", "Still sunny"])
+        self.assertEqual(len(self.stored(session.id)), 4)
+
+    def test_failed_turn_writes_nothing(self):
+        async def failing_llm(history):
+            raise RuntimeError("quota exceeded")
+        with patch("src.routers.chat.llm_extract_async", failing_llm):
+            response = self.client.post("/chat", json={"message": "weather in Berlin?"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.db.query(ChatSession).filter_by(user_id=self.user.id).count(), 0)
+
+    def test_write_behind_reads_its_own_writes(self):
+        with patch.object(config, "CHAT_WRITE_BEHIND", True):
+            with self.reply("It is sunny"):
+                session_id = self.client.post("/chat", json={"message": "weather in Berlin?"}).json()["session_id"]
+            with self.reply("Still sunny"):
+                body = self.client.post("/chat", json={"message": "and now?", "session_id": session_id}).json()
+            self.assertEqual(len(body["history"]), 4)
+            self.assertEqual(self.stored(session_id), [])
+
+            asyncio.run(message_writer.flush())
+        self.assertEqual(self.stored(session_id), [("user", "weather in Berlin?"), ("assistant", "It is sunny"),
+                                                   ("user", "and now?"), ("assistant", "Still sunny")])
+        self.assertEqual(self.db.get(ChatSession, session_id).title, "weather in Berlin?")
+
+    def test_write_behind_session_reads_include_buffered_turns(self):
+        with patch.object(config, "CHAT_WRITE_BEHIND", True):
+            with self.reply("It is sunny"):
+                session_id = self.client.post("/chat", json={"message": "weather in Berlin?"}).json()["session_id"]
+            sessions = self.client.get("/sessions").json()["sessions"]
+            self.assertEqual([(s["id"], s["message_count"]) for s in sessions], [(session_id, 2)])
+
+            with self.reply("Still sunny"):
+                self.client.post("/chat", json={"message": "and now?", "session_id": session_id})
+            body = self.client.get(f"/sessions/{session_id}").json()
+        self.assertEqual([m["content"] for m in body["messages"]],
+                         ["weather in Berlin?", "It is sunny", "and now?", "Still sunny"])
+        self.assertFalse(message_writer.has_pending())
+
+    def test_stream_sends_the_session_before_summarising(self):
+        async def failing_summary(history, summary, summarized_count):
+            raise RuntimeError("summary failed")
+        with patch("src.routers.chat.build_context", failing_summary):
+            response = self.client.post("/chat/stream", json={"message": "weather in Berlin?"})
+        events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+        self.assertEqual(events, ["event: session", "event: error"])
+
+    def test_fast_path_answers_without_gemini(self):
+        async def no_llm(history):
+            raise AssertionError("Gemini should not be called")
+
+        async def weather(location, units):
+            return [{"weather": f"{location}: Clear sky, 68{units}", "followups": "would you like to know the 5 days forecast"}]
+
+        with patch.object(config, "CHAT_FAST_PATH", True), patch("src.routers.chat.llm_extract_async", no_llm), \
+                patch("src.services.fast_path.async_service.get_weather", side_effect=weather):
+            body = self.client.post("/chat", json={"message": "weather in Berlin in F?"}).json()
+        self.assertEqual(body["response"], "Right now in Berlin: clear sky, 68°F.\n\n"
+                                           "Would you like to know the 5 days forecast?")
+        self.assertEqual(self.stored(body["session_id"])[1], ("assistant", body["response"]))
@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+from ..config import config
+from ..services.context import build_context
+
+
+def conversation(turns: int) -> list:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i} " + "x" * 40})
+        history.append({"role": "assistant", "content": f"answer {i} " + "y" * 40})
+    return history
+
+
+class TestBuildContext(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch.multiple(config, CONTEXT_RECENT_TURNS=2, CONTEXT_TOKEN_BUDGET=10_000,
+                                 CONTEXT_SUMMARY_BATCH=4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_short_history_is_sent_verbatim(self):
+        history = conversation(2)
+        with patch('src.services.context.summarize_async', new_callable=AsyncMock) as mock_summarize:
+            context = await build_context(history)
+        mock_summarize.assert_not_awaited()
+        self.assertEqual(context["history"], history)
+        self.assertEqual(context["tokens_saved"], 0)
+
+    async def test_older_turns_are_folded_into_summary(self):
+        history = conversation(4)
+        with patch('src.services.context.summarize_async', new_callable=AsyncMock) as mock_summarize:
+            mock_summarize.return_value = "User asked questions 0 and 1."
+            context = await build_context(history)
+
+        mock_summarize.assert_awaited_once_with(None, history[:4])
+        self.assertEqual(context["summarized_count"], 4)
+        self.assertEqual(context["history"][1:], history[4:])
+        self.assertIn("User asked questions 0 and 1.", context["history"][0]["content"])
+        self.assertGreater(context["tokens_saved"], 0)
+
+    async def test_summary_is_extended_incrementally(self):
+        history = conversation(6)
+        with patch('src.services.context.summarize_async', new_callable=AsyncMock) as mock_summarize:
+            mock_summarize.return_value = "Summary of questions 0-3."
+            context = await build_context(history, "Summary of questions 0-1.", 4)
+
+        # Only the messages added since the last fold are summarized
+        mock_summarize.assert_awaited_once_with("Summary of questions 0-1.", history[4:8])
+        self.assertEqual(context["summarized_count"], 8)
+        self.assertEqual(context["history"][1:], history[8:])
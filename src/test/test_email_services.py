@@ -0,0 +1,145 @@
+import socketserver
+import threading
+import unittest
+from unittest.mock import patch
+from ..services.email_services import EmailDelivery, SmtpTransport, load_template, send_verification_email
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server that accepts everything and records connections and messages"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, reject=()):
+        super().__init__(("127.0.0.1", 0), SmtpSinkHandler)
+        self.reject = set(reject)
+        self.connections = 0
+        self.messages = []
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 sink ready")
+        recipients, data = [], None
+        for raw in self.rfile:
+            line = raw.decode().rstrip("\r\n")
+            if data is not None:
+                if line == ".":
+                    self.server.messages.append({"to": recipients, "data": "\n".join(data)})
+                    recipients, data = [], None
+                    self.reply("250 queued")
+                else:
+                    data.append(line)
+                continue
+            command = line[:4].upper()
+            if command == "EHLO":
+                self.reply("250 sink")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip("<> ")
+                if address in self.server.reject:
+                    self.reply("550 no such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 ok")
+            elif command == "DATA":
+                data = []
+                self.reply("354 go ahead")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class TestEmailDelivery(unittest.TestCase):
+    def setUp(self):
+        self.sink = SmtpSink(reject={"nobody@example.com"})
+        threading.Thread(target=self.sink.serve_forever, daemon=True).start()
+        self.transport = SmtpTransport("127.0.0.1", self.sink.port, starttls=False, timeout=5)
+
+    def tearDown(self):
+        self.sink.shutdown()
+        self.sink.server_close()
+
+    def test_batch_shares_one_connection(self):
+        delivery = EmailDelivery(self.transport, batch_size=10, batch_wait=0.05)
+        for i in range(5):
+            delivery.enqueue(f"user{i}@example.com", "Hello", f"<p>message {i}</p>")
+        delivery.stop()
+
+        self.assertEqual(len(self.sink.messages), 5)
+        self.assertEqual(self.sink.connections, 1)
+        self.assertEqual(delivery.stats()["sent"], 5)
+
+    def test_rejected_recipient_is_not_retried(self):
+        delivery = EmailDelivery(self.transport, batch_wait=0.05, backoff=0.01)
+        delivery.enqueue("nobody@example.com", "Hello", "<p>hi</p>")
+        delivery.enqueue("user@example.com", "Hello", "<p>hi</p>")
+        delivery.stop()
+
+        stats = delivery.stats()
+        self.assertEqual((stats["sent"], stats["failed"], stats["retried"]), (1, 1, 0))
+        # Stats are public: they name the error class, never the rejected address
+        self.assertEqual(stats["errors"], {stats["last_error"]: 1})
+        self.assertNotIn("nobody@example.com", str(stats))
+
+    def test_transient_failure_is_retried(self):
+        attempts = []
+        send = self.transport.send
+
+        def flaky_send(message):
+            attempts.append(message["to"])
+            if len(attempts) == 1:
+                raise ConnectionError("connection reset")
+            send(message)
+
+        delivery = EmailDelivery(self.transport, batch_wait=0.01, backoff=0.01)
+        with patch.object(self.transport, "send", flaky_send):
+            delivery.enqueue("user@example.com", "Hello", "<p>hi</p>")
+            while delivery.stats()["sent"] == 0:
+                threading.Event().wait(0.01)
+            delivery.stop()
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(delivery.stats()["retried"], 1)
+        self.assertEqual(len(self.sink.messages), 1)
+
+    def test_stop_keeps_the_connection_while_a_send_is_in_flight(self):
+        release = threading.Event()
+        sending = threading.Event()
+
+        def slow_send(message):
+            sending.set()
+            release.wait(5)
+
+        delivery = EmailDelivery(self.transport, batch_wait=0.01)
+        with patch.object(self.transport, "send", slow_send), patch.object(self.transport, "close") as close:
+            delivery.enqueue("user@example.com", "Hello", "<p>hi</p>")
+            sending.wait(5)
+            delivery.stop(timeout=0.05)
+            close.assert_not_called()
+            release.set()
+            delivery.stop()
+            close.assert_called_once()
+
+
+class TestVerificationEmail(unittest.TestCase):
+    def test_template_is_read_once_and_escaped(self):
+        load_template.cache_clear()
+        with patch("src.services.email_services.email_delivery") as delivery, \
+                patch("builtins.open", wraps=open) as mock_open:
+            send_verification_email("a@example.com", "<b>Ann</b>", "t1")
+            send_verification_email("b@example.com", "Bob", "t2")
+        self.assertEqual(mock_open.call_count, 1)
+        first = delivery.enqueue.call_args_list[0].args[2]
+        self.assertIn("&lt;b&gt;Ann&lt;/b&gt;", first)
+        self.assertIn("verify-email?token=t1", first)
+        self.assertNotIn("{{", first)
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException
+from ..services.fast_path import answer, extract, fast_path_stats
+from ..services.renderers import render_forecast
+
+
+class TestExtract(unittest.TestCase):
+    def test_simple_requests(self):
+        cases = {
+            "weather in Paris": ("Paris", "now", "C"),
+            "What's the weather like in New York?": ("New York", "now", "C"),
+            "forecast for Suhl in F": ("Suhl", "forecast", "F"),
+            "berlin weather today": ("Berlin", "now", "C"),
+            "weather in Berlin this week": ("Berlin", "forecast", "C"),
+            "what is the 5-day forecast for Rio de Janeiro in celsius": ("Rio de Janeiro", "forecast", "C"),
+        }
+        for message, expected in cases.items():
+            extracted = extract(message)
+            self.assertEqual((extracted.location, extracted.when, extracted.units), expected, message)
+
+    def test_ambiguous_requests_fall_back(self):
+        for message in ["hi", "how is the weather", "weather in Paris and London", "forecast for Berlin tomorrow",
+                        "air quality in Berlin", "will it rain in Paris", "weather near my house in the old town"]:
+            self.assertIsNone(extract(message), message)
+
+    def test_units_carry_over_from_the_conversation(self):
+        history = [{"role": "user", "content": "weather in Boston in fahrenheit"},
+                   {"role": "assistant", "content": "Right now in Boston: mist, 50°F."}]
+        self.assertEqual(extract("and the forecast for Denver?", history), None)
+        self.assertEqual(extract("forecast for Denver", history).units, "F")
+
+
+class TestAnswer(unittest.IsolatedAsyncioTestCase):
+    async def test_forecast_is_rendered_as_bullets(self):
+        lines = ["Sunday 2025-11-09: clear sky, 10°C (low 8°C, high 12°C), 0% chance of precipitation\n",
+                 "Monday 2025-11-10: light rain, 7°C (low 6°C, high 8°C), 60% chance of precipitation\n"]
+        with patch("src.services.fast_path.async_service.get_forcast", new_callable=AsyncMock, return_value=lines):
+            reply = await answer([{"role": "user", "content": "forecast for Suhl"}])
+        self.assertEqual(reply["response"], (
+            "Here's the 2-day forecast for Suhl:\n"
+            "• Sunday, Nov 09: 10°C (low 8°C, high 12°C), Clear sky, 0% chance of precipitation\n"
+            "• Monday, Nov 10: 7°C (low 6°C, high 8°C), Light rain, 60% chance of precipitation\n\n"
+            "Would you like to know the air quality in Suhl?"
+        ))
+        self.assertEqual(reply["history_update"], [{"role": "assistant", "content": reply["response"]}])
+
+    async def test_unknown_location_falls_back(self):
+        fallbacks = fast_path_stats.fallbacks
+        with patch("src.services.fast_path.async_service.get_weather", new_callable=AsyncMock,
+                   side_effect=HTTPException(404, "Location not found")):
+            self.assertIsNone(await answer([{"role": "user", "content": "weather in Atlantis"}]))
+        self.assertEqual(fast_path_stats.fallbacks, fallbacks + 1)
+
+    def test_unexpected_forecast_line_is_rejected(self):
+        with self.assertRaises(ValueError):
+            render_forecast(["not a forecast line"], "Suhl")
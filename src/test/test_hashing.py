@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import unittest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from unittest.mock import patch
+from ..services.hashing import HashingPool
+from ..services.helper import hash_password, verify_password, verify_and_update_password, \
+    verify_and_update_password_async
+
+
+class TestHashingPool(unittest.IsolatedAsyncioTestCase):
+    async def test_jobs_run_off_the_event_loop(self):
+        pool = HashingPool(workers=2, max_queue=4)
+        loop_thread = threading.get_ident()
+        thread = await pool.run(threading.get_ident)
+        pool.shutdown()
+        self.assertNotEqual(thread, loop_thread)
+        self.assertEqual(pool.stats()["completed"], 1)
+
+    async def test_full_queue_is_rejected(self):
+        pool = HashingPool(workers=1, max_queue=1)
+        release = threading.Event()
+        jobs = [asyncio.create_task(pool.run(release.wait, 5)) for _ in range(2)]
+        while not (pool.running == 1 and pool.queued == 1):
+            await asyncio.sleep(0.01)
+        with self.assertRaises(HTTPException) as error:
+            await pool.run(release.wait, 5)
+        release.set()
+        await asyncio.gather(*jobs)
+        pool.shutdown()
+        self.assertEqual(error.exception.status_code, 503)
+        self.assertEqual(pool.stats()["rejected"], 1)
+        self.assertEqual(pool.stats()["completed"], 2)
+
+
+class TestPasswords(unittest.IsolatedAsyncioTestCase):
+    def test_verify_uses_the_same_prehash(self):
+        hashed = hash_password("correct horse")
+        self.assertTrue(verify_password("correct horse", hashed))
+        self.assertFalse(verify_password("wrong horse", hashed))
+
+    async def test_outdated_parameters_are_rehashed(self):
+        old = CryptContext(schemes=["argon2"], argon2__time_cost=1, argon2__memory_cost=1024,
+                           argon2__parallelism=1)
+        with patch("src.services.helper.pwd_context", old):
+            hashed = hash_password("correct horse")
+        self.assertIsNone(verify_and_update_password("correct horse", hash_password("correct horse"))[1])
+
+        valid, new_hash = await verify_and_update_password_async("correct horse", hashed)
+        self.assertTrue(valid)
+        self.assertTrue(verify_password("correct horse", new_hash))
+        self.assertNotEqual(new_hash.split("$")[3], hashed.split("$")[3])
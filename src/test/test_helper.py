@@ -0,0 +1,51 @@
+import unittest
+import uuid
+from unittest.mock import patch
+from fastapi.security import HTTPAuthorizationCredentials
+from ..config import SessionLocal, AsyncSessionLocal
+from ..models.users import User
+from ..services.helper import get_current_user, create_access_token, token_cache, principal_cache
+from ..models.migrations import run_migrations
+
+
+def setUpModule():
+    run_migrations()
+
+
+class TestCurrentUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        token_cache.clear()
+        principal_cache.clear()
+        self.db = SessionLocal()
+        self.user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", username="cached",
+                         hashed_password="x")
+        self.db.add(self.user)
+        self.db.commit()
+        self.credentials = HTTPAuthorizationCredentials(scheme="Bearer",
+                                                        credentials=create_access_token({"sub": self.user.id}))
+
+    def tearDown(self):
+        self.db.delete(self.user)
+        self.db.commit()
+        self.db.close()
+
+    async def test_second_request_skips_decode_and_query(self):
+        async with AsyncSessionLocal() as db:
+            first = await get_current_user(self.credentials, db)
+            with patch('src.services.helper.decode_access_token') as mock_decode, \
+                    patch.object(db, "get") as mock_get:
+                second = await get_current_user(self.credentials, db)
+        mock_decode.assert_not_called()
+        mock_get.assert_not_called()
+        self.assertEqual(second, first)
+        self.assertEqual(second.username, "cached")
+        self.assertFalse(second.is_verified)
+
+    async def test_user_update_invalidates_snapshot(self):
+        async with AsyncSessionLocal() as db:
+            await get_current_user(self.credentials, db)
+        self.user.is_verified = True
+        self.db.commit()
+        async with AsyncSessionLocal() as db:
+            principal = await get_current_user(self.credentials, db)
+        self.assertTrue(principal.is_verified)
@@ -0,0 +1,241 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+from google.genai import types
+from ..config import config
+from ..llm_schema import llm_extract_async, llm_stream, run_tools, tool_response
+from ..services.tool_results import tool_result_stats
+from ..services.response_cache import response_cache
+
+
+def text_response(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(text=text)])
+    )])
+
+
+def function_call_response(name: str, args: dict, *more_calls: tuple) -> types.GenerateContentResponse:
+    calls = [(name, args), *more_calls]
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[
+            types.Part(function_call=types.FunctionCall(name=call_name, args=call_args))
+            for call_name, call_args in calls
+        ])
+    )])
+
+
+async def stream_of(*responses):
+    for response in responses:
+        yield response
+
+
+class TestLlmExtractAsync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # These tests cover the second Gemini call; local rendering is tested separately
+        local_render = patch.object(config, "LLM_LOCAL_RENDER_TOOLS", [])
+        local_render.start()
+        self.addCleanup(local_render.stop)
+        response_cache.clear()
+
+    async def test_plain_answer(self):
+        with patch('src.llm_schema.client') as mock_client:
+            mock_client.aio.models.generate_content = AsyncMock(return_value=text_response("Hello!"))
+            result = await llm_extract_async([{"role": "user", "content": "hi"}])
+        self.assertEqual(result["response"], "Hello!")
+        self.assertEqual(result["history_update"], [{"role": "assistant", "content": "Hello!"}])
+
+    async def test_function_call_uses_async_service(self):
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_weather', new_callable=AsyncMock) as mock_weather:
+            mock_weather.return_value = [{"weather": "Berlin: Sunny, 20C", "followups": "forecast?"}]
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+                function_call_response("get_weather", {"location": "Berlin", "units": "C"}),
+                text_response("It is sunny in Berlin."),
+            ])
+            result = await llm_extract_async([{"role": "user", "content": "weather in Berlin"}])
+
+        mock_weather.assert_awaited_once_with(location="Berlin", units="C")
+        self.assertEqual(result["response"], "It is sunny in Berlin.")
+        self.assertEqual(mock_client.aio.models.generate_content.await_count, 2)
+
+    async def test_runs_every_function_call_concurrently(self):
+        started = []
+        release = asyncio.Event()
+
+        async def slow_weather(location, units):
+            started.append(location)
+            await release.wait()
+            return [{"weather": f"{location}: Sunny, 20C"}]
+
+        async def fake_generate(**kwargs):
+            if len(kwargs["contents"]) == 1:
+                return function_call_response("get_weather", {"location": "Berlin", "units": "C"},
+                                              ("get_weather", {"location": "Paris", "units": "C"}))
+            self.assertEqual(len(kwargs["contents"][-1].parts), 2)
+            return text_response("Sunny in both.")
+
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_weather', side_effect=slow_weather):
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=fake_generate)
+            task = asyncio.create_task(llm_extract_async([{"role": "user", "content": "Berlin and Paris?"}]))
+            while len(started) < 2:
+                await asyncio.sleep(0)
+            release.set()
+            result = await task
+
+        self.assertEqual(started, ["Berlin", "Paris"])
+        self.assertEqual(result["response"], "Sunny in both.")
+
+    async def test_tool_result_is_compacted_for_the_model(self):
+        raw = [{"air-quality": {"coord": {"lon": 13.4, "lat": 52.5}, "list": [{
+            "main": {"aqi": 2}, "dt": 1605182400,
+            "components": {"co": 201.9, "no": 0.01, "no2": 0.77, "o3": 68.6, "so2": 0.64,
+                           "pm2_5": 3.0, "pm10": 3.5, "nh3": 0.12}}]}, "followups": "coordinates?"}]
+        before = tool_result_stats.stats().get("get_air_quality", {}).get("tokens_saved", 0)
+        with patch('src.llm_schema.async_service.get_air_quality', new_callable=AsyncMock, return_value=raw):
+            call = types.FunctionCall(name="get_air_quality", args={"location": "Berlin"})
+            part = tool_response([call], await run_tools([call])).parts[0]
+
+        sent = part.function_response.response["result"]
+        self.assertEqual(sent[0]["air-quality"]["category"], "Fair")
+        self.assertEqual(sent[0]["air-quality"]["dominant_pollutant"], "o3")
+        self.assertNotIn("list", sent[0]["air-quality"])
+        self.assertGreater(tool_result_stats.stats()["get_air_quality"]["tokens_saved"], before)
+
+    async def test_tool_iterations_are_bounded(self):
+        with patch('src.llm_schema.client') as mock_client, \
+                patch.object(config, "LLM_MAX_TOOL_ITERATIONS", 2), \
+                patch('src.llm_schema.async_service.geocode', new_callable=AsyncMock) as mock_geocode:
+            mock_geocode.return_value = {"lat": 1, "lon": 2}
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+                function_call_response("geocode", {"location": "Berlin"}),
+                function_call_response("geocode", {"location": "Berlin"}),
+                text_response("Done."),
+            ])
+            result = await llm_extract_async([{"role": "user", "content": "where is Berlin"}])
+
+        self.assertEqual(mock_geocode.await_count, 2)
+        last_config = mock_client.aio.models.generate_content.await_args.kwargs["config"]
+        self.assertEqual(last_config.tool_config.function_calling_config.mode, "NONE")
+        self.assertEqual(result["response"], "Done.")
+
+
+class TestLlmStream(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        local_render = patch.object(config, "LLM_LOCAL_RENDER_TOOLS", [])
+        local_render.start()
+        self.addCleanup(local_render.stop)
+
+    async def test_streams_tool_progress_then_tokens(self):
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_weather', new_callable=AsyncMock) as mock_weather:
+            mock_weather.return_value = [{"weather": "Berlin: Sunny, 20C", "followups": "forecast?"}]
+            mock_client.aio.models.generate_content_stream = AsyncMock(side_effect=[
+                stream_of(function_call_response("get_weather", {"location": "Berlin", "units": "C"})),
+                stream_of(text_response("It is sunny "), text_response("in Berlin.")),
+            ])
+            events = [event async for event in llm_stream([{"role": "user", "content": "weather in Berlin"}])]
+
+        self.assertEqual([e["event"] for e in events], ["tool", "token", "token", "done"])
+        self.assertEqual(events[0]["data"]["message"], "Looking up the current weather for Berlin…")
+        self.assertEqual(events[-1]["data"]["response"], "It is sunny in Berlin.")
+
+    async def test_text_from_a_tool_round_is_its_own_paragraph(self):
+        preamble = function_call_response("get_weather", {"location": "Berlin", "units": "C"})
+        preamble.candidates[0].content.parts.insert(0, types.Part(text="Let me check."))
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_weather', new_callable=AsyncMock) as mock_weather:
+            mock_weather.return_value = [{"weather": "Berlin: Sunny, 20C", "followups": "forecast?"}]
+            mock_client.aio.models.generate_content_stream = AsyncMock(side_effect=[
+                stream_of(preamble),
+                stream_of(text_response("It is sunny.")),
+            ])
+            events = [event async for event in llm_stream([{"role": "user", "content": "weather in Berlin"}])]
+
+        tokens = "".join(e["data"]["text"] for e in events if e["event"] == "token")
+        self.assertEqual(events[-1]["data"]["response"], "Let me check.\n\nIt is sunny.")
+        self.assertEqual(tokens, events[-1]["data"]["response"])
+
+
+class TestLocalRendering(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    async def test_first_round_is_rendered_without_a_second_call(self):
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_map_tile_url', new_callable=AsyncMock) as mock_tile:
+            mock_tile.return_value = {"tile_url": "https://tile.openstreetmap.org/10/550/335.png", "zoom": 10,
+                                      "map_type": "standard"}
+            mock_client.aio.models.generate_content = AsyncMock(
+                return_value=function_call_response("get_map_tile_url", {"location": "Berlin"}))
+            result = await llm_extract_async([{"role": "user", "content": "map of Berlin please"}])
+
+        self.assertEqual(mock_client.aio.models.generate_content.await_count, 1)
+        self.assertEqual(result["response"], "Here is a standard map tile of Berlin at zoom 10:\n\n"
+                                             "https://tile.openstreetmap.org/10/550/335.png\n\n"
+                                             "Is there anything else you would like to know?")
+
+    async def test_several_calls_share_one_follow_up(self):
+        async def weather(location, units):
+            return [{"weather": f"{location}: Sunny, 20C", "followups": "would you like to know the 5 days forecast"}]
+
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_weather', side_effect=weather), \
+                patch.object(config, "LLM_LOCAL_RENDER_TOOLS", ["get_weather"]):
+            mock_client.aio.models.generate_content = AsyncMock(return_value=function_call_response(
+                "get_weather", {"location": "Berlin", "units": "C"}, ("get_weather", {"location": "Paris", "units": "C"})))
+            result = await llm_extract_async([{"role": "user", "content": "Berlin and Paris?"}])
+
+        self.assertEqual(result["response"], "Right now in Berlin: sunny, 20°C.\n\n"
+                                             "Right now in Paris: sunny, 20°C.\n\n"
+                                             "Would you like to know the 5 days forecast?")
+
+    async def test_failed_or_excluded_tools_use_gemini(self):
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.geocode', new_callable=AsyncMock) as mock_geocode, \
+                patch.object(config, "LLM_LOCAL_RENDER_TOOLS", ["get_weather"]):
+            mock_geocode.return_value = {"name": "Berlin", "lat": 52.52, "lon": 13.4}
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+                function_call_response("geocode", {"location": "Berlin"}),
+                text_response("Berlin is at 52.52, 13.4."),
+            ])
+            result = await llm_extract_async([{"role": "user", "content": "where is Berlin"}])
+        self.assertEqual(result["response"], "Berlin is at 52.52, 13.4.")
+
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_weather', new_callable=AsyncMock,
+                      side_effect=RuntimeError("OWM down")):
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+                function_call_response("get_weather", {"location": "Berlin", "units": "C"}),
+                text_response("Sorry, the weather service is down."),
+            ])
+            result = await llm_extract_async([{"role": "user", "content": "weather in Berlin"}])
+        self.assertEqual(result["response"], "Sorry, the weather service is down.")
+
+    async def test_prose_tools_go_to_gemini_by_default(self):
+        raw = [{"air-quality": {"coord": {"lon": 13.4, "lat": 52.5}, "list": [{
+            "main": {"aqi": 2}, "dt": 1605182400, "components": {"o3": 68.6, "pm2_5": 3.0}}]}}]
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.get_air_quality', new_callable=AsyncMock, return_value=raw):
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+                function_call_response("get_air_quality", {"location": "Berlin"}),
+                text_response("The air in Berlin is fair today."),
+            ])
+            result = await llm_extract_async([{"role": "user", "content": "air in Berlin?"}])
+
+        self.assertEqual(result["response"], "The air in Berlin is fair today.")
+        second = mock_client.aio.models.generate_content.await_args.kwargs["contents"][-1]
+        self.assertEqual(second.parts[0].function_response.response["result"][0]["air-quality"]["category"], "Fair")
+
+    async def test_stream_renders_locally(self):
+        with patch('src.llm_schema.client') as mock_client, \
+                patch('src.llm_schema.async_service.geocode', new_callable=AsyncMock) as mock_geocode:
+            mock_geocode.return_value = {"name": "Berlin", "country": "DE", "lat": 52.52, "lon": 13.405}
+            mock_client.aio.models.generate_content_stream = AsyncMock(side_effect=[
+                stream_of(function_call_response("geocode", {"location": "Berlin"})),
+            ])
+            events = [event async for event in llm_stream([{"role": "user", "content": "where is Berlin"}])]
+
+        self.assertEqual([e["event"] for e in events], ["tool", "token", "done"])
+        self.assertEqual(events[-1]["data"]["response"], "Berlin, DE is at latitude 52.5200, longitude 13.4050."
+                                                         "\n\nWould you like a map tile of Berlin?")
@@ -0,0 +1,73 @@
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from ..app import app
+from ..config import SessionLocal, config
+from ..services.metrics import Counter, Histogram, Registry, render_samples
+from ..services import metrics as metrics_module
+from ..services import tile_cache
+from sqlalchemy import text
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        # Metrics made here go to a throwaway registry, not the app's
+        self.registry = Registry()
+        self._saved, metrics_module.registry = metrics_module.registry, self.registry
+
+    def tearDown(self):
+        metrics_module.registry = self._saved
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = Histogram("stage_seconds", "Stage latency", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3):
+            latency.labels("llm").observe(value)
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE stage_seconds histogram", lines)
+        self.assertIn('stage_seconds_bucket{stage="llm",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="llm",le="1"} 3', lines)
+        self.assertIn('stage_seconds_bucket{stage="llm",le="+Inf"} 4', lines)
+        self.assertIn('stage_seconds_sum{stage="llm"} 4.05', lines)
+        self.assertIn('stage_seconds_count{stage="llm"} 4', lines)
+
+    def test_counter_labels_are_escaped(self):
+        errors = Counter("errors_total", "Errors", ("detail",))
+        errors.labels('say "hi"\n').inc(2)
+        self.assertIn('errors_total{detail="say \\"hi\\"\\n"} 2', self.registry.render())
+        self.assertEqual(render_samples("queue", "gauge", "Queue", [({}, 3)]), "# HELP queue Queue\n# TYPE queue gauge\nqueue 3\n")
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        token = patch.object(config, "OPS_TOKEN", "ops-secret")
+        token.start()
+        self.addCleanup(token.stop)
+        self.client = TestClient(app)
+        self.auth = {"Authorization": "Bearer ops-secret"}
+
+    def test_requests_queries_and_caches_are_exported(self):
+        client = self.client
+        client.get("/health")
+        with SessionLocal() as db:
+            db.execute(text("SELECT 1"))
+        body = client.get("/metrics", headers=self.auth)
+        self.assertTrue(body.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('http_requests_total{method="GET",route="/health",status="200"}', body.text)
+        self.assertIn('db_query_seconds_count{operation="SELECT"}', body.text)
+        self.assertIn('cache_hits_total{cache="geocode"}', body.text)
+        self.assertIn("http_requests_in_flight 1", body.text)  # the scrape itself
+
+    def test_ops_endpoints_need_the_token(self):
+        for path in ("/metrics", "/cache/stats"):
+            self.assertEqual(self.client.get(path).status_code, 401)
+            self.assertEqual(self.client.get(path, headers={"Authorization": "Bearer wrong"}).status_code, 401)
+            self.assertEqual(self.client.get(path, headers=self.auth).status_code, 200)
+            with patch.object(config, "OPS_TOKEN", ""):
+                self.assertEqual(self.client.get(path, headers=self.auth).status_code, 404)
+
+    def test_stats_do_not_create_the_tile_store(self):
+        saved, tile_cache._store = tile_cache._store, None
+        self.addCleanup(setattr, tile_cache, "_store", saved)
+        stats = self.client.get("/cache/stats", headers=self.auth).json()
+        self.assertEqual(stats["tiles"]["objects"], 0)
+        self.assertIsNone(tile_cache._store)
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from sqlalchemy import create_engine, inspect, text
+from ..models import migrations
+from ..models.migrations import run_migrations, MIGRATIONS
+
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR NOT NULL, username VARCHAR NOT NULL, "
+    "hashed_password VARCHAR NOT NULL, is_verified BOOLEAN NOT NULL, verification_token VARCHAR, "
+    "verification_token_expires DATETIME, created_at DATETIME, last_login DATETIME)",
+    "CREATE TABLE chat_sessions (id VARCHAR PRIMARY KEY, user_id VARCHAR NOT NULL REFERENCES users(id), "
+    "title VARCHAR, created_at DATETIME, updated_at DATETIME)",
+    "CREATE TABLE chat_messages (id VARCHAR PRIMARY KEY, session_id VARCHAR NOT NULL REFERENCES chat_sessions(id), "
+    "role VARCHAR NOT NULL, content TEXT NOT NULL, created_at DATETIME)",
+]
+
+
+class TestMigrations(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_upgrades_a_pre_versioning_database(self):
+        with self.engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.execute(text(statement))
+            conn.execute(text("INSERT INTO users VALUES ('u1', 'a@b.c', 'a', 'x', 1, NULL, NULL, NULL, NULL)"))
+            conn.execute(text("INSERT INTO chat_sessions VALUES ('s1', 'u1', 't', NULL, NULL)"))
+
+        self.assertEqual(run_migrations(self.engine), MIGRATIONS[-1][0])
+
+        inspector = inspect(self.engine)
+        self.assertIn("summarized_count", {c["name"] for c in inspector.get_columns("chat_sessions")})
+        self.assertIn("ix_chat_messages_session_created", {i["name"] for i in inspector.get_indexes("chat_messages")})
+        self.assertIn("ix_chat_sessions_user_updated", {i["name"] for i in inspector.get_indexes("chat_sessions")})
+        self.assertIn("geocode_cache", inspector.get_table_names())
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT summarized_count FROM chat_sessions")).scalar(), 0)
+
+    def test_fresh_database_and_rerun(self):
+        version = run_migrations(self.engine)
+        self.assertEqual(run_migrations(self.engine), version)
+        with self.engine.connect() as conn:
+            applied = conn.execute(text("SELECT count(*) FROM schema_migrations")).scalar()
+        self.assertEqual(applied, len(MIGRATIONS))
+
+    def test_first_migration_is_frozen(self):
+        with patch.object(migrations, "MIGRATIONS", MIGRATIONS[:1]):
+            self.assertEqual(run_migrations(self.engine), 1)
+        inspector = inspect(self.engine)
+        self.assertNotIn("summary", {c["name"] for c in inspector.get_columns("chat_sessions")})
+        self.assertEqual({i["name"] for i in inspector.get_indexes("chat_messages")}, set())
+
+        self.assertEqual(run_migrations(self.engine), MIGRATIONS[-1][0])
+        self.assertIn("summary", {c["name"] for c in inspect(self.engine).get_columns("chat_sessions")})
+
+    def test_workers_starting_together_apply_each_migration_once(self):
+        engines = [create_engine(f"sqlite:///{self.path}", connect_args={"timeout": 30}) for _ in range(4)]
+        versions, errors = [], []
+
+        def worker(engine):
+            try:
+                versions.append(run_migrations(engine))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(engine,)) for engine in engines]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for engine in engines:
+            engine.dispose()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(versions, [MIGRATIONS[-1][0]] * 4)
+        with self.engine.connect() as conn:
+            applied = conn.execute(text("SELECT version FROM schema_migrations ORDER BY version")).scalars().all()
+        self.assertEqual(applied, [number for number, _, _ in MIGRATIONS])
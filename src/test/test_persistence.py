@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from fastapi import HTTPException
+from ..services.persistence import MessageWriter
+
+
+class FakeDb:
+    """Stands in for an AsyncSession: records executed batches, fails on messages of 'bad' sessions"""
+
+    def __init__(self, store: list, delay: float = 0):
+        self.store = store
+        self.delay = delay
+        self.rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows=None):
+        await asyncio.sleep(self.delay)
+        for row in rows or []:
+            if row.get("session_id") == "bad":
+                raise RuntimeError("foreign key violation")
+        self.rows.extend(row for row in rows or [] if "role" in row)
+
+    async def commit(self):
+        self.store.extend(self.rows)
+
+
+def message(session_id: str, content: str) -> dict:
+    return {"id": content, "session_id": session_id, "role": "user", "content": content}
+
+
+class TestMessageWriter(unittest.IsolatedAsyncioTestCase):
+    def writer(self, delay: float = 0, **options) -> tuple[MessageWriter, list]:
+        store = []
+        return MessageWriter(lambda: FakeDb(store, delay), batch_size=100, interval=0.01, **options), store
+
+    async def test_stop_during_a_flush_loses_nothing(self):
+        writer, store = self.writer(delay=0.05)
+        await writer.start()
+        await writer.add_turn(None, {"id": "s1"}, [message("s1", "a"), message("s1", "b")])
+        await asyncio.sleep(0.03)  # the background flush is now waiting on the database
+        await writer.stop()
+        self.assertEqual([row["content"] for row in store], ["a", "b"])
+        self.assertEqual(writer.stats()["pending"], 0)
+
+    async def test_committed_rows_are_no_longer_pending(self):
+        store = []
+        seen = []
+
+        class ObservedDb(FakeDb):
+            async def __aexit__(self, *exc):
+                # Closing the session (returning the connection) yields to other tasks
+                seen.append(writer.pending_messages("s1"))
+                return False
+
+        writer = MessageWriter(lambda: ObservedDb(store), batch_size=100, interval=0.01)
+        await writer.add_turn(None, {"id": "s1"}, [message("s1", "a")])
+        self.assertTrue(writer.has_pending("s1"))
+        await writer.flush()
+        # Once committed the row is served from the database only, even before the session is closed
+        self.assertEqual(seen, [[]])
+        self.assertFalse(writer.has_pending("s1"))
+
+    async def test_failing_session_is_dead_lettered_after_retries(self):
+        writer, store = self.writer(max_retries=1)
+        await writer.add_turn(None, {"id": "s1"}, [message("s1", "a")])
+        await writer.add_turn(None, {"id": "bad"}, [message("bad", "b")])
+        with self.assertRaises(RuntimeError):
+            await writer.flush()
+        self.assertEqual(writer.pending_count(), 2)
+
+        self.assertEqual(await writer.flush(), 1)
+        self.assertEqual([row["content"] for row in store], ["a"])
+        self.assertEqual(writer.pending_count(), 0)
+        self.assertEqual(writer.stats()["messages_dead_lettered"], 1)
+        self.assertEqual(writer.dead_letters[0]["session_id"], "bad")
+
+    async def test_full_buffer_writes_through_or_rejects(self):
+        writer, store = self.writer(max_pending=2)
+        await writer.add_turn(None, {"id": "s1"}, [message("s1", "a"), message("s1", "b")])
+        await writer.add_turn(None, {"id": "s1"}, [message("s1", "c")])
+        self.assertEqual([row["content"] for row in store], ["a", "b"])
+
+        await writer.add_turn(None, {"id": "bad"}, [message("bad", "d")])
+        with self.assertRaises(HTTPException) as error:
+            await writer.add_turn(None, {"id": "s1"}, [message("s1", "e"), message("s1", "f")])
+        self.assertEqual(error.exception.status_code, 503)
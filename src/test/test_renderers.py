@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import patch
+from google.genai import types
+from ..config import config
+from ..services.renderers import render_tool_results
+
+
+def call(name: str, **args) -> types.FunctionCall:
+    return types.FunctionCall(name=name, args=args)
+
+
+class TestRenderToolResults(unittest.TestCase):
+    def setUp(self):
+        # get_weather and get_air_quality are rendered only when opted in
+        local_render = patch.object(config, "LLM_LOCAL_RENDER_TOOLS", ["get_weather", "get_air_quality"])
+        local_render.start()
+        self.addCleanup(local_render.stop)
+
+    def test_air_quality(self):
+        result = [{"air-quality": {"list": [{"main": {"aqi": 3}, "components": {"pm2_5": 27.81, "pm10": 31.0,
+                                                                                  "o3": 50.0}}]},
+                   "followups": "would you like to provide you with the coordinates for the location"}]
+        text = render_tool_results([call("get_air_quality", location="Berlin")], [result])
+        self.assertEqual(text, "The air quality in Berlin is Moderate (AQI 3 of 5), which means sensitive groups "
+                               "may start to feel the effects. The main pollutant is fine particles (PM2.5) at "
+                               "27.8 μg/m³.\n\n"
+                               "Would you like to provide you with the coordinates for the location?")
+
+    def test_weather(self):
+        result = [{"weather": "Berlin: Light rain, 9C", "followups": "would you like to know the 5 days forecast"}]
+        self.assertEqual(render_tool_results([call("get_weather", location="Berlin", units="C")], [result]),
+                         "Right now in Berlin: light rain, 9°C.\n\nWould you like to know the 5 days forecast?")
+
+    def test_unrenderable_results_return_none(self):
+        self.assertIsNone(render_tool_results([call("get_air_quality", location="Berlin")],
+                                              [[{"air-quality": {"list": []}}]]))
+        self.assertIsNone(render_tool_results([call("get_weather", location="Berlin", units="C")],
+                                              [{"error": "Location not found"}]))
+        self.assertIsNone(render_tool_results([call("unknown_tool")], [{}]))
+        self.assertIsNone(render_tool_results([], []))
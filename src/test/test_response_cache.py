@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+from google.genai import types
+from ..config import config
+from ..llm_schema import llm_extract_async
+from ..services.response_cache import ResponseCache, response_cache
+
+
+def text_response(text: str) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(candidates=[types.Candidate(
+        content=types.Content(role="model", parts=[types.Part(text=text)])
+    )])
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_key_ignores_case_whitespace_and_trailing_punctuation(self):
+        cache = ResponseCache(maxsize=8, ttl=60)
+        self.assertEqual(cache.key([{"role": "user", "content": "Weather in  London?"}], []),
+                         cache.key([{"role": "user", "content": "weather in london"}], []))
+        self.assertNotEqual(cache.key([{"role": "user", "content": "weather in London"}], []),
+                            cache.key([{"role": "user", "content": "weather in Paris"}], []))
+        rounds = [("get_weather", {"location": "London"}, [{"weather": "London: Rain, 9C"}])]
+        self.assertNotEqual(cache.key([{"role": "user", "content": "hi"}], []),
+                            cache.key([{"role": "user", "content": "hi"}], rounds))
+
+    def test_personalized_turns_are_not_cached(self):
+        cache = ResponseCache(maxsize=8, ttl=60)
+        self.assertIsNone(cache.key([{"role": "user", "content": "My name is Sam, remember it"}], []))
+        self.assertIsNone(cache.key([{"role": "user", "content": "(Summary of our earlier conversation: ...)"},
+                                     {"role": "user", "content": "hi"}], []))
+        self.assertEqual(cache.stats()["bypassed"], 2)
+
+    def test_answers_on_weather_data_expire_with_it(self):
+        cache = ResponseCache(maxsize=8, ttl=3600)
+        self.assertEqual(cache.ttl_for([]), 3600)
+        self.assertEqual(cache.ttl_for([("geocode", {}, {}), ("get_weather", {}, [])]), config.OWM_CURRENT_TTL)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(maxsize=2, ttl=60)
+        for i in range(3):
+            cache.set(f"k{i}", f"r{i}", 0.5, 60)
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k2"), "r2")
+        self.assertEqual(cache.stats()["seconds_saved"], 0.5)
+
+
+class TestCachedExtract(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    async def test_repeated_opener_is_answered_from_cache(self):
+        with patch('src.llm_schema.client') as mock_client:
+            mock_client.aio.models.generate_content = AsyncMock(return_value=text_response("Hello! Ask me about the weather."))
+            first = await llm_extract_async([{"role": "user", "content": "hi"}])
+            second = await llm_extract_async([{"role": "user", "content": "Hi!"}])
+            personal = await llm_extract_async([{"role": "user", "content": "hi, I'm Sam"}])
+
+        self.assertEqual(first["response"], second["response"])
+        self.assertEqual(personal["response"], first["response"])
+        self.assertEqual(mock_client.aio.models.generate_content.await_count, 2)
+        self.assertEqual(response_cache.stats()["hits"], 1)
+
+    async def test_disabled(self):
+        with patch('src.llm_schema.client') as mock_client, patch.object(config, "LLM_CACHE", False):
+            mock_client.aio.models.generate_content = AsyncMock(return_value=text_response("Hello!"))
+            await llm_extract_async([{"role": "user", "content": "hi"}])
+            await llm_extract_async([{"role": "user", "content": "hi"}])
+        self.assertEqual(mock_client.aio.models.generate_content.await_count, 2)
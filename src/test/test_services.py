@@ -1,9 +1,15 @@
 import unittest
 from unittest.mock import Mock, patch
-from ..services.weather_service import geocode, get_weather, get_forcast, get_air_quality, get_map_tile_url
+from ..services.weather_service import geocode, get_weather, get_forcast, get_air_quality, get_map_tile_url, \
+    geocode_cache, observation_cache, build_forecast, build_air_quality, air_quality_digest, compact_air_quality
+from ..services.tokens import payload_tokens
 
 
 class TestServices(unittest.TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        observation_cache.clear()
+
     def test_geocode_success(self):
             with patch('src.services.weather_service.requests.get') as mock_get:
                 mock_response = Mock()
@@ -81,6 +87,23 @@ class TestServices(unittest.TestCase):
             self.assertIn("Wednesday 2025-11-12: overcast clouds, 14°C", result[3].strip())
             self.assertIn("Thursday 2025-11-13: moderate rain, 13°C", result[4].strip())
 
+    def test_forecast_buckets_by_local_day(self):
+        # 2025-11-09 20:00 and 23:00 UTC are already Monday in UTC+3
+        raw = {"city": {"timezone": 3 * 3600}, "list": [
+            {"dt": 1762718400 + i * 10800, "main": {"temp": temp}, "pop": pop, "wind": {"speed": speed},
+             "weather": [{"description": desc}]}
+            for i, (temp, pop, speed, desc) in enumerate([
+                (10, 0.0, 2.0, "clear sky"), (8, 0.2, 3.5, "light rain"), (6, 0.6, 5.0, "light rain"),
+                (7, 0.1, 4.0, "clear sky"),
+            ])
+        ]}
+        result = build_forecast(raw, "C")
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[0].strip(), "Sunday 2025-11-09: clear sky, 10°C (low 10°C, high 10°C), "
+                                            "0% chance of precipitation, wind up to 2.0 m/s")
+        self.assertEqual(result[1].strip(), "Monday 2025-11-10: light rain, 7°C (low 6°C, high 8°C), "
+                                            "60% chance of precipitation, wind up to 5.0 m/s")
+
     def test_air_quality(self):
         with patch('src.services.weather_service.requests.get') as mock_get:
             mock_geocode_response = Mock()
@@ -116,6 +139,27 @@ class TestServices(unittest.TestCase):
             result = get_air_quality("Berlin")
             self.assertEqual(result[0]["air-quality"]["list"][0]["main"]["aqi"], 2)
 
+    def test_air_quality_digest(self):
+        data = {"coord": {"lon": 13.405, "lat": 52.52}, "list": [{
+            "main": {"aqi": 3},
+            "components": {"co": 230.31, "no": 0.02, "no2": 12.5, "o3": 71.2, "so2": 1.1,
+                           "pm2_5": 27.81, "pm10": 31.06, "nh3": 0.9},
+            "dt": 1605182400
+        }]}
+        digest = air_quality_digest(data)
+        self.assertEqual(digest.aqi, 3)
+        self.assertEqual(digest.category, "Moderate")
+        self.assertEqual(digest.dominant_pollutant, "pm2_5")  # only pollutant in its Moderate band
+        self.assertEqual(digest.concentrations["pm2_5"], 27.8)
+        self.assertNotIn("nh3", digest.concentrations)
+        self.assertEqual(air_quality_digest({"list": []}).category, "Unknown")
+
+        result = build_air_quality(data)
+        compact = compact_air_quality(result)
+        self.assertEqual(compact[0]["air-quality"]["aqi"], 3)
+        self.assertEqual(compact[0]["followups"], result[0]["followups"])
+        self.assertLess(payload_tokens(compact), payload_tokens(result))
+
     def test_get_map_tile_url(self):
             result = get_map_tile_url("Berlin", zoom=10, map_type="standard")
             self.assertTrue(result["tile_url"].startswith('https://tile.openstreetmap.org'))
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+import httpx
+from fastapi.testclient import TestClient
+from ..app import app
+from ..config import CommonTileProviders, config
+from ..models.schemas import CurrentUser
+from ..services.helper import get_current_user
+from ..services.http_client import set_http_client
+from ..services.tile_cache import TileStore, set_tile_store
+from ..services.weather_service import build_map_tile, geocode_cache
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+class TestTileStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = TileStore(self.directory.name, max_bytes=100, ttl=60, hot_size=2)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_identical_tiles_share_one_object(self):
+        first = self.store.put("standard", 3, 1, 1, PNG + b"sea")
+        second = self.store.put("standard", 3, 2, 1, PNG + b"sea")
+        self.assertEqual(first, second)
+        self.assertEqual(self.store.stats()["objects"], 1)
+        self.assertEqual(self.store.lookup("standard", 3, 2, 1), first)
+        self.assertEqual(self.store.read(first), PNG + b"sea")
+        self.assertEqual(self.store.read(first), PNG + b"sea")
+        self.assertEqual(self.store.stats()["hot_hits"], 1)
+
+    def test_least_recently_used_objects_are_evicted_by_size(self):
+        old = self.store.put("standard", 3, 0, 0, PNG + b"a" * 40)
+        kept = self.store.put("standard", 3, 1, 0, PNG + b"b" * 40)
+        self.store.lookup("standard", 3, 0, 0)  # "old" is now the most recently used
+        self.store.put("standard", 3, 2, 0, PNG + b"c" * 40)
+        self.assertLessEqual(self.store.bytes, 100)
+        self.assertIsNotNone(self.store.lookup("standard", 3, 0, 0))
+        self.assertIsNone(self.store.lookup("standard", 3, 1, 0))
+        self.assertFalse(os.path.exists(self.store._object_path(kept)))
+        self.assertTrue(os.path.exists(self.store._object_path(old)))
+
+    def test_stale_ref_is_a_miss_and_index_survives_restart(self):
+        digest = self.store.put("standard", 3, 0, 0, PNG)
+        ref = self.store._ref_path("standard", 3, 0, 0)
+        os.utime(ref, (time.time() - 120, time.time() - 120))
+        self.assertIsNone(self.store.lookup("standard", 3, 0, 0))
+
+        reopened = TileStore(self.directory.name, max_bytes=100, ttl=60)
+        self.assertEqual(reopened.stats()["bytes"], len(PNG))
+        reopened.put("standard", 3, 0, 0, PNG)
+        self.assertEqual(reopened.lookup("standard", 3, 0, 0), digest)
+
+
+class TestTileProxy(unittest.TestCase):
+    def setUp(self):
+        # The tests must not depend on the providers and geocoding URL of the local .env
+        for target, name, value in (
+                (CommonTileProviders, "STANDARD", "https://tile.openstreetmap.org/{z}/{x}/{y}.png"),
+                (CommonTileProviders, "SATELLITE", "https://sat.example/{z}/{y}/{x}.jpg"),
+                (CommonTileProviders, "TERRAIN", "https://terrain.example/{z}/{x}/{y}.png"),
+                (config, "OWM_URL", "http://owm.invalid/geo")):
+            patcher = patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        set_tile_store(TileStore(self.directory.name, max_bytes=10_000, ttl=60))
+        geocode_cache.clear()
+        self.requests = []
+
+        def upstream(request: httpx.Request):
+            self.requests.append(str(request.url))
+            if request.url.path.endswith("/geo"):
+                return httpx.Response(200, json=[{"name": "Berlin", "lat": 52.52, "lon": 13.405}])
+            if "/9/" in request.url.path:
+                return httpx.Response(404)
+            return httpx.Response(200, content=PNG + request.url.path.encode())
+
+        set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(upstream)))
+        principal = CurrentUser(id="tiles-user", email="tiles@example.com", username="tiles", is_verified=True)
+        app.dependency_overrides[get_current_user] = lambda: principal
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        set_http_client(None)
+        set_tile_store(None)
+        self.directory.cleanup()
+
+    def test_tile_is_cached_and_revalidated(self):
+        first = self.client.get("/tiles/satellite/10/550/335")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["content-type"], "image/png")
+        self.assertEqual(self.requests, ["https://sat.example/10/335/550.jpg"])
+
+        again = self.client.get("/tiles/satellite/10/550/335", headers={"If-None-Match": first.headers["etag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get("/tiles/satellite/10/550/335").content, first.content)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_unknown_provider_and_out_of_range_tiles(self):
+        self.assertEqual(self.client.get("/tiles/watercolor/1/0/0").status_code, 404)
+        self.assertEqual(self.client.get("/tiles/standard/2/4/0").status_code, 404)
+        self.assertEqual(self.client.get("/tiles/standard/9/0/0").status_code, 404)
+        self.assertEqual(self.requests, ["https://tile.openstreetmap.org/9/0/0.png"])
+
+    def test_neighbours_around_a_location(self):
+        body = self.client.get("/tiles/terrain/around", params={"location": "Berlin", "embed": True}).json()
+        self.assertEqual(body["center"], {"x": 550, "y": 335})
+        self.assertEqual(len(body["tiles"]), 9)
+        self.assertEqual({(t["dx"], t["dy"]) for t in body["tiles"]},
+                         {(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)})
+        self.assertTrue(all(t["media_type"] == "image/png" for t in body["tiles"]))
+        self.assertEqual(self.client.get("/tiles/terrain/10/551/336").status_code, 200)
+        self.assertEqual(sum("terrain.example" in url for url in self.requests), 9)
+
+    def test_map_tile_honours_the_map_type(self):
+        result = build_map_tile(52.52, 13.405, 10, "satellite")
+        self.assertEqual(result["tile_url"], "https://sat.example/10/335/550.jpg")
+        self.assertEqual(result["proxy_url"], "/tiles/satellite/10/550/335")
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import unittest
+import uuid
+from unittest.mock import AsyncMock, patch
+import httpx
+from fastapi.testclient import TestClient
+from ..app import app
+from ..config import SessionLocal, config
+from ..models.migrations import run_migrations
+from ..models.schemas import CurrentUser
+from ..models.users import User
+from ..services.helper import get_current_user
+from ..services.http_client import set_http_client
+from ..services.response_cache import response_cache
+from ..services.tracing import (BatchSpanProcessor, FileExporter, InMemoryExporter, OTLPExporter,
+                                SimpleSpanProcessor, TracingTransport, current_span, install_log_trace_ids,
+                                parse_traceparent, span, tracer)
+from .test_llm_schema import function_call_response, text_response
+
+
+def setUpModule():
+    run_migrations()
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.exporter = InMemoryExporter()
+        tracer.configure(SimpleSpanProcessor(self.exporter))
+        self.addCleanup(tracer.shutdown)
+
+    def by_name(self) -> dict:
+        return {s.name: s for s in self.exporter.spans}
+
+
+class TestSpans(TracingTestCase):
+    def test_children_share_the_trace_and_errors_are_recorded(self):
+        with span("request") as root:
+            with span("load", rows=3):
+                pass
+            with self.assertRaises(ValueError):
+                with span("parse"):
+                    raise ValueError("bad payload")
+        spans = self.by_name()
+        self.assertEqual({s.trace_id for s in spans.values()}, {root.trace_id})
+        self.assertIsNone(spans["request"].parent_id)
+        self.assertEqual(spans["load"].parent_id, root.span_id)
+        self.assertEqual(spans["load"].attributes, {"rows": 3})
+        self.assertEqual((spans["parse"].status, spans["parse"].error), ("error", "ValueError: bad payload"))
+        self.assertIsNone(current_span())
+
+    def test_concurrent_tasks_keep_their_own_parent(self):
+        async def tool(name):
+            with span(f"tool.{name}"):
+                await asyncio.sleep(0)
+                with span(f"http.{name}"):
+                    await asyncio.sleep(0)
+
+        async def turn():
+            with span("turn"):
+                await asyncio.gather(tool("a"), tool("b"))
+
+        asyncio.run(turn())
+        spans = self.by_name()
+        self.assertEqual(spans["http.a"].parent_id, spans["tool.a"].span_id)
+        self.assertEqual(spans["http.b"].parent_id, spans["tool.b"].span_id)
+        self.assertEqual(spans["tool.b"].parent_id, spans["turn"].span_id)
+
+    def test_incoming_traceparent_is_continued(self):
+        parent = parse_traceparent("00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01")
+        self.assertEqual(parent, ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True))
+        self.assertIsNone(parse_traceparent("garbage"))
+        with span("request", parent=parent) as root:
+            pass
+        self.assertEqual((root.trace_id, root.parent_id), parent[:2])
+
+    def test_unsampled_traces_are_not_exported(self):
+        tracer.configure(tracer.processor, sample_rate=0.0)
+        with span("request") as root:
+            with span("child"):
+                pass
+        self.assertIsNotNone(root.trace_id)
+        self.assertEqual(list(self.exporter.spans), [])
+
+    def test_log_records_carry_the_trace_id(self):
+        install_log_trace_ids()
+        with self.assertLogs(level="INFO") as logs:
+            with span("request") as root:
+                logging.info("inside")
+            logging.info("outside")
+        self.assertEqual([(r.trace_id, r.span_id) for r in logs.records], [(root.trace_id, root.span_id), ("-", "-")])
+
+    def test_upstream_requests_get_a_client_span_and_traceparent_only_internally(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request.headers.get("traceparent"))
+            return httpx.Response(200, json={})
+
+        async def fetch():
+            async with httpx.AsyncClient(transport=TracingTransport(httpx.MockTransport(handler))) as client:
+                with span("tool"):
+                    await client.get("https://api.example.com/data", params={"appid": "secret"})
+                    await client.get("http://geo.internal/lookup")
+
+        with patch.object(config, "TRACING_PROPAGATE_HOSTS", ["geo.internal"]):
+            asyncio.run(fetch())
+        spans = self.by_name()
+        external, internal = spans["HTTP GET api.example.com"], spans["HTTP GET geo.internal"]
+        self.assertEqual(external.kind, "client")
+        self.assertEqual(external.attributes["http.url"], "https://api.example.com/data")
+        self.assertEqual(external.attributes["http.status_code"], 200)
+        self.assertEqual(internal.parent_id, spans["tool"].span_id)
+        self.assertEqual(seen, [None, f"00-{internal.trace_id}-{internal.span_id}-01"])
+
+
+class TestExporters(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(tracer.shutdown)
+
+    def test_file_exporter_writes_json_lines_from_the_batch_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces", "spans.jsonl")
+            processor = BatchSpanProcessor(FileExporter(path), interval=60)
+            tracer.configure(processor)
+            with span("request"):
+                with span("load"):
+                    pass
+            tracer.shutdown()
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual([line["name"] for line in lines], ["load", "request"])
+        self.assertEqual(lines[0]["parent_id"], lines[1]["span_id"])
+        self.assertEqual(processor.stats()["exported"], 2)
+
+    def test_otlp_payload(self):
+        exporter = InMemoryExporter()
+        tracer.configure(SimpleSpanProcessor(exporter))
+        with self.assertRaises(RuntimeError):
+            with span("gemini.extract", kind="client", round="first", attempt=1):
+                raise RuntimeError("quota")
+        payload = OTLPExporter("http://collector:4318/", "weather-chatbot").payload(list(exporter.spans))
+        resource = payload["resourceSpans"][0]
+        otlp = resource["scopeSpans"][0]["spans"][0]
+        self.assertEqual(resource["resource"]["attributes"][0]["value"], {"stringValue": "weather-chatbot"})
+        self.assertEqual((otlp["name"], otlp["kind"]), ("gemini.extract", 3))
+        self.assertNotIn("parentSpanId", otlp)
+        self.assertEqual(otlp["attributes"], [{"key": "round", "value": {"stringValue": "first"}},
+                                              {"key": "attempt", "value": {"intValue": "1"}}])
+        self.assertEqual(otlp["status"], {"code": 2, "message": "RuntimeError: quota"})
+        self.assertEqual(len(otlp["traceId"]), 32)
+
+
+class TestChatTrace(TracingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = SessionLocal()
+        self.user = User(id=str(uuid.uuid4()), email=f"{uuid.uuid4()}@example.com", username="traced",
+                         hashed_password="x")
+        self.db.add(self.user)
+        self.db.commit()
+        principal = CurrentUser.model_validate(self.user)
+        app.dependency_overrides[get_current_user] = lambda: principal
+        for name, value in (("CHAT_FAST_PATH", False), ("LLM_CACHE", False), ("LLM_LOCAL_RENDER_TOOLS", [])):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        response_cache.clear()
+
+        def owm(request):
+            if str(request.url).startswith(config.OWM_URL):
+                return httpx.Response(200, json=[{"name": "Traceville", "lat": 50.6, "lon": 10.7}])
+            return httpx.Response(200, json={"weather": [{"description": "clear sky"}], "main": {"temp": 20}})
+        set_http_client(httpx.AsyncClient(transport=TracingTransport(httpx.MockTransport(owm))))
+        self.addCleanup(set_http_client, None)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        self.db.delete(self.user)
+        self.db.commit()
+        self.db.close()
+
+    def test_chat_request_is_one_trace(self):
+        location = f"Traceville {uuid.uuid4().hex[:8]}"
+        with patch("src.llm_schema.client") as mock_client:
+            mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+                function_call_response("get_weather", {"location": location, "units": "C"}),
+                text_response("Clear and 20°C."),
+            ])
+            response = TestClient(app).post("/chat", json={"message": f"weather in {location}?"})
+
+        self.assertEqual(response.status_code, 200)
+        trace = self.exporter.trace(response.headers["x-trace-id"])
+        names = [s.name for s in trace]
+        root = self.by_name()["POST /chat"]
+        self.assertIsNone(root.parent_id)
+        self.assertEqual(root.attributes["http.status_code"], 200)
+        for name in ("chat.load", "chat.llm", "chat.persist", "tool.get_weather"):
+            self.assertIn(name, names)
+        self.assertEqual(names.count("gemini.extract"), 2)
+        tool = self.by_name()["tool.get_weather"]
+        self.assertEqual(tool.attributes["tool.args.location"], location)
+        upstream = [s for s in trace if s.kind == "client" and s.name.startswith("HTTP GET")]
+        self.assertEqual(len(upstream), 2)  # geocode, then the weather itself
+        self.assertEqual({s.parent_id for s in upstream}, {tool.span_id})
+        self.assertTrue(all(s.trace_id == root.trace_id for s in trace))
+        self.assertTrue(all(s.end_ns is not None for s in trace))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import unittest
+import httpx
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from ..app import app
+from ..config import config
+from ..models.schemas import CurrentUser
+from ..services.helper import get_current_user
+from ..services.http_client import set_http_client
+from ..services.weather_service import geocode_cache, observation_cache
+
+
+class TestWeatherBatch(unittest.TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        observation_cache.clear()
+        self.active = 0
+        self.peak = 0
+        self.requests = []
+
+        async def handler(request: httpx.Request):
+            self.requests.append(request)
+            if str(request.url).startswith(config.OWM_URL):
+                name = request.url.params["q"]
+                if name == "Atlantis":
+                    return httpx.Response(200, json=[])
+                lat = len(self.requests)  # a distinct place per name, so lookups are not coalesced
+                return httpx.Response(200, json=[{"name": name, "lat": lat, "lon": lat}])
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            return httpx.Response(200, json={"weather": [{"description": "clear sky"}],
+                                             "main": {"temp": 20.0, "humidity": 40}, "wind": {"speed": 3.0}})
+
+        set_http_client(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        principal = CurrentUser(id="batch-user", email="batch@example.com", username="batch", is_verified=True)
+        app.dependency_overrides[get_current_user] = lambda: principal
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        app.dependency_overrides.clear()
+        set_http_client(None)
+
+    def batch(self, body: dict) -> list:
+        response = self.client.post("/weather/batch", json=body)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+
+    def test_names_coordinates_and_errors(self):
+        lines = self.batch({"locations": ["Berlin", {"lat": 48.1, "lon": 11.6}, "Atlantis"], "units": "F"})
+        self.assertEqual(lines[0]["name"], "Berlin")
+        self.assertEqual(lines[0]["temp"], 68.0)
+        self.assertEqual((lines[1]["lat"], lines[1]["lon"]), (48.1, 11.6))
+        self.assertEqual((lines[2]["status"], lines[2]["error"]), (404, "Location not found"))
+
+    def test_fan_out_is_bounded_and_cached(self):
+        locations = [f"City{i}" for i in range(30)]
+        with patch.object(config, "WEATHER_BATCH_CONCURRENCY", 5):
+            lines = self.batch({"locations": locations})
+        self.assertEqual([line["query"] for line in lines], locations)
+        self.assertLessEqual(self.peak, 5)
+        self.assertGreater(self.peak, 1)
+
+        fetched = len(self.requests)
+        self.batch({"locations": locations[:10]})
+        self.assertEqual(len(self.requests), fetched)
+
+    def test_entry_needs_a_location_or_coordinates(self):
+        response = self.client.post("/weather/batch", json={"locations": [{"lat": 1.0}]})
+        self.assertEqual(response.status_code, 422)
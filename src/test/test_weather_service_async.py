@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+import httpx
+from unittest.mock import patch
+from ..config import config, SessionLocal
+from ..models.users import GeocodeEntry
+from ..models.migrations import run_migrations
+from ..services import weather_service_async as service
+from ..services.http_client import set_http_client
+from ..services.weather_service import geocode_cache, observation_cache
+
+
+def setUpModule():
+    run_migrations()
+
+
+class TestAsyncWeatherService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        observation_cache.clear()
+        self.requests = []
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        set_http_client(None)
+
+    def use_transport(self, handler):
+        def record(request: httpx.Request):
+            self.requests.append(request)
+            return handler(request)
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(record))
+        set_http_client(self.client)
+
+    async def test_get_weather_reuses_cached_geocode(self):
+        def handler(request):
+            if str(request.url).startswith(config.OWM_URL):
+                return httpx.Response(200, json=[{"name": "Berlin", "lat": 52.52, "lon": 13.405}])
+            return httpx.Response(200, json={"weather": [{"description": "light rain"}], "main": {"temp": 9.6}})
+        self.use_transport(handler)
+
+        first = await service.get_weather("Berlin", "C")
+        second = await service.get_weather("Berlin", "C")
+        self.assertEqual(first[0]["weather"], "Berlin: Light rain, 10C")
+        self.assertEqual(second, first)
+        self.assertEqual(sum(str(r.url).startswith(config.OWM_URL) for r in self.requests), 1)
+
+    async def test_upstream_error_is_raised(self):
+        self.use_transport(lambda request: httpx.Response(502))
+        with self.assertRaises(httpx.HTTPStatusError):
+            await service.geocode("Berlin")
+
+    async def test_units_share_one_metric_observation(self):
+        def handler(request):
+            if str(request.url).startswith(config.OWM_URL):
+                return httpx.Response(200, json=[{"name": "Berlin", "lat": 52.52, "lon": 13.405}])
+            self.assertEqual(request.url.params["units"], "metric")
+            return httpx.Response(200, json={"weather": [{"description": "clear sky"}], "main": {"temp": 20.0}})
+        self.use_transport(handler)
+
+        celsius = await service.get_weather("Berlin", "C")
+        fahrenheit = await service.get_weather("Berlin", "F")
+        self.assertEqual(celsius[0]["weather"], "Berlin: Clear sky, 20C")
+        self.assertEqual(fahrenheit[0]["weather"], "Berlin: Clear sky, 68F")
+        self.assertEqual(sum(str(r.url).startswith(config.OWM_CURRENT) for r in self.requests), 1)
+
+    async def test_concurrent_misses_share_one_request(self):
+        release = asyncio.Event()
+
+        async def slow_json(url, params, endpoint):
+            self.requests.append(url)
+            await release.wait()
+            return {"weather": [{"description": "storm"}], "main": {"temp": 12.0}}
+
+        self.client = httpx.AsyncClient()
+        geocode_cache.set("berlin", {"name": "Berlin", "lat": 52.52, "lon": 13.405})
+        with patch('src.services.weather_service_async._get_json', side_effect=slow_json):
+            tasks = [asyncio.create_task(service.get_weather("Berlin", "C")) for _ in range(20)]
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(*tasks)
+        self.assertEqual(len(self.requests), 1)
+        self.assertTrue(all(r[0]["weather"] == "Berlin: Storm, 12C" for r in results))
+
+    async def test_persistent_store_uses_the_async_session(self):
+        db = SessionLocal()
+        db.query(GeocodeEntry).delete()
+        db.commit()
+        db.close()
+        self.use_transport(lambda request: httpx.Response(200, json=[{"name": "Suhl", "lat": 50.61, "lon": 10.69}]))
+        with patch.object(config, "GEOCODE_CACHE_PERSIST", True), \
+                patch('src.services.weather_service.SessionLocal', side_effect=AssertionError("blocking session")):
+            await service.geocode("Suhl")
+            geocode_cache.clear()  # simulate a restart
+            result = await service.geocode("Suhl")
+        self.assertEqual(result["lon"], 10.69)
+        self.assertEqual(len(self.requests), 1)